@@ -26,8 +26,18 @@ document.addEventListener("DOMContentLoaded", () => {
     document.getElementById("headerNome").innerText = usuarioLogado.nome;
   }
 
+  // Exportação em lote só para quem aprova
+  if (usuarioLogado.role !== "user") {
+    ["btnExportarZip", "btnRelatorio"].forEach((id) => {
+      const btn = document.getElementById(id);
+      if (btn) btn.style.display = "";
+    });
+  }
+
   // D. Carregar Dados
   carregarSolicitacoes();
+  atualizarStats();
+  conectarEventos();
 });
 
 //FUNÇÕES GERAIS
@@ -48,16 +58,25 @@ function fazerLogout() {
   window.location.href = "index.html";
 }
 
-async function carregarSolicitacoes() {
+// A API devolve páginas ({ results, next }); "proximaPagina" guarda o cursor seguinte
+let solicitacoesCarregadas = [];
+let proximaPagina = null;
+
+async function carregarSolicitacoes(url = `${API_URL}solicitacoes/`) {
   try {
-    const response = await fetch(`${API_URL}solicitacoes/`, {
+    const response = await fetch(url, {
       headers: { Authorization: `Token ${usuarioLogado.token}` },
     });
 
     if (response.ok) {
-      const lista = await response.json();
-      renderizarLista(lista);
-      atualizarStats(lista);
+      const pagina = await response.json();
+      // Primeira página substitui a lista; as seguintes ("Carregar mais") acumulam
+      if (url === `${API_URL}solicitacoes/`) solicitacoesCarregadas = [];
+      solicitacoesCarregadas = solicitacoesCarregadas.concat(pagina.results);
+      proximaPagina = pagina.next;
+
+      renderizarLista(solicitacoesCarregadas);
+      atualizarBotaoCarregarMais();
     } else {
       document.getElementById("listaSolicitacoes").innerHTML =
         '<p style="text-align:center; padding:20px; color:red">Erro ao carregar dados.</p>';
@@ -69,28 +88,71 @@ async function carregarSolicitacoes() {
   }
 }
 
-function atualizarStats(lista) {
+function carregarMais() {
+  if (proximaPagina) carregarSolicitacoes(proximaPagina);
+}
+
+function atualizarBotaoCarregarMais() {
+  const btn = document.getElementById("btnCarregarMais");
+  if (btn) btn.style.display = proximaPagina ? "inline-flex" : "none";
+}
+
+// Contagens vêm prontas do servidor (/solicitacoes/stats/), sem depender da página carregada
+async function atualizarStats() {
   // IDs do seu HTML: countAnalise, countAprovados, countCancelados
   const analiseEl = document.getElementById("countAnalise");
   const aprovadosEl = document.getElementById("countAprovados");
   const canceladosEl = document.getElementById("countCancelados");
+  if (!analiseEl || !aprovadosEl || !canceladosEl) return;
 
-  if (analiseEl && aprovadosEl && canceladosEl) {
-    const pendentes = lista.filter((i) => i.status.includes("PENDENTE")).length;
-    const aprovados = lista.filter((i) => i.status === "APROVADO").length;
-    const cancelados = lista.filter((i) => i.status === "INDEFERIDO").length;
+  try {
+    const response = await fetch(`${API_URL}solicitacoes/stats/`, {
+      headers: { Authorization: `Token ${usuarioLogado.token}` },
+    });
+    if (!response.ok) return;
+    const stats = await response.json();
 
-    analiseEl.innerText = pendentes;
-    aprovadosEl.innerText = aprovados;
-    canceladosEl.innerText = cancelados;
+    analiseEl.innerText = stats.pendentes;
+    aprovadosEl.innerText = stats.aprovados;
+    canceladosEl.innerText = stats.indeferidos;
+  } catch (error) {
+    console.error("Erro ao carregar contadores:", error);
   }
 }
 
+// Atualizações em tempo real (SSE): o servidor avisa quando uma solicitação da
+// nossa jurisdição é criada/aprovada/reprovada, sem precisar recarregar a lista
+function conectarEventos() {
+  if (!window.EventSource) return;
+  const eventos = new EventSource(
+    `${API_URL}solicitacoes/eventos/?token=${encodeURIComponent(usuarioLogado.token)}`
+  );
+
+  eventos.addEventListener("solicitacao", (evento) => {
+    const pedido = JSON.parse(evento.data);
+    const indice = solicitacoesCarregadas.findIndex((s) => s.id === pedido.id);
+    if (indice >= 0) {
+      solicitacoesCarregadas[indice] = pedido;
+    } else if (!solicitacoesCarregadas.length || pedido.id > solicitacoesCarregadas[0].id) {
+      solicitacoesCarregadas.unshift(pedido);
+    }
+    renderizarLista(solicitacoesCarregadas);
+    atualizarStats();
+  });
+
+  // O servidor pede recarga quando ficamos para trás (muitos eventos perdidos)
+  eventos.addEventListener("recarregar", () => {
+    carregarSolicitacoes();
+    atualizarStats();
+  });
+}
+
 function renderizarLista(lista) {
   const container = document.getElementById("listaSolicitacoes"); // Seu ID correto
   if (!container) return;
 
   container.innerHTML = ""; // Limpa o "Carregando..."
+  atualizarBarraLote();
 
   if (lista.length === 0) {
     container.innerHTML =
@@ -132,6 +194,7 @@ function renderizarLista(lista) {
    `;
 
     const role = usuarioLogado.role;
+    let caixaLote = "";
 
     // Botões de Chefia (Aprovar/Reprovar)
     if (
@@ -139,6 +202,10 @@ function renderizarLista(lista) {
       (role === "coordinator" && pedido.status === "PENDENTE_COORD") ||
       (role === "admin" && pedido.status === "PENDENTE_ADMIN")
     ) {
+      caixaLote = `
+           <input type="checkbox" class="selecao-lote" value="${pedido.id}"
+                  onchange="atualizarBarraLote()" title="Selecionar para ação em lote">
+       `;
       botoesAcao += `
            <button onclick="aprovarSolicitacao(${pedido.id})" class="btn-icon-small approve" title="Aprovar">
                <i class="fa-solid fa-check"></i>
@@ -176,6 +243,7 @@ function renderizarLista(lista) {
 
     item.innerHTML = `
             <div style="display:flex; align-items:center; gap:15px;">
+                ${caixaLote}
                 <div style="font-size:1.2rem; color:var(--text-secondary); width:40px; text-align:center;">
                     <i class="fa-solid ${iconClass}"></i>
                 </div>
@@ -225,6 +293,7 @@ async function callApi(id, action) {
     if (response.ok) {
       alert("Sucesso!");
       carregarSolicitacoes();
+      atualizarStats();
     } else {
       alert("Erro ao processar.");
     }
@@ -233,6 +302,146 @@ async function callApi(id, action) {
   }
 }
 
+// AÇÕES EM LOTE (uma requisição para todos os selecionados)
+function idsSelecionados() {
+  return Array.from(document.querySelectorAll(".selecao-lote:checked")).map(
+    (caixa) => Number(caixa.value),
+  );
+}
+
+function atualizarBarraLote() {
+  const barra = document.getElementById("barraLote");
+  if (!barra) return;
+  const total = idsSelecionados().length;
+  barra.style.display = total > 0 ? "flex" : "none";
+  document.getElementById("contadorLote").innerText =
+    `${total} selecionada(s)`;
+}
+
+async function acaoEmLote(acao) {
+  const ids = idsSelecionados();
+  if (ids.length === 0) return;
+  const verbo = acao === "aprovar" ? "aprovação" : "reprovação";
+  if (!confirm(`Confirmar ${verbo} de ${ids.length} solicitação(ões)?`)) return;
+
+  try {
+    const response = await fetch(`${API_URL}solicitacoes/bulk-transition/`, {
+      method: "POST",
+      headers: {
+        Authorization: `Token ${usuarioLogado.token}`,
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify({ ids, acao }),
+    });
+    const dados = await response.json();
+    if (response.ok) {
+      let mensagem = `${dados.sucesso} processada(s) com sucesso.`;
+      if (dados.falhas > 0) {
+        mensagem += `\n${dados.falhas} não processada(s):`;
+        dados.resultados
+          .filter((r) => r.codigo !== 200)
+          .forEach((r) => (mensagem += `\n#${r.id}: ${r.erro}`));
+      }
+      alert(mensagem);
+    } else {
+      alert(dados.erro || "Erro ao processar.");
+    }
+    carregarSolicitacoes();
+    atualizarStats();
+  } catch (e) {
+    console.error(e);
+  }
+}
+
+// EXPORTAÇÕES DO MÊS (ZIP de PDFs aprovados / relatório consolidado)
+function pedirPeriodoDoMes() {
+  const hoje = new Date();
+  const sugestao = `${hoje.getFullYear()}-${String(hoje.getMonth() + 1).padStart(2, "0")}`;
+  const mes = prompt("Mês de início das dispensas (AAAA-MM):", sugestao);
+  if (!mes) return null;
+  if (!/^\d{4}-\d{2}$/.test(mes)) {
+    alert("Use o formato AAAA-MM.");
+    return null;
+  }
+
+  const [ano, numeroMes] = mes.split("-").map(Number);
+  const ultimoDia = new Date(ano, numeroMes, 0).getDate();
+  return {
+    mes,
+    params: new URLSearchParams({
+      data_inicio_de: `${mes}-01`,
+      data_inicio_ate: `${mes}-${String(ultimoDia).padStart(2, "0")}`,
+    }),
+  };
+}
+
+async function baixarArquivo(url, nomeArquivo, btnId) {
+  const btn = document.getElementById(btnId);
+  const textoOriginal = btn.innerHTML;
+  btn.innerHTML = '<i class="fa-solid fa-spinner fa-spin"></i> Gerando...';
+  btn.disabled = true;
+  try {
+    const response = await fetch(url, {
+      headers: { Authorization: `Token ${usuarioLogado.token}` },
+    });
+    if (!response.ok) {
+      const dados = await response.json().catch(() => ({}));
+      alert(dados.erro || "Erro ao gerar o arquivo.");
+      return;
+    }
+    const link = document.createElement("a");
+    link.href = URL.createObjectURL(await response.blob());
+    link.download = nomeArquivo;
+    link.click();
+    URL.revokeObjectURL(link.href);
+  } catch (e) {
+    console.error(e);
+  } finally {
+    btn.innerHTML = textoOriginal;
+    btn.disabled = false;
+  }
+}
+
+async function exportarZip() {
+  const periodo = pedirPeriodoDoMes();
+  if (!periodo) return;
+  baixarArquivo(
+    `${API_URL}solicitacoes/export-zip/?${periodo.params}`,
+    `dispensas_${periodo.mes}.zip`,
+    "btnExportarZip",
+  );
+}
+
+async function gerarRelatorio() {
+  const periodo = pedirPeriodoDoMes();
+  if (!periodo) return;
+  baixarArquivo(
+    `${API_URL}solicitacoes/relatorio/?${periodo.params}`,
+    `relatorio_dispensas_${periodo.mes}.pdf`,
+    "btnRelatorio",
+  );
+}
+
+// Miniatura do anexo (imagem reduzida / 1ª página do PDF) sem baixar o arquivo
+async function carregarPreviaAnexo(pedido) {
+  const img = document.getElementById("previaAnexo");
+  if (!img) return;
+  // ?v = arquivo atual: a resposta é imutável e fica no cache do navegador
+  const versao = encodeURIComponent(pedido.anexo.split("/").pop());
+  try {
+    const response = await fetch(
+      `${API_URL}solicitacoes/${pedido.id}/anexo-preview/?v=${versao}`,
+      { headers: { Authorization: `Token ${usuarioLogado.token}` } },
+    );
+    if (!response.ok) return; // Tipo sem miniatura: fica só o link
+    img.onload = () => URL.revokeObjectURL(img.src);
+    img.src = URL.createObjectURL(await response.blob());
+    img.style.display = "block";
+  } catch (e) {
+    console.error(e);
+  }
+}
+
 async function verDetalhes(id) {
   const modal = document.getElementById("modalDetalhes");
   const container = document.getElementById("detalhesPedido");
@@ -274,6 +483,16 @@ async function verDetalhes(id) {
         htmlAnexo = `
             <div class="info-item" style="margin-top: 20px; padding-top: 15px; border-top: 1px dashed var(--border-color);">
                 <label style="margin-bottom:8px; display:block;">Comprovante / Anexo</label>
+                <img id="previaAnexo" alt="Pré-visualização do anexo" title="Abrir anexo"
+                    onclick="window.open('${pedido.anexo}', '_blank')" style="
+                    display: none;
+                    max-width: 240px;
+                    max-height: 240px;
+                    margin-bottom: 10px;
+                    border-radius: 8px;
+                    border: 1px solid var(--border-color);
+                    cursor: pointer;
+                ">
                 <a href="${pedido.anexo}" target="_blank" style="
                     display: inline-flex;
                     align-items: center;
@@ -382,6 +601,7 @@ async function verDetalhes(id) {
                 </button>
             </div>
         `;
+    if (pedido.anexo) carregarPreviaAnexo(pedido);
   } catch (erro) {
     console.error(erro);
     container.innerHTML = '<div style="padding:20px; text-align:center; color:red;">Erro ao carregar detalhes.</div>';
@@ -25,7 +25,15 @@ document.addEventListener("DOMContentLoaded", () => {
     }
 
     // D. Carregar Dados
-    carregarHistorico();
+    aplicarFiltros();
+
+    // E. Filtros: a busca por texto espera o usuário parar de digitar
+    document.getElementById("buscaTexto").addEventListener("input", () => {
+        clearTimeout(esperaBusca);
+        esperaBusca = setTimeout(aplicarFiltros, ATRASO_BUSCA_MS);
+    });
+    document.getElementById("buscaStatus").addEventListener("change", aplicarFiltros);
+    document.getElementById("ordenacao").addEventListener("change", aplicarFiltros);
 });
 
 // --- 2. FUNÇÕES GERAIS ---
@@ -57,17 +65,34 @@ function formatarData(dataString) {
 }
 
 // --- 3. CARREGAR DADOS ---
-async function carregarHistorico() {
+// A API devolve páginas ({ results, next }); "proximaPagina" guarda o cursor seguinte
+let proximaPagina = null;
+// Requisição em andamento: uma busca nova cancela a anterior, para uma
+// resposta atrasada não sobrescrever a tabela com filtros antigos
+let requisicaoAtual = null;
+
+async function carregarHistorico(url = `${API_URL}solicitacoes/`, primeiraPagina = true) {
     const tbody = document.getElementById("tabelaHistorico");
-    tbody.innerHTML = '<tr><td colspan="6" style="text-align:center"><i class="fa-solid fa-spinner fa-spin"></i> Carregando...</td></tr>';
+    if (primeiraPagina) {
+        tbody.innerHTML = '<tr><td colspan="6" style="text-align:center"><i class="fa-solid fa-spinner fa-spin"></i> Carregando...</td></tr>';
+        // O cursor da busca anterior não vale para os filtros novos
+        proximaPagina = null;
+        const btnMais = document.getElementById("btnCarregarMais");
+        if (btnMais) btnMais.style.display = "none";
+    }
+
+    if (requisicaoAtual) requisicaoAtual.abort();
+    const controle = new AbortController();
+    requisicaoAtual = controle;
 
     try {
-        const response = await fetch(`${API_URL}solicitacoes/`, {
+        const response = await fetch(url, {
             method: "GET",
             headers: {
                 "Content-Type": "application/json",
                 "Authorization": `Token ${usuarioLogado.token}`
             },
+            signal: controle.signal,
         });
 
         if (!response.ok) {
@@ -78,44 +103,46 @@ async function carregarHistorico() {
             throw new Error("Erro de conexão");
         }
 
-        todosPedidos = await response.json();
-        aplicarFiltros(); // Renderiza a tabela inicial
+        const pagina = await response.json();
+        todosPedidos = primeiraPagina ? pagina.results : todosPedidos.concat(pagina.results);
+        proximaPagina = pagina.next;
+
+        const btnMais = document.getElementById("btnCarregarMais");
+        if (btnMais) btnMais.style.display = proximaPagina ? "inline-block" : "none";
+
+        renderizarTabela(todosPedidos);
 
     } catch (error) {
+        if (error.name === "AbortError") return; // Substituída por uma busca mais nova
         console.error(error);
         tbody.innerHTML = '<tr><td colspan="6" style="color:var(--danger-color); text-align:center">Erro ao carregar dados.</td></tr>';
+    } finally {
+        if (requisicaoAtual === controle) requisicaoAtual = null;
     }
 }
 
+function carregarMais() {
+    if (proximaPagina) carregarHistorico(proximaPagina, false);
+}
+
 // --- 4. FILTROS E RENDERIZAÇÃO ---
+// Os filtros e a ordenação rodam no servidor (query string da API)
+const ATRASO_BUSCA_MS = 300;
+let esperaBusca = null;
+
 function aplicarFiltros() {
-    const texto = document.getElementById("buscaTexto").value.toLowerCase();
+    clearTimeout(esperaBusca);
+    const texto = document.getElementById("buscaTexto").value.trim();
     const statusFiltro = document.getElementById("buscaStatus").value;
     const ordem = document.getElementById("ordenacao").value;
 
-    // Filtra
-    let listaFiltrada = todosPedidos.filter((pedido) => {
-        const nomeUser = pedido.usuario_dados?.first_name?.toLowerCase() || "";
-        const matricula = pedido.matricula?.toLowerCase() || "";
-        const matchTexto = nomeUser.includes(texto) || matricula.includes(texto);
-
-        let matchStatus = true;
-        if (statusFiltro) {
-            if (statusFiltro === "PENDENTE") matchStatus = pedido.status.includes("PENDENTE");
-            else matchStatus = pedido.status === statusFiltro;
-        }
-
-        return matchTexto && matchStatus;
-    });
-
-    // Ordena
-    listaFiltrada.sort((a, b) => {
-        const idA = a.id;
-        const idB = b.id;
-        return ordem === "recente" ? idB - idA : idA - idB;
-    });
+    const params = new URLSearchParams();
+    if (texto) params.set("busca", texto);
+    if (statusFiltro === "PENDENTE") params.set("status_grupo", "PENDENTE");
+    else if (statusFiltro) params.set("status", statusFiltro);
+    params.set("ordering", ordem === "recente" ? "-id" : "id");
 
-    renderizarTabela(listaFiltrada);
+    carregarHistorico(`${API_URL}solicitacoes/?${params.toString()}`);
 }
 function renderizarTabela(lista) {
     const tbody = document.getElementById("tabelaHistorico");
@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+O stream de eventos (/api/solicitacoes/eventos/) é uma view assíncrona e só
+funciona servido por aqui, por exemplo:
+
+    gunicorn core.asgi:application -k uvicorn.workers.UvicornWorker
 """
 
 import os
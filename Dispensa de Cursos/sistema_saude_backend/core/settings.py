@@ -19,6 +19,7 @@ INSTALLED_APPS = [
     "rest_framework",
     "corsheaders",
     "dispensas",
+    "tarefas",
 ]
 
 MIDDLEWARE = [
@@ -82,10 +83,54 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # --- CONFIGURAÇÃO DO REST FRAMEWORK (PARA LER TOKENS) ---
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        # TokenAuthentication com cache do usuário em memória (dispensas/authentication.py)
+        "dispensas.authentication.CachedTokenAuthentication",
         "rest_framework.authentication.SessionAuthentication",  # Mantém o admin funcionando
     ],
 }
+# Validade (s) do usuário em cache por token; cobre o atraso entre workers
+TOKEN_CACHE_TTL = 60
+# Idem para os papéis (gerente/coordenador) em cache por usuário
+PAPEIS_CACHE_TTL = 60
+
+# --- EVENTOS EM TEMPO REAL (SSE, dispensas/eventos.py) ---
+# Segundos entre as leituras da sequência de alterações (atraso máximo entre workers)
+SSE_INTERVALO_POLLING = 2
+# Duração máxima de uma conexão antes do navegador reconectar
+SSE_DURACAO_MAXIMA = 300
+
+# --- CACHE DE PDFs RENDERIZADOS (dispensas/pdf.py) ---
+# Fora de MEDIA_ROOT: /media/ é servido sem login e os PDFs têm dados pessoais
+PDF_CACHE_DIR = os.path.join(BASE_DIR, "cache", "pdf")
+# Ao passar do limite, apaga os PDFs baixados há mais tempo
+PDF_CACHE_MAXIMO_BYTES = 200 * 1024 * 1024
+# Processos que desenham os PDFs do /export-zip/ (None = um por CPU)
+PDF_EXPORTACAO_PROCESSOS = None
+# PDFs gerados na hora (relatório) ficam em memória até este tamanho; acima, em arquivo temporário
+PDF_SPOOL_MAXIMO = 1024 * 1024
+
+# --- ANEXOS DEDUPLICADOS (dispensas/armazenamento.py) ---
+# Segundos que um arquivo sem referências espera antes de ser apagado
+ANEXOS_CARENCIA_REMOCAO = 3600
+# Otimização no envio (dispensas/otimizacao.py): fotos reduzidas a este lado
+# máximo e recomprimidas em JPEG; guardar também o arquivo original enviado?
+ANEXOS_IMAGEM_LADO_MAXIMO = 2000
+ANEXOS_IMAGEM_QUALIDADE = 82
+ANEXOS_MANTER_ORIGINAL = False
+# Miniaturas dos anexos (dispensas/previa.py): lado máximo em pixels, pasta e
+# limite do cache em disco. Fora de MEDIA_ROOT, como o cache de PDFs: a
+# miniatura só sai pela view, que confere a jurisdição
+ANEXOS_PREVIA_LADO = 480
+PREVIA_CACHE_DIR = os.path.join(BASE_DIR, "cache", "previas")
+PREVIA_CACHE_MAXIMO_BYTES = 100 * 1024 * 1024
+
+# --- FILA DE TAREFAS (app tarefas, worker: python manage.py processar_tarefas) ---
+# Espera antes da 1ª nova tentativa (dobra a cada falha) e teto, em segundos
+TAREFAS_ESPERA_BASE = 10
+TAREFAS_ESPERA_MAXIMA = 3600
+# Dias de histórico das tarefas concluídas e das que falharam de vez
+TAREFAS_MANTER_DIAS = 7
+TAREFAS_MANTER_FALHAS_DIAS = 30
 
 # --- CONFIGURAÇÃO DE E-MAIL (DEV) ---
 # Em produção, usaremos SMTP (Gmail/Outlook).
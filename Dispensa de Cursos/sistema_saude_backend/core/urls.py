@@ -9,10 +9,10 @@ from dispensas.views import (
     RegisterView,
     UserProfileView,
     SetorListView,
-    gerar_pdf_solicitacao,
     ChangePasswordView,
     SolicitarResetSenhaView,
     ConfirmarResetSenhaView,
+    stream_eventos,
 )
 
 router = routers.DefaultRouter()
@@ -20,14 +20,14 @@ router.register(r"solicitacoes", SolicitacaoViewSet, basename="solicitacao")
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    # SSE (antes do router, senão "eventos" seria lido como <pk>)
+    path("api/solicitacoes/eventos/", stream_eventos, name="eventos"),
     path("api/", include(router.urls)),
     # Rotas de Autenticação e Perfil
     path("api/login/", CustomLoginView.as_view(), name="login"),
     path("api/register/", RegisterView.as_view(), name="register"),
     path("api/meus-dados/", UserProfileView.as_view(), name="meus_dados"),
     path("api/setores/", SetorListView.as_view(), name="lista_setores"),
-    # Rota do PDF
-    path("api/solicitacoes/<int:pk>/pdf/", gerar_pdf_solicitacao, name="gerar_pdf"),
     #Rotas de senhas
     path("api/alterar-senha/", ChangePasswordView.as_view(), name="alterar-senha"),
     path('api/recuperar-senha/solicitar/', SolicitarResetSenhaView.as_view(), name='recuperar_solicitar'),
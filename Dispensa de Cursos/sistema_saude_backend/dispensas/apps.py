@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class DispensasConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "dispensas"
+
+    def ready(self):
+        # Registra os signals (índice de jurisdição etc.)
+        from . import signals  # noqa: F401
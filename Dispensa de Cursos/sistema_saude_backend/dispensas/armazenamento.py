@@ -0,0 +1,86 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# ====================================================================
+# ARMAZENAMENTO DEDUPLICADO DOS ANEXOS (ENDEREÇADO PELO CONTEÚDO)
+# O envio é gravado num temporário da própria pasta enquanto o SHA-256 é
+# calculado, pedaço a pedaço; o nome final é o hash. Se o mesmo conteúdo já
+# existe, o temporário é descartado e a solicitação aponta para o arquivo
+# que já está no disco. As referências ficam em ArquivoAnexo (signals).
+# Os arquivos são espalhados em subpastas pelos primeiros caracteres do hash
+# (anexos/ab/cd/abcd...pdf), para nenhuma pasta crescer sem limite.
+# ====================================================================
+
+TAMANHO_MAXIMO_EXTENSAO = 10
+# Níveis de subpasta e caracteres do hash por nível: 2 x 2 = 65.536 pastas
+NIVEIS_SUBPASTA = 2
+CARACTERES_POR_NIVEL = 2
+
+
+def nome_do_conteudo(pasta, digest, extensao):
+    """anexos + abcdef... + .pdf -> anexos/ab/cd/abcdef....pdf"""
+    subpastas = [
+        digest[i * CARACTERES_POR_NIVEL : (i + 1) * CARACTERES_POR_NIVEL]
+        for i in range(NIVEIS_SUBPASTA)
+    ]
+    return posixpath.join(pasta, *subpastas, digest + extensao)
+
+
+def no_layout_atual(nome):
+    """Se o nome já segue o layout endereçado pelo conteúdo, em subpastas"""
+    partes = nome.split("/")
+    if len(partes) < NIVEIS_SUBPASTA + 2:
+        return False
+    digest, extensao = posixpath.splitext(partes[-1])
+    if not re.fullmatch(r"[0-9a-f]{64}", digest):
+        return False
+    raiz = "/".join(partes[: -NIVEIS_SUBPASTA - 1])
+    return nome == nome_do_conteudo(raiz, digest, extensao)
+
+
+@deconstructible
+class ArmazenamentoDeduplicado(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # Sem sufixo aleatório: o nome definitivo sai do conteúdo em _save()
+        return name
+
+    def _save(self, name, content):
+        pasta, original = posixpath.split(name)
+        extensao = os.path.splitext(original)[1].lower()[:TAMANHO_MAXIMO_EXTENSAO]
+        pasta_absoluta = self.path(pasta)
+        os.makedirs(pasta_absoluta, exist_ok=True)
+
+        descritor, temporario = tempfile.mkstemp(dir=pasta_absoluta, prefix=".envio-")
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(descritor, "wb") as arquivo:
+                for pedaco in content.chunks():
+                    digest.update(pedaco)
+                    arquivo.write(pedaco)
+
+            nome = nome_do_conteudo(pasta, digest.hexdigest(), extensao)
+            caminho = self.path(nome)
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            if os.path.exists(caminho):
+                # Conteúdo repetido: renova o mtime, que protege o arquivo da
+                # remoção de órfãos enquanto a nova referência não é gravada
+                os.utime(caminho)
+                os.remove(temporario)
+            else:
+                if self.file_permissions_mode is not None:
+                    os.chmod(temporario, self.file_permissions_mode)
+                os.replace(temporario, caminho)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+        return nome
+
+
+armazenamento_anexos = ArmazenamentoDeduplicado()
@@ -0,0 +1,36 @@
+import copy
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import CacheLRU
+
+# token -> (usuário, token). Invalidado pelos signals (token apagado, usuário
+# salvo: troca de senha, desativação...); o TTL cobre os outros workers e
+# alterações feitas com .update(), que não disparam signals.
+tokens_em_cache = CacheLRU(
+    maximo=getattr(settings, "TOKEN_CACHE_MAXIMO", 2048),
+    ttl=getattr(settings, "TOKEN_CACHE_TTL", 60),
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication do DRF sem o JOIN authtoken_token + auth_user a cada
+    requisição: o usuário do token fica no cache do processo.
+    """
+
+    def authenticate_credentials(self, key):
+        em_cache = tokens_em_cache.obter(key)
+        if em_cache is None:
+            # Valida (token existe, usuário ativo) e levanta AuthenticationFailed
+            em_cache = super().authenticate_credentials(key)
+            tokens_em_cache.guardar(key, em_cache)
+        usuario, token = em_cache
+        # Cópia por requisição: a view pode alterar o objeto (ou o cache de
+        # relacionamentos dele) sem vazar para as próximas requisições
+        return copy.copy(usuario), token
+
+
+def invalidar_usuario(usuario_id):
+    tokens_em_cache.remover_onde(lambda chave, valor: valor[0].pk == usuario_id)
@@ -0,0 +1,97 @@
+import re
+
+# Tabela FTS5 criada na migração 0009_solicitacao_fts
+TABELA_FTS = "dispensas_solicitacao_fts"
+
+# Triggers que mantêm o índice FTS sincronizado com dispensas_solicitacao e
+# com o nome do servidor (auth_user). Usados pelas migrações: a 0009 cria, e
+# as que recriam a tabela no SQLite (AddField/AlterField descartam os
+# triggers) tiram antes e põem de volta depois.
+CRIAR_TRIGGERS_FTS = [
+    """
+    CREATE TRIGGER dispensas_solicitacao_fts_ai
+    AFTER INSERT ON dispensas_solicitacao
+    BEGIN
+        INSERT INTO dispensas_solicitacao_fts
+            (rowid, nome_evento, objetivo, cidade, matricula, nome_servidor)
+        VALUES (
+            new.id, new.nome_evento, new.objetivo, new.cidade, new.matricula,
+            (SELECT first_name FROM auth_user WHERE id = new.usuario_id)
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER dispensas_solicitacao_fts_au
+    AFTER UPDATE OF nome_evento, objetivo, cidade, matricula, usuario_id
+    ON dispensas_solicitacao
+    BEGIN
+        DELETE FROM dispensas_solicitacao_fts WHERE rowid = old.id;
+        INSERT INTO dispensas_solicitacao_fts
+            (rowid, nome_evento, objetivo, cidade, matricula, nome_servidor)
+        VALUES (
+            new.id, new.nome_evento, new.objetivo, new.cidade, new.matricula,
+            (SELECT first_name FROM auth_user WHERE id = new.usuario_id)
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER dispensas_solicitacao_fts_ad
+    AFTER DELETE ON dispensas_solicitacao
+    BEGIN
+        DELETE FROM dispensas_solicitacao_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER dispensas_solicitacao_fts_usuario_au
+    AFTER UPDATE OF first_name ON auth_user
+    BEGIN
+        UPDATE dispensas_solicitacao_fts SET nome_servidor = new.first_name
+        WHERE rowid IN (
+            SELECT id FROM dispensas_solicitacao WHERE usuario_id = new.id
+        );
+    END
+    """,
+]
+
+REMOVER_TRIGGERS_FTS = [
+    "DROP TRIGGER IF EXISTS dispensas_solicitacao_fts_usuario_au",
+    "DROP TRIGGER IF EXISTS dispensas_solicitacao_fts_ad",
+    "DROP TRIGGER IF EXISTS dispensas_solicitacao_fts_au",
+    "DROP TRIGGER IF EXISTS dispensas_solicitacao_fts_ai",
+]
+
+# Pesos do bm25 por coluna: nome_evento, objetivo, cidade, matricula, nome_servidor
+PESOS_BM25 = "10.0, 1.0, 2.0, 5.0, 5.0"
+
+
+def expressao_fts(texto):
+    """
+    Converte o texto digitado numa consulta FTS5 segura.
+    Cada palavra vira um termo entre aspas com prefixo (*), todos obrigatórios:
+    "cong sau" -> "cong"* "sau"*  (encontra "Congresso de Saúde").
+    """
+    termos = re.findall(r"\w+", texto or "")
+    return " ".join(f'"{termo}"*' for termo in termos)
+
+
+def buscar_solicitacoes(queryset, texto):
+    """
+    Restringe o queryset às solicitações que casam com o texto no índice FTS5
+    e ordena pela relevância (bm25: quanto menor, mais relevante).
+    Retorna None se o texto não tiver nenhum termo pesquisável.
+    """
+    expressao = expressao_fts(texto)
+    if not expressao:
+        return None
+
+    # JOIN direto com a tabela FTS: o MATCH roda uma vez e o bm25 sai da
+    # mesma varredura (uma subquery correlacionada refaria o MATCH por linha)
+    return queryset.extra(
+        tables=[TABELA_FTS],
+        where=[
+            f"{TABELA_FTS}.rowid = dispensas_solicitacao.id",
+            f"{TABELA_FTS} MATCH %s",
+        ],
+        params=[expressao],
+        select={"relevancia": f"bm25({TABELA_FTS}, {PESOS_BM25})"},
+    ).order_by("relevancia", "-id")
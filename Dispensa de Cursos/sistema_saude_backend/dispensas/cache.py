@@ -0,0 +1,57 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheLRU:
+    """
+    Cache em memória do processo, limitado em tamanho (descarta o item usado
+    há mais tempo) e com validade (TTL, em segundos) por entrada.
+    Seguro entre threads. Cada worker tem o seu: as invalidações valem para o
+    processo atual; nos demais a entrada cai sozinha quando o TTL vence.
+    """
+
+    def __init__(self, maximo=1024, ttl=60):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._trava = threading.Lock()
+
+    def obter(self, chave, padrao=None):
+        with self._trava:
+            item = self._itens.get(chave)
+            if item is None:
+                return padrao
+            expira_em, valor = item
+            if expira_em < time.monotonic():
+                del self._itens[chave]
+                return padrao
+            self._itens.move_to_end(chave)
+            return valor
+
+    def guardar(self, chave, valor):
+        with self._trava:
+            self._itens[chave] = (time.monotonic() + self.ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.maximo:
+                self._itens.popitem(last=False)
+
+    def remover(self, chave):
+        with self._trava:
+            self._itens.pop(chave, None)
+
+    def remover_onde(self, condicao):
+        """Remove as entradas em que condicao(chave, valor) é verdadeira"""
+        with self._trava:
+            for chave in [c for c, (_, v) in self._itens.items() if condicao(c, v)]:
+                del self._itens[chave]
+
+    def limpar(self):
+        with self._trava:
+            self._itens.clear()
+
+    def __len__(self):
+        return len(self._itens)
+
+    def __contains__(self, chave):
+        return self.obter(chave) is not None
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import JurisdicaoUnidade, SequenciaAlteracao, Solicitacao
+from .serializers import SolicitacaoListaSerializer
+
+logger = logging.getLogger(__name__)
+
+# Intervalo (s) entre as leituras da sequência de alterações no SQLite.
+# É o atraso máximo para eventos gravados por OUTRO worker; os do próprio
+# processo acordam o hub na hora (ver notificar()).
+INTERVALO_POLLING = getattr(settings, "SSE_INTERVALO_POLLING", 2)
+
+# Comentário ": ping" para manter a conexão viva atrás de proxies
+INTERVALO_PING = getattr(settings, "SSE_INTERVALO_PING", 15)
+
+# Tempo máximo de uma conexão. O EventSource reconecta sozinho (com
+# Last-Event-ID), e assim conexões de abas fechadas não ficam penduradas.
+DURACAO_MAXIMA = getattr(settings, "SSE_DURACAO_MAXIMA", 300)
+
+# Eventos pendentes por conexão antes de mandar o cliente recarregar a lista
+TAMANHO_FILA = 100
+
+# Linhas lidas por rodada de polling / replay
+LOTE = 500
+
+
+def _ler_alteracoes(desde, ate=None):
+    """Solicitações alteradas em (desde, ate], já no formato da listagem"""
+    close_old_connections()
+    linhas = Solicitacao.objects.filter(seq_alteracao__gt=desde)
+    if ate is not None:
+        linhas = linhas.filter(seq_alteracao__lte=ate)
+    linhas = list(
+        linhas.select_related("usuario")
+        .only("seq_alteracao", *SolicitacaoListaSerializer.CAMPOS_BANCO)
+        .order_by("seq_alteracao")[:LOTE]
+    )
+    dados = SolicitacaoListaSerializer(linhas, many=True).data
+    return [(linha.seq_alteracao, dict(item)) for linha, item in zip(linhas, dados)]
+
+
+class Assinante:
+    """Uma conexão SSE aberta: fila própria + filtro de jurisdição"""
+
+    def __init__(self, usuario_id, superuser, unidades, ultimo_seq):
+        self.usuario_id = usuario_id
+        self.superuser = superuser
+        self.unidades = set(unidades)
+        self.ultimo_seq = ultimo_seq
+        self.fila = asyncio.Queue(maxsize=TAMANHO_FILA)
+        self.atrasado = False
+
+    def enxerga(self, solicitacao):
+        return (
+            self.superuser
+            or solicitacao["usuario"] == self.usuario_id
+            or solicitacao["unidade"] in self.unidades
+        )
+
+    def entregar(self, seq, solicitacao):
+        if seq <= self.ultimo_seq or not self.enxerga(solicitacao):
+            return
+        self.ultimo_seq = seq
+        try:
+            self.fila.put_nowait((seq, solicitacao))
+        except asyncio.QueueFull:
+            # Cliente lento: em vez de acumular memória, pede um recarregamento
+            self.atrasado = True
+
+
+class HubEventos:
+    """
+    Broadcast das alterações de solicitações para as conexões SSE do processo.
+    Uma única tarefa por processo lê a sequência (seq_alteracao) no SQLite e
+    distribui para todos os assinantes, então N abas abertas custam uma
+    consulta por rodada, e não N. Entre workers a comunicação é o próprio
+    banco: cada processo faz o seu polling.
+    """
+
+    def __init__(self):
+        self.assinantes = set()
+        self.ultimo_seq = None
+        self._tarefa = None
+        self._acordar = None
+        self._loop = None
+        self._trava = threading.Lock()
+
+    async def preparar(self):
+        """Garante o estado do hub no event loop atual"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Novo event loop (reinício do servidor/testes): recomeça o estado
+            with self._trava:
+                self._loop = loop
+                self._acordar = asyncio.Event()
+            self._tarefa = None
+            self.ultimo_seq = None
+        if self.ultimo_seq is None:
+            self.ultimo_seq = await sync_to_async(SequenciaAlteracao.atual)()
+
+    def assinar(self, assinante):
+        """
+        Registra o assinante a partir da posição atual do hub (sem await no
+        meio, então nenhum evento escapa entre a leitura e o registro).
+        """
+        assinante.ultimo_seq = self.ultimo_seq
+        self.assinantes.add(assinante)
+        if self._tarefa is None or self._tarefa.done():
+            self._tarefa = self._loop.create_task(self._laco())
+        return self.ultimo_seq
+
+    def cancelar(self, assinante):
+        self.assinantes.discard(assinante)
+        if not self.assinantes and self._acordar is not None:
+            # Último assinante saiu: encerra o polling sem esperar a rodada
+            self._acordar.set()
+
+    def notificar(self):
+        """
+        Acorda o hub imediatamente (chamado no commit de uma alteração,
+        a partir da thread da view síncrona).
+        """
+        with self._trava:
+            loop, acordar = self._loop, self._acordar
+        if loop is not None and acordar is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(acordar.set)
+
+    async def _laco(self):
+        while self.assinantes:
+            try:
+                await asyncio.wait_for(self._acordar.wait(), INTERVALO_POLLING)
+            except asyncio.TimeoutError:
+                pass
+            self._acordar.clear()
+            if not self.assinantes:
+                break
+
+            # Fora do ciclo de uma requisição: roda no pool de threads (cada
+            # thread com a sua conexão), sem disputar a thread das views
+            try:
+                alteracoes = await sync_to_async(
+                    _ler_alteracoes, thread_sensitive=False
+                )(self.ultimo_seq)
+            except Exception:
+                logger.exception("Falha ao ler alterações para o SSE")
+                continue
+
+            for seq, solicitacao in alteracoes:
+                for assinante in list(self.assinantes):
+                    assinante.entregar(seq, solicitacao)
+                self.ultimo_seq = seq
+
+            if len(alteracoes) == LOTE:
+                # Ainda há fila no banco: próxima rodada sem esperar
+                self._acordar.set()
+
+
+hub = HubEventos()
+
+
+def formatar_evento(seq, solicitacao):
+    dados = json.dumps(solicitacao, default=str, ensure_ascii=False)
+    return f"id: {seq}\nevent: solicitacao\ndata: {dados}\n\n"
+
+
+def _unidades_visiveis(usuario):
+    if usuario.is_superuser:
+        return []
+    close_old_connections()
+    return list(
+        JurisdicaoUnidade.objects.filter(usuario=usuario).values_list(
+            "unidade", flat=True
+        )
+    )
+
+
+class FluxoEventos:
+    """
+    Corpo assíncrono da resposta text/event-stream de um usuário.
+    `desde` (Last-Event-ID) reenvia antes o que a aba perdeu enquanto esteve
+    desconectada; os eventos novos ficam na fila enquanto isso.
+
+    O Django chama close() ao terminar a resposta (o gerador interno pode
+    nunca ser finalizado), e é ali que a assinatura sai do hub.
+    """
+
+    def __init__(self, usuario, desde=None):
+        self.usuario = usuario
+        self.desde = desde
+        self.assinante = None
+        self._loop = None
+        self._eventos = self._gerar()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._eventos.__anext__()
+
+    def close(self):
+        # Pode vir de outra thread (o ASGIHandler fecha a resposta via sync_to_async)
+        if self.assinante is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(hub.cancelar, self.assinante)
+
+    async def _gerar(self):
+        unidades = await sync_to_async(_unidades_visiveis)(self.usuario)
+        await hub.preparar()
+        self._loop = asyncio.get_running_loop()
+        assinante = Assinante(self.usuario.pk, self.usuario.is_superuser, unidades, 0)
+        posicao = hub.assinar(assinante)
+        self.assinante = assinante
+
+        fim = self._loop.time() + DURACAO_MAXIMA
+        try:
+            yield "retry: 5000\n\n"
+
+            if self.desde is not None and self.desde < posicao:
+                perdidos = await sync_to_async(_ler_alteracoes)(self.desde, posicao)
+                if len(perdidos) == LOTE:
+                    # Perdeu coisa demais: mais barato recarregar a lista inteira
+                    yield "event: recarregar\ndata: {}\n\n"
+                    return
+                for seq, solicitacao in perdidos:
+                    if assinante.enxerga(solicitacao):
+                        yield formatar_evento(seq, solicitacao)
+
+            while assinante in hub.assinantes and self._loop.time() < fim:
+                if assinante.atrasado:
+                    yield "event: recarregar\ndata: {}\n\n"
+                    return
+                try:
+                    seq, solicitacao = await asyncio.wait_for(
+                        assinante.fila.get(),
+                        min(INTERVALO_PING, fim - self._loop.time()),
+                    )
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield formatar_evento(seq, solicitacao)
+        finally:
+            hub.cancelar(assinante)
@@ -0,0 +1,198 @@
+import logging
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Solicitacao
+from .pdf import pdfs_em_cache, renderizar_pdf
+
+logger = logging.getLogger(__name__)
+
+# ====================================================================
+# EXPORTAÇÃO EM LOTE: ZIP DE PDFs GERADO EM STREAMING
+# Cada PDF vai para o ZIP assim que fica pronto e o pedaço do ZIP é enviado
+# ao cliente na hora: a memória usada não depende de quantos documentos
+# saem. O ReportLab roda num pool de processos (usa CPU e segura o GIL), com
+# no máximo 2 documentos por processo em voo por exportação.
+# As solicitações são lidas em lotes pela lista de ids, cada lote avaliado
+# por inteiro: nenhum cursor fica aberto durante o download (no SQLite, um
+# cursor de leitura aberto trava quem precisa escrever).
+# Sob ASGI o gerador é consumido por pedaços_async(): o StreamingHttpResponse
+# junta um iterador síncrono inteiro na memória antes de enviar.
+# ====================================================================
+
+LOTE_LEITURA = 200
+
+_pool = None
+_trava_pool = threading.Lock()
+
+
+def _processos():
+    return getattr(settings, "PDF_EXPORTACAO_PROCESSOS", None) or os.cpu_count() or 1
+
+
+def _obter_pool():
+    global _pool
+    with _trava_pool:
+        if _pool is None:
+            # spawn: não herda threads (hub SSE) nem conexões
+            # de banco do worker web. Os filhos só desenham, não usam o banco.
+            _pool = ProcessPoolExecutor(
+                max_workers=_processos(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+        return _pool
+
+
+class _SaidaZip:
+    """
+    Destino não-pesquisável para o zipfile: acumula o que foi escrito até o
+    gerador recolher. Sem tell()/seek(), o zipfile grava os tamanhos depois
+    de cada arquivo (data descriptor) e nunca volta atrás.
+    """
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def recolher(self):
+        dados = b"".join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def _pdf(solicitacao):
+    """Bytes do PDF: do cache em disco quando houver, senão None (renderizar)"""
+    caminho = pdfs_em_cache.obter(solicitacao.pk, solicitacao.seq_alteracao)
+    if caminho is None:
+        return None
+    try:
+        with open(caminho, "rb") as arquivo:
+            return arquivo.read()
+    except FileNotFoundError:
+        return None  # Podado entre o obter() e a leitura
+
+
+def solicitacoes_em_lotes(pks, lote=None):
+    """
+    Solicitações `pks` (já com usuario e usuario__profile), na ordem da lista,
+    lidas `lote` a `lote` com uma consulta cada, sem cursor aberto entre elas
+    """
+    lote = lote or LOTE_LEITURA
+    for inicio in range(0, len(pks), lote):
+        trecho = pks[inicio : inicio + lote]
+        solicitacoes = Solicitacao.objects.select_related(
+            "usuario", "usuario__profile"
+        ).in_bulk(trecho)
+        # Removida no meio da exportação: simplesmente fica de fora
+        yield from (solicitacoes[pk] for pk in trecho if pk in solicitacoes)
+
+
+class _Pronto:
+    """Resultado já disponível com a mesma interface de um Future"""
+
+    def __init__(self, valor):
+        self._valor = valor
+
+    def result(self):
+        return self._valor
+
+    def cancel(self):
+        return False
+
+
+def gerar_zip(solicitacoes):
+    """
+    Gerador com os pedaços do ZIP (dispensa_<id>.pdf para cada solicitação).
+    `solicitacoes` deve trazer usuario e usuario__profile (select_related):
+    as instâncias vão prontas para os processos, que não acessam o banco.
+    Use solicitacoes_em_lotes() em vez de um .iterator() do queryset.
+    """
+    saida = _SaidaZip()
+    pool = _obter_pool()
+    janela = 2 * _processos()
+    em_voo = deque()
+    falhas = []
+
+    with zipfile.ZipFile(saida, mode="w", compression=zipfile.ZIP_STORED) as zip_:
+
+        def gravar(solicitacao, dados):
+            # PDF já vem comprimido: ZIP_STORED não gasta CPU à toa
+            info = zipfile.ZipInfo(
+                f"dispensa_{solicitacao.pk}.pdf",
+                date_time=timezone.localtime().timetuple()[:6],
+            )
+            zip_.writestr(info, dados)
+
+        def concluir_primeiro():
+            solicitacao, futuro = em_voo.popleft()
+            try:
+                gravar(solicitacao, futuro.result())
+            except Exception:
+                logger.exception(
+                    "Falha ao exportar o PDF da solicitação %s", solicitacao.pk
+                )
+                falhas.append(solicitacao.pk)
+
+        try:
+            for solicitacao in solicitacoes:
+                dados = _pdf(solicitacao)
+                if dados is None:
+                    em_voo.append(
+                        (solicitacao, pool.submit(renderizar_pdf, solicitacao))
+                    )
+                elif em_voo:
+                    # Mantém a ordem de saída: o acerto de cache espera a vez
+                    em_voo.append((solicitacao, _Pronto(dados)))
+                else:
+                    gravar(solicitacao, dados)
+                if len(em_voo) >= janela:
+                    concluir_primeiro()
+                pedaco = saida.recolher()
+                if pedaco:
+                    yield pedaco
+
+            while em_voo:
+                concluir_primeiro()
+                yield saida.recolher()
+        finally:
+            # Cliente desconectou no meio: descarta o que ainda não começou
+            for _, futuro in em_voo:
+                futuro.cancel()
+
+        if falhas:
+            zip_.writestr(
+                "ERROS.txt",
+                "PDFs não gerados (ids): " + ", ".join(map(str, falhas)) + "\n",
+            )
+
+    yield saida.recolher()
+
+
+async def pedacos_async(pedacos):
+    """
+    Iterador assíncrono sobre um gerador síncrono (gerar_zip): cada pedaço é
+    pedido numa thread via sync_to_async, e o gerador é fechado se o cliente
+    desconectar (cancela o que ainda não começou a renderizar).
+    """
+    proximo = sync_to_async(next)
+    try:
+        while (pedaco := await proximo(pedacos, None)) is not None:
+            yield pedaco
+    finally:
+        await sync_to_async(pedacos.close)()
@@ -0,0 +1,102 @@
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Setor
+
+
+class SolicitacaoFiltro(BaseFilterBackend):
+    """
+    Filtros da lista de solicitações via query string (executados no SQLite):
+      ?status_grupo=PENDENTE         -> qualquer status PENDENTE_*
+      ?status=APROVADO
+      ?unidade=UBS Central
+      ?setor=<id> / ?departamento=<id> -> unidades do setor / do departamento
+      ?data_inicio_de=2026-01-01&data_inicio_ate=2026-01-31
+      ?data_solicitacao_de=...&data_solicitacao_ate=...
+      ?busca=texto                   -> matrícula ou nome do servidor
+    A ordenação (?ordering=) fica com o OrderingFilter do DRF.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        status_grupo = params.get("status_grupo")
+        if status_grupo:
+            queryset = queryset.filter(status__startswith=f"{status_grupo}_")
+
+        status = params.get("status")
+        if status:
+            queryset = queryset.filter(status=status)
+
+        unidade = params.get("unidade")
+        if unidade:
+            queryset = queryset.filter(unidade=unidade)
+
+        # Solicitacao.unidade guarda o nome do Setor
+        setor = self._id(params, "setor")
+        if setor:
+            queryset = queryset.filter(
+                unidade__in=Setor.objects.filter(pk=setor).values("nome")
+            )
+        departamento = self._id(params, "departamento")
+        if departamento:
+            queryset = queryset.filter(
+                unidade__in=Setor.objects.filter(departamento_id=departamento).values(
+                    "nome"
+                )
+            )
+
+        # data_inicio é DateField: compara direto
+        data_de = self._data(params, "data_inicio_de")
+        if data_de:
+            queryset = queryset.filter(data_inicio__gte=data_de)
+        data_ate = self._data(params, "data_inicio_ate")
+        if data_ate:
+            queryset = queryset.filter(data_inicio__lte=data_ate)
+
+        # data_solicitacao é DateTimeField: usa intervalo [início do dia, dia seguinte)
+        # em vez de __date, para o índice continuar sendo usado
+        data_de = self._data(params, "data_solicitacao_de")
+        if data_de:
+            queryset = queryset.filter(data_solicitacao__gte=self._inicio_do_dia(data_de))
+        data_ate = self._data(params, "data_solicitacao_ate")
+        if data_ate:
+            queryset = queryset.filter(
+                data_solicitacao__lt=self._inicio_do_dia(data_ate + timedelta(days=1))
+            )
+
+        busca = params.get("busca", "").strip()
+        if busca:
+            queryset = queryset.filter(
+                Q(matricula__icontains=busca) | Q(usuario__first_name__icontains=busca)
+            )
+
+        return queryset
+
+    def _id(self, params, nome):
+        valor = params.get(nome)
+        if not valor:
+            return None
+        if not valor.isdigit():
+            raise ValidationError({nome: "Informe o id numérico."})
+        return int(valor)
+
+    def _data(self, params, nome):
+        valor = params.get(nome)
+        if not valor:
+            return None
+        try:
+            data = parse_date(valor)
+        except ValueError:
+            data = None
+        if data is None:
+            raise ValidationError({nome: "Data inválida. Use o formato AAAA-MM-DD."})
+        return data
+
+    def _inicio_do_dia(self, data):
+        return timezone.make_aware(datetime.combine(data, time.min))
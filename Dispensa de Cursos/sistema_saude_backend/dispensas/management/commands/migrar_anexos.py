@@ -0,0 +1,76 @@
+import posixpath
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dispensas.armazenamento import no_layout_atual
+from dispensas.models import Solicitacao
+
+
+class Command(BaseCommand):
+    help = (
+        "Move os anexos antigos (pasta única anexos/) para o layout endereçado "
+        "pelo conteúdo em subpastas, em lotes. Pode ser interrompido e rodado "
+        "de novo: continua de onde parou."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lote", type=int, default=200, help="Solicitações por transação"
+        )
+        parser.add_argument(
+            "--simular",
+            action="store_true",
+            help="Só conta o que seria migrado, sem gravar nada",
+        )
+
+    def handle(self, *args, **opcoes):
+        armazenamento = Solicitacao._meta.get_field("anexo").storage
+        migradas = ausentes = 0
+        ultimo_id = 0
+        while True:
+            # Só (id, anexo) para achar o que falta; as já migradas são puladas
+            linhas = list(
+                Solicitacao.objects.filter(pk__gt=ultimo_id)
+                .exclude(anexo="")
+                .exclude(anexo__isnull=True)
+                .order_by("pk")
+                .values_list("pk", "anexo")[: opcoes["lote"]]
+            )
+            if not linhas:
+                break
+            ultimo_id = linhas[-1][0]
+            pendentes = [pk for pk, nome in linhas if not no_layout_atual(nome)]
+            if not pendentes:
+                continue
+
+            if opcoes["simular"]:
+                migradas += len(pendentes)
+                continue
+
+            with transaction.atomic():
+                for solicitacao in Solicitacao.objects.filter(pk__in=pendentes):
+                    antigo = solicitacao.anexo.name
+                    if not armazenamento.exists(antigo):
+                        ausentes += 1
+                        self.stderr.write(f"#{solicitacao.pk}: {antigo} não existe")
+                        continue
+                    with armazenamento.open(antigo) as arquivo:
+                        # Mesmo caminho de um envio novo: hash, subpasta e
+                        # deduplicação pelo armazenamento
+                        solicitacao.anexo.save(
+                            posixpath.basename(antigo), File(arquivo), save=False
+                        )
+                    # save() completo: os signals movem a referência (o arquivo
+                    # antigo sai pela fila) e a versão das listas muda com a URL
+                    solicitacao.save(update_fields=["anexo"])
+                    migradas += 1
+            self.stdout.write(f"Até #{ultimo_id}: {migradas} anexos migrados")
+
+        verbo = "seriam migrados" if opcoes["simular"] else "migrados"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{migradas} anexos {verbo}; {ausentes} arquivos não encontrados."
+            )
+        )
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def popular_jurisdicoes(apps, schema_editor):
+    """Monta o índice para a hierarquia que já existe no banco"""
+    Setor = apps.get_model("dispensas", "Setor")
+    JurisdicaoUnidade = apps.get_model("dispensas", "JurisdicaoUnidade")
+
+    linhas = set(
+        Setor.objects.filter(responsavel__isnull=False).values_list(
+            "responsavel_id", "nome"
+        )
+    )
+    linhas.update(
+        Setor.objects.filter(departamento__responsavel__isnull=False).values_list(
+            "departamento__responsavel_id", "nome"
+        )
+    )
+    JurisdicaoUnidade.objects.bulk_create(
+        [JurisdicaoUnidade(usuario_id=uid, unidade=nome) for uid, nome in linhas]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("dispensas", "0006_solicitacao_anexo"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="JurisdicaoUnidade",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("unidade", models.CharField(max_length=200)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="solicitacao",
+            index=models.Index(
+                fields=["unidade", "-id"], name="solicitacao_unidade_id_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="jurisdicaounidade",
+            name="usuario",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="jurisdicoes",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="jurisdicaounidade",
+            constraint=models.UniqueConstraint(
+                fields=("usuario", "unidade"), name="jurisdicao_usuario_unidade"
+            ),
+        ),
+        migrations.RunPython(popular_jurisdicoes, migrations.RunPython.noop),
+    ]
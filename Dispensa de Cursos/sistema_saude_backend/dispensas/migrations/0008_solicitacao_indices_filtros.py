@@ -0,0 +1,43 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dispensas", "0007_jurisdicaounidade"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="solicitacao",
+            index=models.Index(
+                fields=["status", "-id"], name="solicitacao_status_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="solicitacao",
+            index=models.Index(
+                fields=["usuario", "-id"], name="solicitacao_usuario_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="solicitacao",
+            index=models.Index(
+                fields=["unidade", "status", "-id"], name="solicitacao_unid_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="solicitacao",
+            index=models.Index(
+                fields=["data_inicio", "id"], name="solicitacao_inicio_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="solicitacao",
+            index=models.Index(
+                fields=["data_solicitacao", "id"], name="solicitacao_criacao_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:33
+
+from django.conf import settings
+from django.db import migrations
+
+from dispensas.busca import CRIAR_TRIGGERS_FTS, REMOVER_TRIGGERS_FTS
+
+# Índice FTS5 (SQLite) espelhando os campos pesquisáveis da Solicitacao.
+# rowid = Solicitacao.id; "unicode61 remove_diacritics 2" ignora acentos
+# (ex: "saude" encontra "Saúde"). Triggers (dispensas/busca.py) mantêm o
+# índice sincronizado.
+CRIAR_FTS = [
+    """
+    CREATE VIRTUAL TABLE dispensas_solicitacao_fts USING fts5(
+        nome_evento, objetivo, cidade, matricula, nome_servidor,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO dispensas_solicitacao_fts
+        (rowid, nome_evento, objetivo, cidade, matricula, nome_servidor)
+    SELECT s.id, s.nome_evento, s.objetivo, s.cidade, s.matricula, u.first_name
+    FROM dispensas_solicitacao s
+    JOIN auth_user u ON u.id = s.usuario_id
+    """,
+    *CRIAR_TRIGGERS_FTS,
+]
+
+REMOVER_FTS = [
+    *REMOVER_TRIGGERS_FTS,
+    "DROP TABLE IF EXISTS dispensas_solicitacao_fts",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("dispensas", "0008_solicitacao_indices_filtros"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CRIAR_FTS, REMOVER_FTS),
+    ]
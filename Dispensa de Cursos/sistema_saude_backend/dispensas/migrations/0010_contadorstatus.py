@@ -0,0 +1,52 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:32
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def popular_contadores(apps, schema_editor):
+    """Conta as solicitações já existentes por unidade e status"""
+    Solicitacao = apps.get_model("dispensas", "Solicitacao")
+    ContadorStatus = apps.get_model("dispensas", "ContadorStatus")
+
+    totais = Solicitacao.objects.values("unidade", "status").annotate(total=Count("id"))
+    ContadorStatus.objects.bulk_create(
+        [
+            ContadorStatus(unidade=t["unidade"], status=t["status"], total=t["total"])
+            for t in totais
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dispensas", "0009_solicitacao_fts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ContadorStatus",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("unidade", models.CharField(max_length=100)),
+                ("status", models.CharField(max_length=20)),
+                ("total", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="contadorstatus",
+            constraint=models.UniqueConstraint(
+                fields=("unidade", "status"), name="contador_unidade_status"
+            ),
+        ),
+        migrations.RunPython(popular_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dispensas", "0010_contadorstatus"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VersaoLista",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "escopo",
+                    models.CharField(
+                        choices=[
+                            ("TODAS", "Todas as solicitações"),
+                            ("UNIDADE", "Unidade"),
+                            ("USUARIO", "Usuário"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("chave", models.CharField(blank=True, default="", max_length=200)),
+                ("versao", models.PositiveBigIntegerField(default=0)),
+                ("atualizado_em", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="versaolista",
+            constraint=models.UniqueConstraint(
+                fields=("escopo", "chave"), name="versao_lista_escopo_chave"
+            ),
+        ),
+    ]
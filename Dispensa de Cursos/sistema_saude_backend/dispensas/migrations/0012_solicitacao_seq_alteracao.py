@@ -0,0 +1,24 @@
+# Generated by Django 4.2.27 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+from dispensas.busca import CRIAR_TRIGGERS_FTS, REMOVER_TRIGGERS_FTS
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dispensas", "0011_versaolista"),
+    ]
+
+    operations = [
+        # O AddField recria dispensas_solicitacao no SQLite, o que descarta os
+        # triggers do índice FTS (0009): eles saem antes e voltam depois
+        migrations.RunSQL(REMOVER_TRIGGERS_FTS, CRIAR_TRIGGERS_FTS),
+        migrations.AddField(
+            model_name="solicitacao",
+            name="seq_alteracao",
+            field=models.PositiveBigIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunSQL(CRIAR_TRIGGERS_FTS, REMOVER_TRIGGERS_FTS),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.27 on 2026-10-18 09:19
+
+import dispensas.armazenamento
+from django.db import migrations, models
+from django.db.models import Count
+
+from dispensas.busca import CRIAR_TRIGGERS_FTS, REMOVER_TRIGGERS_FTS
+
+
+def popular_referencias(apps, schema_editor):
+    """Conta quantas solicitações já apontam para cada arquivo"""
+    Solicitacao = apps.get_model("dispensas", "Solicitacao")
+    ArquivoAnexo = apps.get_model("dispensas", "ArquivoAnexo")
+
+    totais = (
+        Solicitacao.objects.exclude(anexo="")
+        .exclude(anexo__isnull=True)
+        .values("anexo")
+        .annotate(total=Count("id"))
+    )
+    ArquivoAnexo.objects.bulk_create(
+        [ArquivoAnexo(nome=t["anexo"], referencias=t["total"]) for t in totais]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dispensas", "0012_solicitacao_seq_alteracao"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArquivoAnexo",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("nome", models.CharField(max_length=255, unique=True)),
+                ("referencias", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        # Triggers do índice FTS saem antes do AlterField, que recria a tabela no
+        # SQLite, e voltam depois (ver 0012)
+        migrations.RunSQL(REMOVER_TRIGGERS_FTS, CRIAR_TRIGGERS_FTS),
+        migrations.AlterField(
+            model_name="solicitacao",
+            name="anexo",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=dispensas.armazenamento.ArmazenamentoDeduplicado(),
+                upload_to="anexos/",
+                verbose_name="Comprovante/Anexo",
+            ),
+        ),
+        migrations.RunSQL(CRIAR_TRIGGERS_FTS, REMOVER_TRIGGERS_FTS),
+        migrations.RunPython(popular_referencias, migrations.RunPython.noop),
+    ]
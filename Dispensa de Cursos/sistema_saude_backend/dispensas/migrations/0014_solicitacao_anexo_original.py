@@ -0,0 +1,31 @@
+# Generated by Django 4.2.27 on 2026-10-18 09:23
+
+import dispensas.armazenamento
+from django.db import migrations, models
+
+from dispensas.busca import CRIAR_TRIGGERS_FTS, REMOVER_TRIGGERS_FTS
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dispensas", "0013_arquivoanexo"),
+    ]
+
+    operations = [
+        # Triggers do índice FTS saem antes do AddField, que recria a tabela no
+        # SQLite, e voltam depois (ver 0012)
+        migrations.RunSQL(REMOVER_TRIGGERS_FTS, CRIAR_TRIGGERS_FTS),
+        migrations.AddField(
+            model_name="solicitacao",
+            name="anexo_original",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=dispensas.armazenamento.ArmazenamentoDeduplicado(),
+                upload_to="anexos/",
+                verbose_name="Anexo original (antes da otimização)",
+            ),
+        ),
+        migrations.RunSQL(CRIAR_TRIGGERS_FTS, REMOVER_TRIGGERS_FTS),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.27 on 2026-10-18 09:39
+
+from django.db import migrations, models
+from django.db.models import Max
+import django.utils.timezone
+
+
+def continuar_sequencia(apps, schema_editor):
+    """
+    A sequência continua de onde o carimbo TODAS parou: tokens do /changes/
+    e Last-Event-ID já entregues aos clientes seguem valendo.
+    """
+    VersaoLista = apps.get_model("dispensas", "VersaoLista")
+    Solicitacao = apps.get_model("dispensas", "Solicitacao")
+    SequenciaAlteracao = apps.get_model("dispensas", "SequenciaAlteracao")
+
+    todas = VersaoLista.objects.filter(escopo="TODAS")
+    ultimo = max(
+        todas.aggregate(m=Max("versao"))["m"] or 0,
+        Solicitacao.objects.aggregate(m=Max("seq_alteracao"))["m"] or 0,
+    )
+    if ultimo:
+        SequenciaAlteracao.objects.create(id=ultimo)
+    todas.delete()
+
+
+def voltar_carimbo_global(apps, schema_editor):
+    VersaoLista = apps.get_model("dispensas", "VersaoLista")
+    SequenciaAlteracao = apps.get_model("dispensas", "SequenciaAlteracao")
+
+    ultimo = SequenciaAlteracao.objects.aggregate(m=Max("id"))["m"]
+    if ultimo:
+        VersaoLista.objects.create(escopo="TODAS", chave="", versao=ultimo)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dispensas", "0014_solicitacao_anexo_original"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SequenciaAlteracao",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("criado_em", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="versaolista",
+            name="escopo",
+            field=models.CharField(
+                choices=[("UNIDADE", "Unidade"), ("USUARIO", "Usuário")], max_length=10
+            ),
+        ),
+        migrations.RunPython(continuar_sequencia, voltar_carimbo_global),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.27 on 2026-10-18 10:12
+
+from django.conf import settings
+from django.db import migrations
+
+
+def popular_versoes(apps, schema_editor):
+    """
+    Carimbo para toda unidade e todo usuário que já existe: sem ele, um pedido
+    antigo nunca alterado não entra no ETag da lista de quem passa a vê-lo.
+    """
+    Solicitacao = apps.get_model("dispensas", "Solicitacao")
+    Setor = apps.get_model("dispensas", "Setor")
+    VersaoLista = apps.get_model("dispensas", "VersaoLista")
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+
+    unidades = set(Solicitacao.objects.values_list("unidade", flat=True))
+    unidades.update(Setor.objects.values_list("nome", flat=True))
+    linhas = [
+        VersaoLista(escopo="UNIDADE", chave=unidade, versao=1)
+        for unidade in unidades
+        if unidade
+    ]
+    linhas += [
+        VersaoLista(escopo="USUARIO", chave=str(pk), versao=1)
+        for pk in User.objects.values_list("pk", flat=True)
+    ]
+    VersaoLista.objects.bulk_create(linhas, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("dispensas", "0015_sequenciaalteracao"),
+    ]
+
+    operations = [
+        migrations.RunPython(popular_versoes, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .armazenamento import armazenamento_anexos
 
 
 class Solicitacao(models.Model):
@@ -11,7 +15,21 @@ class Solicitacao(models.Model):
         ("CANCELADO", "Indeferido"),
     ]
 
-    anexo = models.FileField(upload_to='anexos/', null=True, blank=True, verbose_name="Comprovante/Anexo")
+    anexo = models.FileField(
+        upload_to="anexos/",
+        storage=armazenamento_anexos,
+        null=True,
+        blank=True,
+        verbose_name="Comprovante/Anexo",
+    )
+    # Arquivo como foi enviado, guardado só com ANEXOS_MANTER_ORIGINAL
+    anexo_original = models.FileField(
+        upload_to="anexos/",
+        storage=armazenamento_anexos,
+        null=True,
+        blank=True,
+        verbose_name="Anexo original (antes da otimização)",
+    )
 
     # Dados Básicos
     usuario = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -57,9 +75,39 @@ class Solicitacao(models.Model):
     )
     motivo_cancelamento = models.TextField(blank=True, null=True)
 
+    # Posição na sequência global de alterações (sincronização incremental)
+    seq_alteracao = models.PositiveBigIntegerField(default=0, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Listagem por jurisdição: unidade__in (...) ordenado por -id
+            models.Index(fields=["unidade", "-id"], name="solicitacao_unidade_id_idx"),
+            # Filtros da lista (dispensas/filters.py)
+            models.Index(fields=["status", "-id"], name="solicitacao_status_id_idx"),
+            models.Index(fields=["usuario", "-id"], name="solicitacao_usuario_id_idx"),
+            models.Index(
+                fields=["unidade", "status", "-id"],
+                name="solicitacao_unid_status_idx",
+            ),
+            models.Index(fields=["data_inicio", "id"], name="solicitacao_inicio_idx"),
+            models.Index(
+                fields=["data_solicitacao", "id"], name="solicitacao_criacao_idx"
+            ),
+        ]
+
     def __str__(self):
         return f"{self.nome_evento} - {self.usuario.username}"
 
+    def save(self, *args, **kwargs):
+        # Toda escrita recebe o próximo número da sequência global de alterações.
+        # Tudo numa transação só: no SQLite isso serializa os escritores, então a
+        # ordem da sequência é a ordem de commit (o /changes/ não pula linhas).
+        with transaction.atomic():
+            self.seq_alteracao = SequenciaAlteracao.proxima()
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "seq_alteracao"}
+            super().save(*args, **kwargs)
+
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
@@ -112,3 +160,174 @@ class Setor(models.Model):
 
     def __str__(self):
         return f"{self.nome} -> Pertence a: {self.departamento.nome}"
+
+
+class JurisdicaoUnidade(models.Model):
+    """
+    Índice pré-calculado "usuário -> unidades que ele enxerga".
+    Mantido pelos signals (dispensas/signals.py) quando Setor, Departamento
+    ou os grupos do usuário mudam, para a listagem não refazer a hierarquia.
+    """
+
+    usuario = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="jurisdicoes"
+    )
+    unidade = models.CharField(max_length=200)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["usuario", "unidade"], name="jurisdicao_usuario_unidade"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario.username} -> {self.unidade}"
+
+
+class ContadorStatus(models.Model):
+    """
+    Total de solicitações por (unidade, status), mantido incrementalmente
+    pelos signals a cada criação, transição ou exclusão de Solicitacao.
+    Alimenta os cards do dashboard sem varrer a tabela.
+    """
+
+    unidade = models.CharField(max_length=100)
+    status = models.CharField(max_length=20)
+    total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["unidade", "status"], name="contador_unidade_status"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.unidade} / {self.status}: {self.total}"
+
+
+class VersaoLista(models.Model):
+    """
+    Carimbo de versão das listagens, incrementado a cada alteração de
+    Solicitacao em dois escopos: a UNIDADE do pedido e o USUARIO dono. A
+    lista de cada usuário responde 304 (ETag) enquanto nenhum carimbo da sua
+    jurisdição mudar. A visão do admin usa a SequenciaAlteracao.
+    """
+
+    ESCOPO_CHOICES = [
+        ("UNIDADE", "Unidade"),
+        ("USUARIO", "Usuário"),
+    ]
+
+    escopo = models.CharField(max_length=10, choices=ESCOPO_CHOICES)
+    chave = models.CharField(max_length=200, blank=True, default="")
+    versao = models.PositiveBigIntegerField(default=0)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["escopo", "chave"], name="versao_lista_escopo_chave"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.escopo}:{self.chave} v{self.versao}"
+
+    @classmethod
+    def incrementar(cls, escopo, chave="", agora=None):
+        """Soma 1 ao carimbo (escopo, chave), criando a linha se preciso"""
+        agora = agora or timezone.now()
+        versoes = cls.objects.filter(escopo=escopo, chave=chave)
+        if not versoes.update(versao=F("versao") + 1, atualizado_em=agora):
+            cls.objects.get_or_create(escopo=escopo, chave=chave)
+            versoes.update(versao=F("versao") + 1, atualizado_em=agora)
+
+    @classmethod
+    def incrementar_varios(cls, escopo, chaves, agora=None):
+        """Soma 1 a vários carimbos do mesmo escopo com um UPDATE só"""
+        chaves = {str(c) for c in chaves if c}
+        if not chaves:
+            return
+        agora = agora or timezone.now()
+        versoes = cls.objects.filter(escopo=escopo, chave__in=chaves)
+        if versoes.update(versao=F("versao") + 1, atualizado_em=agora) < len(chaves):
+            # Cria as linhas que faltam zeradas e incrementa só elas
+            faltando = chaves - set(versoes.values_list("chave", flat=True))
+            cls.objects.bulk_create(
+                [cls(escopo=escopo, chave=chave) for chave in faltando],
+                ignore_conflicts=True,
+            )
+            cls.objects.filter(escopo=escopo, chave__in=faltando).update(
+                versao=F("versao") + 1, atualizado_em=agora
+            )
+
+
+class SequenciaAlteracao(models.Model):
+    """
+    Sequência global de alterações de Solicitacao (seq_alteracao, /changes/,
+    SSE e ETag da lista do admin). Cada escrita insere uma linha e usa o id
+    como número: um INSERT só, sem linha única disputada por todos os
+    escritores. O id é AUTOINCREMENT no SQLite, nunca reaproveitado, então
+    as linhas antigas podem ser apagadas.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    criado_em = models.DateTimeField(default=timezone.now)
+
+    # A cada N números as linhas anteriores são apagadas (fica só a última)
+    PODAR_A_CADA = 1000
+
+    def __str__(self):
+        return f"#{self.id}"
+
+    @classmethod
+    def proxima(cls):
+        """
+        Próximo número da sequência. Deve rodar dentro de transaction.atomic(),
+        na mesma transação da escrita que ele numera.
+        """
+        numero = cls.objects.create().id
+        if numero % cls.PODAR_A_CADA == 0:
+            cls.objects.filter(id__lt=numero).delete()
+        return numero
+
+    @classmethod
+    def ultima(cls):
+        """(número, data) da última alteração, ou (0, None) num banco vazio"""
+        ultima = cls.objects.order_by("-id").values_list("id", "criado_em").first()
+        return ultima or (0, None)
+
+    @classmethod
+    def atual(cls):
+        return cls.ultima()[0]
+
+
+# Campos de Solicitacao guardados no armazenamento deduplicado
+CAMPOS_ANEXO = ("anexo", "anexo_original")
+
+
+class ArquivoAnexo(models.Model):
+    """
+    Contagem de referências de cada arquivo do armazenamento deduplicado
+    (dispensas/armazenamento.py): quantas solicitações apontam para o mesmo
+    conteúdo. Mantida pelos signals; ao chegar a zero o arquivo é apagado
+    pela fila de tarefas.
+    """
+
+    nome = models.CharField(max_length=255, unique=True)
+    referencias = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.nome} ({self.referencias} ref.)"
+
+    @classmethod
+    def ajustar(cls, nome, delta):
+        """Soma delta às referências de `nome`, criando a linha se preciso"""
+        arquivos = cls.objects.filter(nome=nome)
+        if delta < 0:
+            arquivos = arquivos.filter(referencias__gte=-delta)
+        if not arquivos.update(referencias=F("referencias") + delta) and delta > 0:
+            cls.objects.get_or_create(nome=nome)
+            arquivos.update(referencias=F("referencias") + delta)
@@ -0,0 +1,101 @@
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image, ImageOps
+from pypdf import PdfReader, PdfWriter
+
+logger = logging.getLogger(__name__)
+
+# ====================================================================
+# OTIMIZAÇÃO DOS ANEXOS NO ENVIO
+# Fotos do celular (5-10 MB) são reduzidas e recomprimidas em JPEG; PDFs
+# têm os fluxos de conteúdo comprimidos e objetos repetidos unificados.
+# O resultado só substitui o envio se ficar menor. Qualquer arquivo que não
+# der para abrir segue como veio.
+# ====================================================================
+
+FORMATOS_IMAGEM = {"JPEG", "PNG", "WEBP", "BMP", "TIFF"}
+
+
+def _lado_maximo():
+    return getattr(settings, "ANEXOS_IMAGEM_LADO_MAXIMO", 2000)
+
+
+def _saida():
+    """Resultado em memória até PDF_SPOOL_MAXIMO, em disco acima disso"""
+    return tempfile.SpooledTemporaryFile(
+        max_size=getattr(settings, "PDF_SPOOL_MAXIMO", 1024 * 1024)
+    )
+
+
+def _otimizar_imagem(imagem, destino):
+    lado = _lado_maximo()
+    if imagem.format == "JPEG":
+        # Decodifica já reduzido (escala 1/2, 1/4, 1/8 no próprio libjpeg)
+        imagem.draft("RGB", (lado, lado))
+    imagem = ImageOps.exif_transpose(imagem)
+    if imagem.mode in ("RGBA", "LA", "P"):
+        # Sem transparência no JPEG: achata sobre fundo branco
+        imagem = imagem.convert("RGBA")
+        fundo = Image.new("RGB", imagem.size, "white")
+        fundo.paste(imagem, mask=imagem.getchannel("A"))
+        imagem = fundo
+    elif imagem.mode != "RGB":
+        imagem = imagem.convert("RGB")
+    imagem.thumbnail((lado, lado), Image.LANCZOS)
+    imagem.save(
+        destino,
+        "JPEG",
+        quality=getattr(settings, "ANEXOS_IMAGEM_QUALIDADE", 82),
+        optimize=True,
+        progressive=True,
+    )
+    return ".jpg"
+
+
+def _otimizar_pdf(arquivo, destino):
+    leitor = PdfReader(arquivo)
+    if leitor.is_encrypted:
+        return None
+    escritor = PdfWriter(clone_from=leitor)
+    for pagina in escritor.pages:
+        pagina.compress_content_streams()
+    escritor.compress_identical_objects()
+    escritor.write(destino)
+    return ".pdf"
+
+
+def otimizar_anexo(arquivo):
+    """
+    Devolve um File com a versão otimizada do envio, ou None quando não há
+    ganho (formato não tratado, arquivo ilegível ou resultado maior).
+    """
+    base, extensao = os.path.splitext(os.path.basename(arquivo.name or "anexo"))
+    destino = _saida()
+    try:
+        arquivo.seek(0)
+        if extensao.lower() == ".pdf":
+            nova_extensao = _otimizar_pdf(arquivo, destino)
+        else:
+            with Image.open(arquivo) as imagem:
+                nova_extensao = (
+                    _otimizar_imagem(imagem, destino)
+                    if imagem.format in FORMATOS_IMAGEM
+                    else None
+                )
+    except Exception:
+        # Image.UnidentifiedImageError, PdfReadError, arquivo corrompido...
+        logger.info("Anexo %s enviado sem otimização", arquivo.name, exc_info=True)
+        nova_extensao = None
+    finally:
+        arquivo.seek(0)
+
+    tamanho = destino.tell()
+    if nova_extensao is None or tamanho >= arquivo.size:
+        destino.close()
+        return None
+    destino.seek(0)
+    return File(destino, name=base + nova_extensao)
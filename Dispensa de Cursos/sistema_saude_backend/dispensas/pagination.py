@@ -0,0 +1,23 @@
+from rest_framework.pagination import CursorPagination
+
+
+class SolicitacaoCursorPagination(CursorPagination):
+    """
+    Paginação por cursor (keyset) da lista de solicitações.
+    O cursor é opaco (base64) e a consulta usa "WHERE id < ?" em vez de OFFSET,
+    então o custo de cada página não cresce com o tamanho da tabela.
+    """
+
+    ordering = "-id"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+    def get_ordering(self, request, queryset, view):
+        # Com ?ordering=data_inicio várias solicitações empatam na mesma data;
+        # o id como desempate deixa a ordem dentro do empate estável, senão o
+        # deslocamento do cursor pula ou repete registros entre as páginas
+        ordering = tuple(super().get_ordering(request, queryset, view))
+        if not {campo.lstrip("-") for campo in ordering} & {"id", "pk"}:
+            ordering += ("-id" if ordering[0].startswith("-") else "id",)
+        return ordering
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Exists, OuterRef
+
+from .cache import CacheLRU
+from .models import Departamento, Setor
+
+# Papéis do usuário como bits (um usuário pode acumular mais de um)
+SUPERUSUARIO = 1
+GERENTE = 2
+COORDENADOR = 4
+GESTOR = GERENTE | COORDENADOR
+
+# usuario_id -> bitmask. Invalidado pelos signals (grupos, Setor/Departamento,
+# User salvo); o TTL cobre os outros workers, que não recebem esses signals.
+# Curto como o do cache de tokens: um papel revogado não vale por minutos.
+papeis_em_cache = CacheLRU(
+    maximo=getattr(settings, "PAPEIS_CACHE_MAXIMO", 4096),
+    ttl=getattr(settings, "PAPEIS_CACHE_TTL", 60),
+)
+
+
+def _calcular_papeis(usuario):
+    """Uma query só: grupos e responsabilidades (Setor/Departamento) via EXISTS"""
+    grupos = User.groups.through.objects.filter(user_id=OuterRef("pk"))
+    linha = (
+        User.objects.filter(pk=usuario.pk)
+        .annotate(
+            grupo_gerente=Exists(grupos.filter(group__name="Gerentes")),
+            grupo_coordenador=Exists(grupos.filter(group__name="Coordenadores")),
+            responsavel_setor=Exists(Setor.objects.filter(responsavel=OuterRef("pk"))),
+            responsavel_departamento=Exists(
+                Departamento.objects.filter(responsavel=OuterRef("pk"))
+            ),
+        )
+        .values(
+            "is_superuser",
+            "grupo_gerente",
+            "grupo_coordenador",
+            "responsavel_setor",
+            "responsavel_departamento",
+        )
+        .first()
+    )
+    if linha is None:
+        return 0
+
+    papeis = 0
+    if linha["is_superuser"]:
+        papeis |= SUPERUSUARIO
+    if linha["grupo_gerente"] or linha["responsavel_setor"]:
+        papeis |= GERENTE
+    if linha["grupo_coordenador"] or linha["responsavel_departamento"]:
+        papeis |= COORDENADOR
+    return papeis
+
+
+def papeis_do_usuario(usuario):
+    """
+    Bitmask de papéis do usuário (SUPERUSUARIO | GERENTE | COORDENADOR).
+    Gerente: grupo "Gerentes" ou responsável por algum Setor.
+    Coordenador: grupo "Coordenadores" ou responsável por algum Departamento.
+    """
+    if usuario is None or not usuario.is_authenticated:
+        return 0
+    papeis = papeis_em_cache.obter(usuario.pk)
+    if papeis is None:
+        papeis = _calcular_papeis(usuario)
+        papeis_em_cache.guardar(usuario.pk, papeis)
+    return papeis
+
+
+def invalidar_papeis(usuario_ids):
+    for usuario_id in usuario_ids:
+        if usuario_id:
+            papeis_em_cache.remover(usuario_id)
+
+
+def papel_frontend(papeis):
+    """Nome do papel usado pelo frontend para desenhar os botões"""
+    if papeis & SUPERUSUARIO:
+        return "admin"
+    if papeis & COORDENADOR:
+        return "coordinator"
+    if papeis & GERENTE:
+        return "manager"
+    return "user"
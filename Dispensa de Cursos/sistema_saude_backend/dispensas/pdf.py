@@ -0,0 +1,554 @@
+import io
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import FileResponse
+from PIL import Image
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from tarefas.fila import enfileirar_lote
+
+from .models import Solicitacao
+
+logger = logging.getLogger(__name__)
+
+# ====================================================================
+# PDF OFICIAL DA SOLICITAÇÃO (DESENHO + CACHE EM DISCO)
+# O PDF só depende da linha da solicitação (e do usuário/perfil do dono).
+# Cada versão renderizada fica em PDF_CACHE_DIR/<pk>/<seq>_<layout>.pdf,
+# com seq = seq_alteracao: qualquer alteração muda a chave e a versão antiga
+# é apagada. Downloads repetidos viram leitura de arquivo estático. A pasta
+# fica fora de MEDIA_ROOT: o PDF só sai pela view, que confere a permissão.
+# ====================================================================
+
+
+# --- TIMBRE (PARTE FIXA DA PÁGINA) ---
+# Cabeçalho, brasão, rodapé e as molduras das assinaturas são iguais em todo
+# documento: ficam num form XObject desenhado uma vez por canvas e carimbado
+# em cada página. O cabeçalho (brasão + prefeitura) é um form à parte, usado
+# também pelo relatório consolidado. O brasão é lido e reduzido uma vez por
+# processo.
+NOME_CABECALHO = "cabecalho_sms"
+NOME_TIMBRE = "timbre_dispensa"
+# Entra no nome dos arquivos em cache: mudou o desenho, incrementa
+VERSAO_LAYOUT = 2
+
+# (x, y) e título das 4 caixas de assinatura
+CAIXAS_ASSINATURA = [
+    (2 * cm, 9 * cm, "SERVIDOR SOLICITANTE"),
+    (11 * cm, 9 * cm, "CHEFIA IMEDIATA"),
+    (2 * cm, 5.5 * cm, "COORDENAÇÃO / DIRETORIA"),
+    (11 * cm, 5.5 * cm, "SECRETARIA DE SAÚDE"),
+]
+
+
+@lru_cache(maxsize=1)
+def _brasao_jpeg():
+    """
+    Bytes de uma cópia do brasão reduzida (~150 dpi) e em JPEG, gerada uma
+    vez por processo e guardada em memória, ou None se não houver arquivo.
+    """
+    caminho = getattr(
+        settings,
+        "PDF_BRASAO",
+        settings.BASE_DIR.parent
+        / "img"
+        / "Coat_of_arms_of_São_José_do_Rio_Preto_SP.png",
+    )
+    try:
+        with Image.open(caminho) as original:
+            original.thumbnail((180, 150))
+            # JPEG não tem transparência: aplica o brasão sobre fundo branco
+            imagem = Image.new("RGB", original.size, "white")
+            imagem.paste(original, mask=original.convert("RGBA").getchannel("A"))
+    except OSError:
+        logger.warning("Brasão não encontrado em %s", caminho)
+        return None
+    saida = io.BytesIO()
+    imagem.save(saida, "JPEG", quality=85)
+    return saida.getvalue()
+
+
+def brasao():
+    """
+    Brasão para o drawImage, ou None. JPEG entra no PDF como está
+    (DCTDecode), sem decodificar e recomprimir o PNG a cada documento.
+    Um leitor novo por chamada: o BytesIO não é compartilhado entre threads.
+    """
+    dados = _brasao_jpeg()
+    return None if dados is None else ImageReader(io.BytesIO(dados))
+
+
+def _definir_cabecalho(c):
+    """Define o form do cabeçalho no canvas (uma vez), sem desenhar na página"""
+    if not c.hasForm(NOME_CABECALHO):
+        width, height = A4
+        c.beginForm(NOME_CABECALHO)
+
+        imagem = brasao()
+        if imagem is not None:
+            c.drawImage(
+                imagem,
+                2 * cm,
+                height - 3.2 * cm,
+                width=2.4 * cm,
+                height=2 * cm,
+                preserveAspectRatio=True,
+            )
+
+        c.setFont("Helvetica-Bold", 12)
+        c.drawCentredString(
+            width / 2, height - 2 * cm, "PREFEITURA DE SÃO JOSÉ DO RIO PRETO"
+        )
+        c.setFont("Helvetica", 10)
+        c.drawCentredString(
+            width / 2, height - 2.5 * cm, "Secretaria Municipal de Saúde - SMS"
+        )
+        c.line(2 * cm, height - 2.8 * cm, 19 * cm, height - 2.8 * cm)
+        c.endForm()
+
+
+def desenhar_cabecalho(c):
+    """Carimba brasão e cabeçalho da prefeitura na página atual"""
+    _definir_cabecalho(c)
+    c.doForm(NOME_CABECALHO)
+
+
+def desenhar_timbre(c):
+    """Carimba o timbre na página atual, definindo o form na 1ª vez do canvas"""
+    if not c.hasForm(NOME_TIMBRE):
+        width, height = A4
+        # Form não se define dentro de outro: o cabeçalho vem antes
+        _definir_cabecalho(c)
+        c.beginForm(NOME_TIMBRE)
+        c.doForm(NOME_CABECALHO)
+
+        c.setFont("Helvetica-Bold", 14)
+        c.drawCentredString(width / 2, height - 4 * cm, "REQUERIMENTO DE DISPENSA")
+
+        for x, y, titulo in CAIXAS_ASSINATURA:
+            c.rect(x, y, 8 * cm, 3 * cm)
+            c.setFont("Helvetica-Bold", 7)
+            c.drawString(x + 0.2 * cm, y + 2.6 * cm, titulo)
+
+        # Rodapé
+        c.setFont("Helvetica", 8)
+        c.drawCentredString(
+            width / 2,
+            2 * cm,
+            "Documento gerado eletronicamente pelo Sistema Dispensa Digital.",
+        )
+        c.endForm()
+    c.doForm(NOME_TIMBRE)
+
+
+def desenhar_solicitacao(c, solicitacao):
+    """Desenha a página do requerimento no canvas do ReportLab"""
+    width, height = A4
+
+    # --- CABEÇALHO (fixo, no timbre) ---
+    desenhar_timbre(c)
+
+    # Protocolo (Correção do Erro 4)
+    c.setFont("Helvetica", 10)
+    c.drawRightString(19 * cm, height - 4.5 * cm, f"Protocolo SIGM: {solicitacao.id}")
+
+    # --- DADOS DO SERVIDOR ---
+    y = height - 6 * cm
+
+    # Recupera dados com segurança (Correção do Erro 1 e 2)
+    nome_user = (
+        solicitacao.usuario.first_name
+        if solicitacao.usuario.first_name
+        else solicitacao.usuario.username
+    )
+
+    try:
+        profile = solicitacao.usuario.profile
+        cargo_txt = profile.cargo if profile.cargo else "---"
+        unidade_txt = profile.unidade if profile.unidade else "---"
+    except:
+        cargo_txt = "---"
+        unidade_txt = "---"
+
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(2 * cm, y, "1. DADOS DO SERVIDOR")
+    y -= 0.8 * cm
+    c.setFont("Helvetica", 10)
+    c.drawString(2 * cm, y, f"Nome: {nome_user}")
+    c.drawString(12 * cm, y, f"Matrícula: {solicitacao.matricula}")
+    y -= 0.6 * cm
+    c.drawString(2 * cm, y, f"Cargo: {cargo_txt}")  # Agora mostra "---" se vazio
+    c.drawString(12 * cm, y, f"Unidade: {unidade_txt}")
+
+    # --- DADOS DO EVENTO ---
+    y -= 1.5 * cm
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(2 * cm, y, "2. DADOS DO AFASTAMENTO")
+    y -= 0.8 * cm
+
+    # Formata Datas (Correção do Erro 2)
+    try:
+        d1 = solicitacao.data_inicio.strftime("%d/%m/%Y")
+        d2 = solicitacao.data_fim.strftime("%d/%m/%Y")
+        periodo = f"{d1} a {d2}"
+    except:
+        periodo = "Datas não definidas"
+
+    # Local (Correção do Erro 3)
+    cidade = getattr(solicitacao, "cidade", "---")
+    estado = getattr(solicitacao, "estado", "SP")
+    local_txt = f"{cidade}/{estado}" if cidade else "---"
+
+    c.setFont("Helvetica", 10)
+    c.drawString(2 * cm, y, f"Evento: {solicitacao.nome_evento}")
+    y -= 0.6 * cm
+    c.drawString(2 * cm, y, f"Período: {periodo}")
+    y -= 0.6 * cm
+    c.drawString(2 * cm, y, f"Local: {local_txt}")
+    y -= 0.6 * cm
+    c.drawString(2 * cm, y, "Objetivo:")
+
+    # Quebra de linha para texto longo
+    text_obj = c.beginText(4 * cm, y)
+    text_obj.setFont("Helvetica", 10)
+    text_obj.textLines((solicitacao.objetivo or "---")[:300])
+    c.drawText(text_obj)
+
+    # --- 4 ÁREAS DE ASSINATURA (CORREÇÃO FINAL) ---
+    # Molduras e títulos vêm do timbre; aqui só o conteúdo de cada caixa
+    def draw_box(caixa, nome_assinatura, cargo_assinatura):
+        x, y, _ = CAIXAS_ASSINATURA[caixa]
+        c.setFont("Helvetica", 8)
+        if nome_assinatura:
+            c.drawCentredString(x + 4 * cm, y + 1.5 * cm, nome_assinatura)
+            c.setFont("Helvetica-Oblique", 7)
+            c.drawCentredString(x + 4 * cm, y + 1.1 * cm, "Assinado Digitalmente")
+            if cargo_assinatura:
+                c.drawCentredString(x + 4 * cm, y + 0.7 * cm, cargo_assinatura)
+        else:
+            c.drawCentredString(x + 4 * cm, y + 1.5 * cm, "__________________________")
+            c.drawCentredString(x + 4 * cm, y + 1.0 * cm, "Assinatura Manual")
+
+    # 1. SERVIDOR
+    draw_box(0, nome_user, cargo_txt)
+
+    # 2. GERENTE (Usa o nome salvo ou deixa linha para assinar)
+    nome_gerente = (
+        solicitacao.assinatura_gerente if solicitacao.assinatura_gerente else ""
+    )
+    if not nome_gerente and solicitacao.status in [
+        "PENDENTE_COORD",
+        "PENDENTE_ADMIN",
+        "APROVADO",
+    ]:
+        nome_gerente = "(Aprovado no Sistema)"  # Fallback se não tiver nome gravado
+    draw_box(1, nome_gerente, "Gerente")
+
+    # 3. COORDENADOR
+    nome_coord = (
+        solicitacao.assinatura_coordenador if solicitacao.assinatura_coordenador else ""
+    )
+    if not nome_coord and solicitacao.status in ["PENDENTE_ADMIN", "APROVADO"]:
+        nome_coord = "(Autorizado no Sistema)"
+    draw_box(2, nome_coord, "Coordenador")
+
+    # 4. SECRETARIA (ADMIN) - O CAMPO QUE FALTAVA
+    nome_admin = solicitacao.assinatura_admin if solicitacao.assinatura_admin else ""
+    if not nome_admin and solicitacao.status == "APROVADO":
+        nome_admin = "Secretaria Municipal de Saúde"
+    draw_box(3, nome_admin, "Autorização Final")
+
+
+def renderizar_pdf(solicitacao, destino=None):
+    """
+    PDF da solicitação (sem cache). Com `destino` (arquivo binário aberto),
+    grava direto nele; sem, devolve os bytes.
+    """
+    buffer = destino if destino is not None else io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+    desenhar_solicitacao(c, solicitacao)
+    c.showPage()
+    c.save()
+    if destino is None:
+        return buffer.getvalue()
+
+
+def resposta_pdf(escrever, nome_arquivo):
+    """
+    FileResponse de um PDF gerado por escrever(arquivo). O arquivo fica em
+    memória até PDF_SPOOL_MAXIMO bytes e passa para o disco acima disso; a
+    resposta é enviada em blocos a partir dele, sem um bytes do tamanho do
+    documento inteiro no worker.
+    """
+    arquivo = tempfile.SpooledTemporaryFile(
+        max_size=getattr(settings, "PDF_SPOOL_MAXIMO", 1024 * 1024)
+    )
+    try:
+        escrever(arquivo)
+        arquivo.seek(0)
+    except BaseException:
+        arquivo.close()
+        raise
+    return FileResponse(
+        arquivo,
+        as_attachment=True,
+        filename=nome_arquivo,
+        content_type="application/pdf",
+    )
+
+
+class CachePDF:
+    """
+    Cache de PDFs renderizados em disco, limitado em bytes: ao passar do
+    limite, apaga os arquivos usados há mais tempo (mtime, renovado a cada
+    acerto). Compartilhado entre workers, já que é só o sistema de arquivos.
+    Cada chave (pk) tem uma subpasta com as suas versões: invalidar uma chave
+    lista só a pasta dela. O total em bytes é acompanhado em memória e a pasta
+    inteira só é varrida quando ele passa do limite ou a cada RECONTAR_A_CADA
+    gravações (os outros workers também gravam).
+    """
+
+    # Subpasta de BASE_DIR/cache (ou o setting CONFIG_PASTA) e extensão dos
+    # arquivos. Nunca dentro de MEDIA_ROOT, que é servido sem autenticação.
+    SUBPASTA = "pdf"
+    CONFIG_PASTA = "PDF_CACHE_DIR"
+    EXTENSAO = ".pdf"
+    RECONTAR_A_CADA = 100
+
+    def __init__(self, maximo_bytes):
+        self.maximo_bytes = maximo_bytes
+        self._trava = threading.Lock()
+        # Total estimado da pasta já varrida (outra pasta = varrer de novo)
+        self._pasta_contada = None
+        self._total = 0
+        self._gravacoes = 0
+
+    @property
+    def pasta(self):
+        # Lido a cada uso para respeitar override_settings(PDF_CACHE_DIR=...)
+        return getattr(
+            settings,
+            self.CONFIG_PASTA,
+            os.path.join(settings.BASE_DIR, "cache", self.SUBPASTA),
+        )
+
+    def pasta_da_chave(self, chave):
+        return os.path.join(self.pasta, str(chave))
+
+    def nome(self, versao):
+        return f"{versao}_{VERSAO_LAYOUT}{self.EXTENSAO}"
+
+    def caminho(self, pk, versao):
+        return os.path.join(self.pasta_da_chave(pk), self.nome(versao))
+
+    def obter(self, pk, versao):
+        """Caminho do PDF em cache, ou None se essa versão não foi renderizada"""
+        caminho = self.caminho(pk, versao)
+        try:
+            os.utime(caminho)  # Marca como usado agora (LRU)
+        except FileNotFoundError:
+            return None
+        return caminho
+
+    def guardar(self, pk, versao, conteudo):
+        with self.escrever(pk, versao) as arquivo:
+            arquivo.write(conteudo)
+        return self.caminho(pk, versao)
+
+    @contextmanager
+    def escrever(self, pk, versao):
+        """
+        Arquivo onde gravar a versão. Escreve num temporário e renomeia no
+        fim do bloco: quem estiver lendo nunca vê um PDF pela metade, e um
+        erro no meio não deixa nada no cache.
+        """
+        pasta = self.pasta_da_chave(pk)
+        caminho = self.caminho(pk, versao)
+        descritor, temporario = self._temporario(pasta)
+        try:
+            with os.fdopen(descritor, "wb") as arquivo:
+                yield arquivo
+            tamanho = os.path.getsize(temporario)
+            os.replace(temporario, caminho)
+        except BaseException:
+            try:
+                os.remove(temporario)
+            except FileNotFoundError:
+                pass
+            self._apagar_pasta_vazia(pasta)
+            raise
+        liberados = self._remover_versoes(pasta, exceto=caminho)
+        self._contar_gravacao(tamanho - liberados)
+
+    def remover(self, chaves):
+        """Apaga as versões em cache das chaves informadas"""
+        liberados = sum(
+            self._remover_versoes(self.pasta_da_chave(chave)) for chave in chaves
+        )
+        if liberados:
+            with self._trava:
+                if self._pasta_contada == self.pasta:
+                    self._total = max(self._total - liberados, 0)
+
+    @staticmethod
+    def _temporario(pasta):
+        os.makedirs(pasta, exist_ok=True)
+        try:
+            return tempfile.mkstemp(dir=pasta, suffix=".tmp")
+        except FileNotFoundError:
+            # A pasta vazia saiu num remover() de outro worker no meio do caminho
+            os.makedirs(pasta, exist_ok=True)
+            return tempfile.mkstemp(dir=pasta, suffix=".tmp")
+
+    @staticmethod
+    def _apagar_pasta_vazia(pasta):
+        try:
+            os.rmdir(pasta)
+        except OSError:
+            pass  # Não está vazia (outra versão ou gravação em curso)
+
+    def _remover_versoes(self, pasta, exceto=None):
+        """Apaga as versões da pasta de uma chave; devolve os bytes liberados"""
+        liberados = 0
+        try:
+            with os.scandir(pasta) as entradas:
+                versoes = [
+                    entrada
+                    for entrada in entradas
+                    if entrada.name.endswith(self.EXTENSAO) and entrada.path != exceto
+                ]
+        except FileNotFoundError:
+            return 0
+        for entrada in versoes:
+            try:
+                tamanho = entrada.stat().st_size
+                os.remove(entrada.path)
+            except FileNotFoundError:
+                continue
+            liberados += tamanho
+        if exceto is None:
+            self._apagar_pasta_vazia(pasta)
+        return liberados
+
+    def _contar_gravacao(self, delta):
+        """Soma a gravação ao total estimado; varre e poda só quando preciso"""
+        with self._trava:
+            pasta = self.pasta
+            self._gravacoes += 1
+            if (
+                pasta != self._pasta_contada
+                or self._total + delta > self.maximo_bytes
+                or self._gravacoes >= self.RECONTAR_A_CADA
+            ):
+                self._total = self._podar(pasta)
+                self._pasta_contada = pasta
+                self._gravacoes = 0
+            else:
+                self._total += delta
+
+    def _arquivos(self, pasta):
+        """(mtime, tamanho, caminho) de todas as versões em cache"""
+        arquivos = []
+
+        def incluir(entrada):
+            if entrada.name.endswith(self.EXTENSAO):
+                try:
+                    info = entrada.stat()
+                except FileNotFoundError:
+                    return
+                arquivos.append((info.st_mtime, info.st_size, entrada.path))
+
+        try:
+            with os.scandir(pasta) as raiz:
+                entradas = list(raiz)
+        except FileNotFoundError:
+            return arquivos
+        for entrada in entradas:
+            if entrada.is_dir():
+                try:
+                    with os.scandir(entrada.path) as versoes:
+                        for versao in versoes:
+                            incluir(versao)
+                except FileNotFoundError:
+                    pass
+            else:
+                # Arquivo solto na raiz (layout antigo, sem subpasta): sai pela poda
+                incluir(entrada)
+        return arquivos
+
+    def _podar(self, pasta):
+        """Apaga os usados há mais tempo até caber no limite; devolve o total"""
+        arquivos = self._arquivos(pasta)
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for _, tamanho, caminho in sorted(arquivos):
+            if total <= self.maximo_bytes:
+                break
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+            total -= tamanho
+            if os.path.dirname(caminho) != pasta:
+                self._apagar_pasta_vazia(os.path.dirname(caminho))
+        return total
+
+
+pdfs_em_cache = CachePDF(
+    maximo_bytes=getattr(settings, "PDF_CACHE_MAXIMO_BYTES", 200 * 1024 * 1024)
+)
+
+
+def pdf_da_solicitacao(pk, solicitacoes=None):
+    """
+    Caminho do PDF da solicitação pk, renderizando só se a versão atual
+    ainda não estiver em cache. `solicitacoes` restringe a busca (o queryset
+    visível ao usuário, na mesma consulta da versão). Levanta
+    Solicitacao.DoesNotExist.
+    """
+    if solicitacoes is None:
+        solicitacoes = Solicitacao.objects.all()
+    versao = solicitacoes.values_list("seq_alteracao", flat=True).get(pk=pk)
+    caminho = pdfs_em_cache.obter(pk, versao)
+    if caminho is None:
+        solicitacao = Solicitacao.objects.select_related(
+            "usuario", "usuario__profile"
+        ).get(pk=pk)
+        # O ReportLab grava direto no arquivo do cache
+        with pdfs_em_cache.escrever(pk, solicitacao.seq_alteracao) as arquivo:
+            renderizar_pdf(solicitacao, arquivo)
+        caminho = pdfs_em_cache.caminho(pk, solicitacao.seq_alteracao)
+    return caminho
+
+
+# --- PRÉ-RENDERIZAÇÃO NA APROVAÇÃO FINAL ---
+# O PDF de um pedido APROVADO é renderizado pela fila de tarefas (app
+# tarefas, worker `manage.py processar_tarefas`), fora da requisição de quem
+# aprovou. O primeiro download já encontra o arquivo no cache; sem worker,
+# o download continua renderizando na hora.
+
+
+def pre_renderizar(pk):
+    """Renderiza e guarda a versão atual do PDF, se ainda não estiver em cache"""
+    try:
+        pdf_da_solicitacao(pk)
+    except Solicitacao.DoesNotExist:
+        pass  # Apagada antes de a tarefa rodar
+
+
+def agendar_pre_renderizacao(pks):
+    """
+    Enfileira a renderização na transação atual: a tarefa só fica visível
+    para o worker se a aprovação for confirmada.
+    """
+    pks = list(pks)
+    if pks:
+        enfileirar_lote("dispensas.pre_renderizar_pdf", [{"pk": pk} for pk in pks])
@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import posixpath
+import threading
+
+import pypdfium2 as pdfium
+from django.conf import settings
+from PIL import Image, ImageOps, features
+
+from .armazenamento import armazenamento_anexos
+from .pdf import CachePDF
+
+logger = logging.getLogger(__name__)
+
+# ====================================================================
+# PRÉ-VISUALIZAÇÃO DOS ANEXOS (MINIATURA / 1ª PÁGINA DO PDF)
+# Miniatura WebP (JPEG se o Pillow não tiver WebP) do anexo: a imagem
+# reduzida ou a primeira página do PDF renderizada pelo pypdfium2. Gerada
+# pela fila logo após o envio ou, se ainda não existir, na primeira
+# visualização; fica num cache em disco limitado em bytes (mesma poda por
+# uso do cache de PDFs), fora de MEDIA_ROOT (PREVIA_CACHE_DIR).
+# ====================================================================
+
+VERSAO_PREVIA = 1
+EXTENSOES_IMAGEM = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+FORMATO, EXTENSAO, TIPO = (
+    ("WEBP", ".webp", "image/webp")
+    if features.check("webp")
+    else ("JPEG", ".jpg", "image/jpeg")
+)
+
+# O PDFium não é thread-safe: uma renderização por vez em cada processo
+_trava_pdfium = threading.Lock()
+
+
+def _lado():
+    return getattr(settings, "ANEXOS_PREVIA_LADO", 480)
+
+
+class CachePrevias(CachePDF):
+    """Cache em disco das miniaturas, chaveado pelo nome do anexo"""
+
+    SUBPASTA = "previas"
+    CONFIG_PASTA = "PREVIA_CACHE_DIR"
+    EXTENSAO = EXTENSAO
+
+    def nome(self, versao):
+        return f"{versao}{self.EXTENSAO}"
+
+
+previas_em_cache = CachePrevias(
+    maximo_bytes=getattr(settings, "PREVIA_CACHE_MAXIMO_BYTES", 100 * 1024 * 1024)
+)
+
+
+def chave_previa(nome):
+    """
+    (chave, versão) da miniatura do anexo `nome`. O anexo é endereçado pelo
+    conteúdo: o mesmo nome é sempre o mesmo arquivo, então a miniatura nunca
+    fica velha (muda só com o tamanho ou o layout da miniatura).
+    """
+    chave = hashlib.sha256(nome.encode()).hexdigest()[:32]
+    return chave, f"{_lado()}v{VERSAO_PREVIA}"
+
+
+def tem_previa(nome):
+    extensao = posixpath.splitext(nome)[1].lower()
+    return extensao == ".pdf" or extensao in EXTENSOES_IMAGEM
+
+
+def _primeira_pagina(caminho, lado):
+    with _trava_pdfium:
+        documento = pdfium.PdfDocument(caminho)
+        try:
+            pagina = documento[0]
+            largura, altura = pagina.get_size()  # Em pontos (1/72")
+            escala = lado / max(largura, altura)
+            return pagina.render(scale=escala).to_pil()
+        finally:
+            documento.close()
+
+
+def _miniatura(caminho, lado):
+    with Image.open(caminho) as imagem:
+        if imagem.format == "JPEG":
+            imagem.draft("RGB", (lado, lado))
+        imagem = ImageOps.exif_transpose(imagem)
+        imagem.thumbnail((lado, lado), Image.LANCZOS)
+        return imagem.copy()
+
+
+def _gravar(imagem, destino):
+    if imagem.mode in ("RGBA", "LA", "P"):
+        imagem = imagem.convert("RGBA")
+        fundo = Image.new("RGB", imagem.size, "white")
+        fundo.paste(imagem, mask=imagem.getchannel("A"))
+        imagem = fundo
+    elif imagem.mode != "RGB":
+        imagem = imagem.convert("RGB")
+    imagem.save(destino, FORMATO, quality=75)
+
+
+def previa_do_anexo(nome):
+    """
+    Caminho da miniatura do anexo, gerando só se ainda não estiver em cache.
+    None quando o tipo não tem miniatura ou o arquivo não pôde ser lido.
+    """
+    if not nome or not tem_previa(nome):
+        return None
+    chave, versao = chave_previa(nome)
+    caminho = previas_em_cache.obter(chave, versao)
+    if caminho is not None:
+        return caminho
+
+    lado = _lado()
+    origem = armazenamento_anexos.path(nome)
+    try:
+        if nome.lower().endswith(".pdf"):
+            imagem = _primeira_pagina(origem, lado)
+        else:
+            imagem = _miniatura(origem, lado)
+        with previas_em_cache.escrever(chave, versao) as arquivo:
+            _gravar(imagem, arquivo)
+    except Exception:
+        # Arquivo sumido, PDF protegido ou corrompido, imagem ilegível...
+        logger.warning("Sem pré-visualização para o anexo %s", nome, exc_info=True)
+        return None
+    return previas_em_cache.caminho(chave, versao)
@@ -0,0 +1,204 @@
+import math
+from collections import Counter
+
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table, TableStyle
+
+from .models import Solicitacao
+from .pdf import desenhar_cabecalho, desenhar_solicitacao
+
+# ====================================================================
+# RELATÓRIO CONSOLIDADO (VÁRIAS SOLICITAÇÕES NUM PDF SÓ)
+# Capa com quadro-resumo por unidade, índice com o número da página de cada
+# pedido e, depois, um requerimento por página (mesmo desenho do PDF
+# individual, com o timbre carimbado como form). Uma consulta só tira o
+# retrato do filtro (ids, dados do índice e status): resumo e índice saem
+# dele, sem transação longa. As páginas leem as solicitações em lotes pelos
+# ids e cada uma é desenhada e fechada na hora, sem cursor aberto durante a
+# renderização nem lista de instâncias ou de flowables em memória.
+# ====================================================================
+
+LINHAS_INDICE = 40
+LOTE_PAGINAS = 200
+
+# Colunas do quadro-resumo: título -> status somados
+COLUNAS_RESUMO = [
+    ("Em análise", ("PENDENTE_GERENTE", "PENDENTE_COORD", "PENDENTE_ADMIN")),
+    ("Aprovadas", ("APROVADO",)),
+    ("Indeferidas", ("INDEFERIDO", "CANCELADO")),
+]
+
+
+class _Paginas:
+    """Canvas + contador de páginas com rodapé numerado"""
+
+    def __init__(self, c, titulo):
+        self.c = c
+        self.titulo = titulo
+        self.numero = 1
+
+    def fechar(self):
+        self.c.setFont("Helvetica", 7)
+        self.c.drawString(2 * cm, 1.2 * cm, self.titulo)
+        self.c.drawRightString(19 * cm, 1.2 * cm, f"Página {self.numero}")
+        self.c.showPage()
+        self.numero += 1
+
+
+def _cabecalho(c, titulo, subtitulo):
+    """Cabeçalho do PDF oficial (mesmo form, com brasão) + título do relatório"""
+    width, height = A4
+    desenhar_cabecalho(c)
+    c.setFont("Helvetica-Bold", 14)
+    c.drawCentredString(width / 2, height - 4 * cm, titulo)
+    c.setFont("Helvetica", 10)
+    c.drawCentredString(width / 2, height - 4.6 * cm, subtitulo)
+    return height - 5.5 * cm
+
+
+def _quadro_resumo(contagem_resumo):
+    """Table do platypus: unidade x (em análise, aprovadas, indeferidas, total)"""
+    por_unidade = {}
+    for (unidade, status), total in contagem_resumo.items():
+        por_unidade.setdefault(unidade, {})[status] = total
+
+    dados = [["Unidade"] + [titulo for titulo, _ in COLUNAS_RESUMO] + ["Total"]]
+    totais = [0] * (len(COLUNAS_RESUMO) + 1)
+    for unidade in sorted(por_unidade):
+        contagem = por_unidade[unidade]
+        valores = [
+            sum(contagem.get(status, 0) for status in grupo)
+            for _, grupo in COLUNAS_RESUMO
+        ]
+        valores.append(sum(contagem.values()))
+        totais = [a + b for a, b in zip(totais, valores)]
+        dados.append([unidade] + valores)
+    dados.append(["TOTAL"] + totais)
+
+    tabela = Table(
+        dados, colWidths=[7 * cm, 2.5 * cm, 2.5 * cm, 2.5 * cm, 2.5 * cm], repeatRows=1
+    )
+    tabela.setStyle(
+        TableStyle(
+            [
+                ("FONT", (0, 0), (-1, 0), "Helvetica-Bold", 9),
+                ("FONT", (0, 1), (-1, -1), "Helvetica", 9),
+                ("FONT", (0, -1), (-1, -1), "Helvetica-Bold", 9),
+                ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+                ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+                ("ALIGN", (1, 0), (-1, -1), "RIGHT"),
+            ]
+        )
+    )
+    return tabela
+
+
+def _desenhar_resumo(paginas, tabela, subtitulo):
+    """Quadro-resumo na capa, quebrando em quantas páginas precisar"""
+    c = paginas.c
+    largura = A4[0] - 4 * cm
+    titulo = "RELATÓRIO CONSOLIDADO DE DISPENSAS"
+    topo = _cabecalho(c, titulo, subtitulo)
+    while True:
+        livre = topo - 2 * cm
+        _, altura = tabela.wrapOn(c, largura, livre)
+        pedacos = tabela.split(largura, livre) if altura > livre else []
+        if len(pedacos) < 2:
+            tabela.drawOn(c, 2 * cm, topo - altura)
+            break
+        primeiro, tabela = pedacos[0], pedacos[1]
+        _, altura = primeiro.wrapOn(c, largura, livre)
+        primeiro.drawOn(c, 2 * cm, topo - altura)
+        paginas.fechar()
+        topo = _cabecalho(c, titulo, subtitulo)
+    paginas.fechar()
+
+
+def _desenhar_indice(paginas, linhas_indice, total, primeira_pagina):
+    """Uma linha por pedido, com link para a página dele"""
+    c = paginas.c
+    _, height = A4
+    for posicao, (pk, nome, unidade, data_inicio) in enumerate(linhas_indice):
+        if posicao % LINHAS_INDICE == 0:
+            if posicao:
+                paginas.fechar()
+            y = height - 2 * cm
+            c.setFont("Helvetica-Bold", 12)
+            c.drawString(2 * cm, y, f"ÍNDICE ({total} solicitações)")
+            y -= 1 * cm
+        y -= 0.55 * cm
+        pagina = primeira_pagina + posicao
+        c.setFont("Helvetica", 8)
+        c.drawString(2 * cm, y, f"#{pk}")
+        c.drawString(3.5 * cm, y, (nome or "---")[:40])
+        c.drawString(10 * cm, y, (unidade or "---")[:30])
+        c.drawString(15 * cm, y, data_inicio.strftime("%d/%m/%Y"))
+        c.drawRightString(19 * cm, y, str(pagina))
+        c.linkRect("", f"s{pk}", (2 * cm, y - 0.1 * cm, 19 * cm, y + 0.35 * cm))
+    if total:
+        paginas.fechar()
+
+
+def _desenhar_removida(c, pk):
+    """Página no lugar de um pedido excluído depois do retrato (índice intacto)"""
+    _, height = A4
+    c.setFont("Helvetica", 10)
+    c.drawString(
+        2 * cm, height - 3 * cm, f"Solicitação #{pk} excluída durante a geração."
+    )
+
+
+def gerar_relatorio(destino, queryset, subtitulo):
+    """
+    Escreve o relatório das solicitações do queryset em `destino` (arquivo
+    aberto em modo binário). Capa e índice saem de um retrato só do filtro;
+    as páginas são lidas depois, em lotes pelos ids desse retrato.
+    """
+    titulo = f"Relatório consolidado de dispensas - {subtitulo}"
+    queryset = queryset.order_by("unidade", "data_inicio", "id")
+    c = canvas.Canvas(destino, pagesize=A4, pageCompression=1)
+    c.setTitle(titulo)
+    c.setAuthor("Sistema Dispensa Digital")
+    paginas = _Paginas(c, titulo)
+
+    # Retrato numa consulta só: resumo, índice e páginas contam as mesmas linhas
+    retrato = list(
+        queryset.values_list(
+            "id", "usuario__first_name", "unidade", "data_inicio", "status"
+        )
+    )
+    total = len(retrato)
+
+    gerado = timezone.localtime().strftime("%d/%m/%Y %H:%M")
+    _desenhar_resumo(
+        paginas,
+        _quadro_resumo(Counter((linha[2], linha[4]) for linha in retrato)),
+        f"{subtitulo} - {total} solicitações - gerado em {gerado}",
+    )
+
+    primeira_pagina = paginas.numero + math.ceil(total / LINHAS_INDICE) if total else 0
+    _desenhar_indice(paginas, (linha[:4] for linha in retrato), total, primeira_pagina)
+
+    pks = [linha[0] for linha in retrato]
+    for inicio in range(0, total, LOTE_PAGINAS):
+        trecho = pks[inicio : inicio + LOTE_PAGINAS]
+        solicitacoes = Solicitacao.objects.select_related(
+            "usuario", "usuario__profile"
+        ).in_bulk(trecho)
+        for pk in trecho:
+            solicitacao = solicitacoes.get(pk)
+            c.bookmarkPage(f"s{pk}")
+            if solicitacao is None:
+                c.addOutlineEntry(f"#{pk} - excluída", f"s{pk}")
+                _desenhar_removida(c, pk)
+            else:
+                c.addOutlineEntry(f"#{pk} - {solicitacao.nome_evento}"[:80], f"s{pk}")
+                desenhar_solicitacao(c, solicitacao)
+            paginas.fechar()
+
+    c.save()
+    return total
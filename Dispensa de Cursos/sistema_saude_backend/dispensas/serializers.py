@@ -1,6 +1,8 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
 from .models import Solicitacao
+from .otimizacao import otimizar_anexo
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -16,6 +18,58 @@ class SolicitacaoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Solicitacao
         fields = "__all__"
+        read_only_fields = ["anexo_original"]
 
     def get_data_criacao_fmt(self, obj):
         return obj.data_solicitacao.strftime("%d/%m/%Y")
+
+    def validate(self, dados):
+        # Anexo reduzido/recomprimido no envio (dispensas/otimizacao.py)
+        if "anexo" in dados:
+            arquivo = dados["anexo"]
+            otimizado = otimizar_anexo(arquivo) if arquivo else None
+            manter = getattr(settings, "ANEXOS_MANTER_ORIGINAL", False)
+            dados["anexo_original"] = arquivo if otimizado and manter else None
+            if otimizado:
+                dados["anexo"] = otimizado
+        return dados
+
+
+class UsuarioResumoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ["id", "first_name"]
+
+
+class SolicitacaoListaSerializer(serializers.ModelSerializer):
+    """
+    Versão enxuta para a listagem (cards do dashboard e tabela do histórico).
+    O serializer completo fica só no detalhe (/solicitacoes/<id>/).
+    """
+
+    usuario_dados = UsuarioResumoSerializer(source="usuario", read_only=True)
+
+    # Colunas lidas do banco na listagem (usadas com .only() na view)
+    CAMPOS_BANCO = [
+        "id",
+        "usuario__id",
+        "usuario__first_name",
+        "matricula",
+        "unidade",
+        "nome_evento",
+        "data_inicio",
+        "status",
+    ]
+
+    class Meta:
+        model = Solicitacao
+        fields = [
+            "id",
+            "usuario",
+            "usuario_dados",
+            "matricula",
+            "unidade",
+            "nome_evento",
+            "data_inicio",
+            "status",
+        ]
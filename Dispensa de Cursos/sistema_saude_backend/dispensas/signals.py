@@ -0,0 +1,366 @@
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from tarefas.fila import enfileirar
+
+from .authentication import invalidar_usuario, tokens_em_cache
+from .eventos import hub
+from .papeis import invalidar_papeis, papeis_em_cache
+from .pdf import agendar_pre_renderizacao, pdfs_em_cache
+from .previa import tem_previa
+from .models import (
+    CAMPOS_ANEXO,
+    ArquivoAnexo,
+    ContadorStatus,
+    Departamento,
+    JurisdicaoUnidade,
+    SequenciaAlteracao,
+    Setor,
+    Solicitacao,
+    UserProfile,
+    VersaoLista,
+)
+
+
+# ====================================================================
+# 1. ÍNDICE DE JURISDIÇÃO (USUÁRIO -> UNIDADES VISÍVEIS)
+# ====================================================================
+
+
+def recalcular_jurisdicao(usuario_ids):
+    """
+    Refaz as linhas de JurisdicaoUnidade dos usuários informados.
+    Gerente enxerga os setores que gerencia; Coordenador enxerga todos os
+    setores dos departamentos que coordena.
+    """
+    usuario_ids = {uid for uid in usuario_ids if uid}
+    if not usuario_ids:
+        return
+
+    linhas = set(
+        Setor.objects.filter(responsavel_id__in=usuario_ids).values_list(
+            "responsavel_id", "nome"
+        )
+    )
+    linhas.update(
+        Setor.objects.filter(departamento__responsavel_id__in=usuario_ids).values_list(
+            "departamento__responsavel_id", "nome"
+        )
+    )
+
+    with transaction.atomic():
+        JurisdicaoUnidade.objects.filter(usuario_id__in=usuario_ids).delete()
+        JurisdicaoUnidade.objects.bulk_create(
+            [JurisdicaoUnidade(usuario_id=uid, unidade=nome) for uid, nome in linhas]
+        )
+
+
+def _responsaveis_do_setor(setor):
+    """Gerente do setor + coordenador do departamento ao qual ele pertence"""
+    coordenador_id = (
+        Departamento.objects.filter(pk=setor.departamento_id)
+        .values_list("responsavel_id", flat=True)
+        .first()
+    )
+    return {setor.responsavel_id, coordenador_id}
+
+
+@receiver(pre_save, sender=Setor)
+def guardar_responsaveis_antigos_setor(sender, instance, **kwargs):
+    # Guarda quem perdia acesso antes da alteração (troca de gerente/departamento)
+    instance._responsaveis_antigos = set()
+    if instance.pk:
+        antigo = Setor.objects.filter(pk=instance.pk).first()
+        if antigo:
+            instance._responsaveis_antigos = _responsaveis_do_setor(antigo)
+
+
+@receiver(post_save, sender=Setor)
+def atualizar_jurisdicao_setor(sender, instance, **kwargs):
+    antigos = getattr(instance, "_responsaveis_antigos", set())
+    recalcular_jurisdicao(antigos | _responsaveis_do_setor(instance))
+
+
+@receiver(pre_delete, sender=Setor)
+def guardar_responsaveis_setor_removido(sender, instance, **kwargs):
+    instance._responsaveis_antigos = _responsaveis_do_setor(instance)
+
+
+@receiver(post_delete, sender=Setor)
+def atualizar_jurisdicao_setor_removido(sender, instance, **kwargs):
+    recalcular_jurisdicao(getattr(instance, "_responsaveis_antigos", set()))
+
+
+@receiver(pre_save, sender=Departamento)
+def guardar_responsavel_antigo_departamento(sender, instance, **kwargs):
+    instance._responsavel_antigo = None
+    if instance.pk:
+        instance._responsavel_antigo = (
+            Departamento.objects.filter(pk=instance.pk)
+            .values_list("responsavel_id", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Departamento)
+def atualizar_jurisdicao_departamento(sender, instance, **kwargs):
+    recalcular_jurisdicao(
+        {getattr(instance, "_responsavel_antigo", None), instance.responsavel_id}
+    )
+
+
+@receiver(post_delete, sender=Departamento)
+def atualizar_jurisdicao_departamento_removido(sender, instance, **kwargs):
+    recalcular_jurisdicao({instance.responsavel_id})
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def atualizar_jurisdicao_grupos(sender, instance, action, reverse, pk_set, **kwargs):
+    """Entrada/saída de Gerentes/Coordenadores também refaz o índice"""
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        # group.user_set.add(...): instance é o Group, pk_set são os usuários
+        usuario_ids = pk_set or set()
+    else:
+        usuario_ids = {instance.pk}
+    recalcular_jurisdicao(usuario_ids)
+
+
+# ====================================================================
+# 2. CONTADORES DE STATUS (CARDS DO DASHBOARD)
+# ====================================================================
+
+
+def ajustar_contador(unidade, status, delta):
+    """Soma delta ao contador (unidade, status), criando a linha se preciso"""
+    contadores = ContadorStatus.objects.filter(unidade=unidade, status=status)
+    if not contadores.update(total=F("total") + delta):
+        ContadorStatus.objects.get_or_create(unidade=unidade, status=status)
+        contadores.update(total=F("total") + delta)
+
+
+@receiver(pre_save, sender=Solicitacao)
+def guardar_status_antigo(sender, instance, **kwargs):
+    # Uma leitura só para os contadores (unidade, status) e os anexos anteriores
+    instance._contagem_antiga = None
+    instance._anexos_antigos = {}
+    if instance.pk:
+        antiga = (
+            Solicitacao.objects.filter(pk=instance.pk)
+            .values_list("unidade", "status", *CAMPOS_ANEXO)
+            .first()
+        )
+        if antiga:
+            instance._contagem_antiga = antiga[:2]
+            instance._anexos_antigos = dict(zip(CAMPOS_ANEXO, antiga[2:]))
+
+
+@receiver(post_save, sender=Solicitacao)
+def atualizar_contadores(sender, instance, **kwargs):
+    antiga = getattr(instance, "_contagem_antiga", None)
+    nova = (instance.unidade, instance.status)
+    if antiga == nova:
+        return
+    if antiga:
+        ajustar_contador(*antiga, -1)
+    ajustar_contador(*nova, 1)
+
+
+@receiver(post_delete, sender=Solicitacao)
+def atualizar_contadores_removida(sender, instance, **kwargs):
+    ajustar_contador(instance.unidade, instance.status, -1)
+
+
+# ====================================================================
+# 3. CARIMBOS DE VERSÃO DAS LISTAGENS (ETag / 304)
+# ====================================================================
+
+
+def registrar_alteracao(unidades, usuario_id):
+    """
+    Marca como alteradas as unidades informadas e a lista do dono do pedido.
+    A visão do admin segue a própria sequência de alterações, que já avança
+    em Solicitacao.save().
+    """
+    agora = timezone.now()
+    for unidade in {u for u in unidades if u}:
+        VersaoLista.incrementar("UNIDADE", unidade, agora)
+    VersaoLista.incrementar("USUARIO", str(usuario_id), agora)
+
+
+@receiver(post_save, sender=Solicitacao)
+def atualizar_versoes(sender, instance, **kwargs):
+    antiga = getattr(instance, "_contagem_antiga", None)
+    unidades = {instance.unidade, antiga[0] if antiga else None}
+    registrar_alteracao(unidades, instance.usuario_id)
+
+
+@receiver(post_delete, sender=Solicitacao)
+def atualizar_versoes_removida(sender, instance, **kwargs):
+    # Exclusão também avança a sequência: muda a ETag da lista do admin
+    SequenciaAlteracao.proxima()
+    registrar_alteracao({instance.unidade}, instance.usuario_id)
+
+
+# ====================================================================
+# 4. EVENTOS EM TEMPO REAL (SSE)
+# ====================================================================
+
+
+@receiver(post_save, sender=Solicitacao)
+def avisar_eventos(sender, instance, **kwargs):
+    # Acorda na hora o hub SSE deste processo; os outros workers recebem a
+    # alteração pelo polling da sequência
+    transaction.on_commit(hub.notificar)
+
+
+# ====================================================================
+# 5. CACHE DE AUTENTICAÇÃO POR TOKEN
+# ====================================================================
+
+
+@receiver(post_delete, sender=Token)
+def invalidar_token_removido(sender, instance, **kwargs):
+    tokens_em_cache.remover(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidar_tokens_usuario(sender, instance, **kwargs):
+    # Troca de senha (ChangePasswordView / ConfirmarResetSenhaView), desativação...
+    invalidar_usuario(instance.pk)
+
+
+# ====================================================================
+# 6. CACHE DE PAPÉIS (dispensas/papeis.py)
+# ====================================================================
+
+
+@receiver(post_save, sender=Setor)
+@receiver(post_delete, sender=Setor)
+def invalidar_papeis_setor(sender, instance, **kwargs):
+    antigos = getattr(instance, "_responsaveis_antigos", set())
+    invalidar_papeis(antigos | {instance.responsavel_id})
+
+
+@receiver(post_save, sender=Departamento)
+@receiver(post_delete, sender=Departamento)
+def invalidar_papeis_departamento(sender, instance, **kwargs):
+    invalidar_papeis(
+        {getattr(instance, "_responsavel_antigo", None), instance.responsavel_id}
+    )
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidar_papeis_grupos(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        invalidar_papeis({instance.pk})
+    elif pk_set is None:
+        # group.user_set.clear(): não sabemos quem saiu
+        papeis_em_cache.limpar()
+    else:
+        invalidar_papeis(pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidar_papeis_grupo_alterado(sender, instance, **kwargs):
+    # Grupo renomeado/apagado: os vínculos somem sem m2m_changed
+    if not kwargs.get("created"):
+        papeis_em_cache.limpar()
+
+
+@receiver(post_save, sender=User)
+def invalidar_papeis_usuario(sender, instance, **kwargs):
+    # Ex: is_superuser alterado no admin
+    invalidar_papeis({instance.pk})
+
+
+# ====================================================================
+# 7. CACHE DE PDFs (dispensas/pdf.py)
+# Alterações na própria solicitação já mudam a chave (seq_alteracao); aqui
+# ficam a remoção e as mudanças no dono do pedido, que também saem no PDF.
+# ====================================================================
+
+
+@receiver(post_delete, sender=Solicitacao)
+def remover_pdf_solicitacao(sender, instance, **kwargs):
+    pdfs_em_cache.remover([instance.pk])
+
+
+@receiver(post_save, sender=Solicitacao)
+def pre_renderizar_aprovada(sender, instance, **kwargs):
+    # Aprovação gravada com save() (ex: admin do Django); as transições da
+    # API agendam pelo transicoes.EfeitosTransicao
+    antiga = getattr(instance, "_contagem_antiga", None)
+    if instance.status == "APROVADO" and (antiga is None or antiga[1] != "APROVADO"):
+        agendar_pre_renderizacao([instance.pk])
+
+
+def remover_pdfs_usuario(usuario_id):
+    pks = Solicitacao.objects.filter(usuario_id=usuario_id).values_list("pk", flat=True)
+    pdfs_em_cache.remover(list(pks))
+
+
+@receiver(post_save, sender=User)
+def invalidar_pdfs_usuario(sender, instance, created, update_fields=None, **kwargs):
+    # O login só grava last_login, que não aparece no PDF
+    if created or (update_fields and set(update_fields) <= {"last_login"}):
+        return
+    remover_pdfs_usuario(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+def invalidar_pdfs_perfil(sender, instance, created, **kwargs):
+    if not created:
+        remover_pdfs_usuario(instance.user_id)
+
+
+# ====================================================================
+# 8. REFERÊNCIAS DOS ANEXOS DEDUPLICADOS (dispensas/armazenamento.py)
+# Vários pedidos podem apontar para o mesmo arquivo; ele só é apagado
+# (pela fila, dispensas.remover_anexo_orfao) quando a última referência sai.
+# ====================================================================
+
+
+def liberar_anexo(nome):
+    ArquivoAnexo.ajustar(nome, -1)
+    # Sem linha (arquivo anterior à contagem) também vai para a verificação
+    if not ArquivoAnexo.objects.filter(nome=nome, referencias__gt=0).exists():
+        enfileirar("dispensas.remover_anexo_orfao", {"nome": nome})
+
+
+@receiver(post_save, sender=Solicitacao)
+def contar_referencias_anexo(sender, instance, **kwargs):
+    antigos = getattr(instance, "_anexos_antigos", {})
+    for campo in CAMPOS_ANEXO:
+        antigo = antigos.get(campo) or ""
+        novo = getattr(instance, campo).name or ""
+        if antigo == novo:
+            continue
+        if novo:
+            ArquivoAnexo.ajustar(novo, 1)
+            if campo == "anexo" and tem_previa(novo):
+                enfileirar("dispensas.gerar_previa", {"nome": novo})
+        if antigo:
+            liberar_anexo(antigo)
+
+
+@receiver(post_delete, sender=Solicitacao)
+def liberar_anexo_removida(sender, instance, **kwargs):
+    for campo in CAMPOS_ANEXO:
+        if getattr(instance, campo):
+            liberar_anexo(getattr(instance, campo).name)
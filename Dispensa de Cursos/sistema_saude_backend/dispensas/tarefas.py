@@ -0,0 +1,83 @@
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import Q
+
+from tarefas.fila import enfileirar, tarefa
+
+from .armazenamento import armazenamento_anexos
+from .models import CAMPOS_ANEXO, ArquivoAnexo, Solicitacao
+from .pdf import pre_renderizar
+from .previa import chave_previa, previa_do_anexo, previas_em_cache
+
+# ====================================================================
+# TAREFAS EM SEGUNDO PLANO (executadas por `manage.py processar_tarefas`)
+# ====================================================================
+
+
+@tarefa("dispensas.pre_renderizar_pdf", timeout=120)
+def pre_renderizar_pdf(pk):
+    pre_renderizar(pk)
+
+
+@tarefa("dispensas.enviar_email", prioridade=10, max_tentativas=8)
+def enviar_email(assunto, mensagem, destinatarios):
+    # Falha de SMTP levanta exceção: a fila tenta de novo com backoff
+    send_mail(assunto, mensagem, settings.EMAIL_HOST_USER, destinatarios)
+
+
+@tarefa("dispensas.enviar_codigo_reset", prioridade=10, max_tentativas=8)
+def enviar_codigo_reset(usuario_id):
+    """
+    E-mail com o código de recuperação de senha. O código é gerado aqui, na
+    execução: a tarefa guarda só o id do usuário, nunca o código.
+    """
+    usuario = User.objects.filter(pk=usuario_id).first()
+    if usuario is None or not usuario.email:
+        return
+    codigo = default_token_generator.make_token(usuario)
+    send_mail(
+        "Recuperação de senha - Dispensa Digital",
+        f"Olá, {usuario.first_name}.\n\nSeu código de recuperação: {codigo}",
+        settings.EMAIL_HOST_USER,
+        [usuario.email],
+    )
+
+
+@tarefa("dispensas.remover_anexo_orfao", prioridade=-10)
+def remover_anexo_orfao(nome):
+    """
+    Apaga um arquivo deduplicado sem referências. Um envio do mesmo conteúdo
+    renova o mtime do arquivo antes de gravar a referência: dentro da
+    carência ele é mantido e a remoção volta para a fila.
+    """
+    carencia = getattr(settings, "ANEXOS_CARENCIA_REMOCAO", 3600)
+    with transaction.atomic():
+        em_uso = Q()
+        for campo in CAMPOS_ANEXO:
+            em_uso |= Q(**{campo: nome})
+        if Solicitacao.objects.filter(em_uso).exists():
+            return
+        try:
+            idade = time.time() - os.path.getmtime(armazenamento_anexos.path(nome))
+        except FileNotFoundError:
+            idade = None
+        if idade is not None and idade < carencia:
+            enfileirar(
+                "dispensas.remover_anexo_orfao", {"nome": nome}, atraso=carencia - idade
+            )
+            return
+        ArquivoAnexo.objects.filter(nome=nome, referencias=0).delete()
+    armazenamento_anexos.delete(nome)
+    previas_em_cache.remover([chave_previa(nome)[0]])
+
+
+@tarefa("dispensas.gerar_previa", prioridade=-5, timeout=60)
+def gerar_previa(nome):
+    # Anexo novo: a miniatura já está pronta quando o gestor abrir o pedido
+    previa_do_anexo(nome)
@@ -1,3 +1,1563 @@
-from django.test import TestCase
+import hashlib
+import io
+import itertools
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+import unittest
+import zipfile
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from pypdf import PdfReader
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from tarefas import fila
+from tarefas.models import Tarefa
+
+from .authentication import CachedTokenAuthentication, tokens_em_cache
+from .eventos import hub
+from .models import (
+    ArquivoAnexo,
+    ContadorStatus,
+    Departamento,
+    SequenciaAlteracao,
+    Setor,
+    Solicitacao,
+    UserProfile,
+    VersaoLista,
+)
+from .pdf import (
+    desenhar_solicitacao,
+    pdf_da_solicitacao,
+    pdfs_em_cache,
+    pre_renderizar,
+    renderizar_pdf,
+    resposta_pdf,
+)
+from .papeis import COORDENADOR, GERENTE, papeis_do_usuario, papeis_em_cache
+from .previa import previas_em_cache
+from .signals import recalcular_jurisdicao
+from .tarefas import enviar_codigo_reset, remover_anexo_orfao
+from .transicoes import aplicar_transicao, transicao_aprovar
+
+SENHA = "Saude@123"
+
+# MEDIA_ROOT e pasta dos caches descartáveis: anexos, PDFs e miniaturas vão
+# para o disco
+MEDIA_TESTE = tempfile.mkdtemp(prefix="dispensas_media_")
+CACHE_TESTE = tempfile.mkdtemp(prefix="dispensas_cache_")
+PASTAS_TESTE = {
+    "MEDIA_ROOT": MEDIA_TESTE,
+    "PDF_CACHE_DIR": os.path.join(CACHE_TESTE, "pdf"),
+    "PREVIA_CACHE_DIR": os.path.join(CACHE_TESTE, "previas"),
+}
+
+STATUS_SORTEIO = [
+    "PENDENTE_GERENTE",
+    "PENDENTE_COORD",
+    "PENDENTE_ADMIN",
+    "APROVADO",
+    "INDEFERIDO",
+]
+
+DATA_APROVACAO_POR_PAPEL = {
+    "admin": "data_aprovacao_admin",
+    "coordenador": "data_aprovacao_coordenador",
+    "gerente": "data_aprovacao_gerente",
+}
+
+PAPEIS_FRONTEND = {
+    "admin": "admin",
+    "coordenador": "coordinator",
+    "gerente": "manager",
+    "servidor": "user",
+}
+
+
+# ====================================================================
+# HIERARQUIA PEQUENA E CLIENTES POR PAPEL (TESTES FUNCIONAIS)
+# ====================================================================
+
+
+def criar_hierarquia():
+    """
+    Dois departamentos, três setores e dois pedidos de cada status por setor
+    (um do servidor de teste), criados pelo ORM normal para os signals
+    manterem jurisdições, contadores e carimbos.
+    """
+    grupo_gerentes, _ = Group.objects.get_or_create(name="Gerentes")
+    grupo_coord, _ = Group.objects.get_or_create(name="Coordenadores")
+
+    def novo_usuario(matricula, nome):
+        usuario = User.objects.create_user(
+            username=matricula, password=SENHA, first_name=nome
+        )
+        UserProfile.objects.create(user=usuario, cargo="Servidor", unidade="Rede")
+        return usuario
+
+    coordenador = novo_usuario("100", "Coordenador")
+    outro_coordenador = novo_usuario("101", "Outro Coordenador")
+    gerente = novo_usuario("200", "Gerente")
+    outro_gerente = novo_usuario("201", "Outro Gerente")
+    servidor = novo_usuario("300", "Servidor")
+    colega = novo_usuario("301", "Colega")
+    grupo_coord.user_set.add(coordenador, outro_coordenador)
+    grupo_gerentes.user_set.add(gerente, outro_gerente)
+
+    departamento = Departamento.objects.create(
+        nome="Departamento 0", responsavel=coordenador
+    )
+    outro_departamento = Departamento.objects.create(
+        nome="Departamento 1", responsavel=outro_coordenador
+    )
+    setores = [
+        Setor.objects.create(
+            nome="Setor 0", departamento=departamento, responsavel=gerente
+        ),
+        Setor.objects.create(nome="Setor 1", departamento=departamento),
+        Setor.objects.create(
+            nome="Setor 2", departamento=outro_departamento, responsavel=outro_gerente
+        ),
+    ]
+
+    inicio = date(2025, 1, 1)
+    combinacoes = itertools.product(STATUS_SORTEIO, setores, (servidor, colega))
+    for i, (status, setor, dono) in enumerate(combinacoes):
+        Solicitacao.objects.create(
+            usuario=dono,
+            matricula=dono.username,
+            unidade=setor.nome,
+            cargo="Servidor",
+            nome_evento=f"Evento {i}",
+            objetivo="Capacitação profissional",
+            data_inicio=inicio + timedelta(days=i),
+            data_fim=inicio + timedelta(days=i + 2),
+            cidade="São José do Rio Preto",
+            estado="SP",
+            status=status,
+        )
+
+    admin = User.objects.create_superuser(
+        username="1", password=SENHA, first_name="Secretario"
+    )
+    UserProfile.objects.create(user=admin, cargo="Secretário", unidade="SMS")
+
+    return {
+        "admin": admin,
+        "coordenador": coordenador,
+        "gerente": gerente,
+        "servidor": servidor,
+    }
+
+
+class ClientesPorPapelMixin:
+    """
+    Clientes autenticados por papel (self.usuarios / self.tokens) e os
+    caches de tokens e papéis quentes, como no regime normal.
+    """
+
+    def setUp(self):
+        shutil.rmtree(pdfs_em_cache.pasta, ignore_errors=True)
+        shutil.rmtree(os.path.join(MEDIA_TESTE, "anexos"), ignore_errors=True)
+        shutil.rmtree(previas_em_cache.pasta, ignore_errors=True)
+        tokens_em_cache.limpar()
+        papeis_em_cache.limpar()
+        for chave in self.tokens.values():
+            CachedTokenAuthentication().authenticate_credentials(chave)
+        for usuario in self.usuarios.values():
+            papeis_do_usuario(usuario)
+
+    @classmethod
+    def criar_tokens(cls):
+        cls.tokens = {
+            papel: Token.objects.create(user=u).key for papel, u in cls.usuarios.items()
+        }
+
+    def cliente(self, papel):
+        cliente = APIClient()
+        cliente.credentials(HTTP_AUTHORIZATION=f"Token {self.tokens[papel]}")
+        return cliente
+
+    def solicitacao_visivel(self, papel, status):
+        """Uma solicitação no status pedido dentro da jurisdição do papel"""
+        usuario = self.usuarios[papel]
+        if papel == "admin":
+            filtro = {}
+        elif papel == "servidor":
+            filtro = {"usuario": usuario}
+        else:
+            filtro = {"unidade__in": usuario.jurisdicoes.values("unidade")}
+        return Solicitacao.objects.filter(status=status, **filtro).first()
+
+    def enviar_anexo(self, nome_arquivo, conteudo):
+        """Cria uma solicitação do servidor com o anexo e devolve a instância"""
+        servidor = self.usuarios["servidor"]
+        dados = {
+            "usuario": servidor.pk,
+            "matricula": servidor.username,
+            "unidade": "Setor 1",
+            "cargo": "Servidor",
+            "nome_evento": "Congresso",
+            "objetivo": "Capacitação",
+            "data_inicio": "2026-03-10",
+            "data_fim": "2026-03-12",
+            "cidade": "São Paulo",
+            "estado": "SP",
+            "anexo": SimpleUploadedFile(nome_arquivo, conteudo),
+        }
+        resposta = self.cliente("servidor").post(
+            "/api/solicitacoes/", dados, format="multipart"
+        )
+        self.assertEqual(resposta.status_code, 201, resposta.content)
+        return Solicitacao.objects.get(pk=resposta.json()["id"])
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    **PASTAS_TESTE,
+)
+class HierarquiaTestCase(ClientesPorPapelMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuarios = criar_hierarquia()
+        cls.criar_tokens()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_TESTE, ignore_errors=True)
+        shutil.rmtree(CACHE_TESTE, ignore_errors=True)
+
+
+# ====================================================================
+# LISTAGEM
+# ====================================================================
+
+
+class ListaTests(HierarquiaTestCase):
+    def test_lista_etag_muda_com_alteracao_visivel(self):
+        cliente = self.cliente("gerente")
+        etag = cliente.get("/api/solicitacoes/")["ETag"]
+
+        # Alteração fora da jurisdição do gerente: continua 304
+        fora = Solicitacao.objects.exclude(
+            unidade__in=self.usuarios["gerente"].jurisdicoes.values("unidade")
+        ).first()
+        fora.nome_evento = "Alterado"
+        fora.save()
+        resposta = cliente.get("/api/solicitacoes/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+
+        # Alteração dentro da jurisdição: lista nova
+        dentro = self.solicitacao_visivel("gerente", "PENDENTE_GERENTE")
+        dentro.nome_evento = "Alterado"
+        dentro.save()
+        resposta = cliente.get("/api/solicitacoes/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta["ETag"], etag)
+
+    def test_lista_etag_muda_com_jurisdicao(self):
+        gerente = self.usuarios["gerente"]
+        cliente = self.cliente("gerente")
+        # Unidade cujos pedidos são de antes dos carimbos (sem VersaoLista)
+        setor = Setor.objects.filter(responsavel__isnull=True).first()
+        VersaoLista.objects.filter(escopo="UNIDADE", chave=setor.nome).delete()
+        etag = cliente.get("/api/solicitacoes/")["ETag"]
+
+        # Ganhou a unidade: a lista muda mesmo sem carimbo novo
+        setor.responsavel = gerente
+        setor.save()
+        resposta = cliente.get("/api/solicitacoes/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(
+            any(linha["unidade"] == setor.nome for linha in resposta.json()["results"])
+        )
+
+        # Perdeu a unidade: volta ao ETag de antes
+        setor.responsavel = None
+        setor.save()
+        resposta = cliente.get("/api/solicitacoes/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+
+
+class PaginacaoCursorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.servidor = User.objects.create_user(username="20001", password=SENHA)
+        UserProfile.objects.create(user=cls.servidor, cargo="Servidor", unidade="Rede")
+        cls.token = Token.objects.create(user=cls.servidor).key
+        # 7 pedidos em só duas datas: os empates atravessam as páginas
+        Solicitacao.objects.bulk_create(
+            [
+                Solicitacao(
+                    usuario=cls.servidor,
+                    matricula=cls.servidor.username,
+                    unidade="Setor 0",
+                    cargo="Servidor",
+                    nome_evento=f"Evento {i}",
+                    objetivo="Capacitação profissional",
+                    data_inicio=date(2024, 1, 1 + i % 2),
+                    data_fim=date(2024, 1, 5),
+                    cidade="São José do Rio Preto",
+                    estado="SP",
+                )
+                for i in range(7)
+            ]
+        )
+
+    def percorrer(self, url):
+        cliente = APIClient()
+        cliente.credentials(HTTP_AUTHORIZATION=f"Token {self.token}")
+        ids = []
+        while url:
+            resposta = cliente.get(url)
+            self.assertEqual(resposta.status_code, 200)
+            ids += [item["id"] for item in resposta.json()["results"]]
+            url = resposta.json()["next"]
+        return ids
+
+    def test_ordenacao_por_data_com_empates(self):
+        for ordenacao in ["data_inicio", "-data_inicio", "data_solicitacao"]:
+            with self.subTest(ordering=ordenacao):
+                ids = self.percorrer(
+                    f"/api/solicitacoes/?ordering={ordenacao}&page_size=2"
+                )
+                esperado = Solicitacao.objects.order_by(
+                    ordenacao, "-id" if ordenacao.startswith("-") else "id"
+                ).values_list("id", flat=True)
+                self.assertEqual(ids, list(esperado))
+
+
+# ====================================================================
+# SINCRONIZAÇÃO INCREMENTAL (/changes/ E SSE)
+# ====================================================================
+
+
+class SincronizacaoTests(HierarquiaTestCase):
+    def test_changes(self):
+        for papel in self.usuarios:
+            with self.subTest(papel=papel):
+                cliente = self.cliente(papel)
+                token = cliente.get("/api/solicitacoes/changes/").json()["token"]
+
+                solicitacao = self.solicitacao_visivel(papel, "APROVADO")
+                solicitacao.objetivo = "Atualizado"
+                solicitacao.save(update_fields=["objetivo"])
+
+                resposta = cliente.get("/api/solicitacoes/changes/", {"since": token})
+                self.assertEqual(resposta.status_code, 200)
+                dados = resposta.json()
+                self.assertEqual([s["id"] for s in dados["results"]], [solicitacao.pk])
+                self.assertGreater(dados["token"], token)
+
+                # Nada mudou desde o novo token
+                vazio = cliente.get(
+                    "/api/solicitacoes/changes/", {"since": dados["token"]}
+                ).json()
+                self.assertEqual(vazio["results"], [])
+
+        resposta = self.cliente("admin").get(
+            "/api/solicitacoes/changes/", {"since": "x"}
+        )
+        self.assertEqual(resposta.status_code, 400)
+
+    def test_sequencia(self):
+        # Cada escrita é 1 INSERT na sequência (sem linha global disputada)
+        solicitacao = self.solicitacao_visivel("admin", "APROVADO")
+        antes = SequenciaAlteracao.atual()
+        with CaptureQueriesContext(connection) as contexto:
+            solicitacao.save(update_fields=["objetivo"])
+        sequencia = [
+            q["sql"]
+            for q in contexto.captured_queries
+            if "dispensas_sequenciaalteracao" in q["sql"]
+        ]
+        self.assertEqual(len(sequencia), 1)
+        self.assertEqual(solicitacao.seq_alteracao, antes + 1)
+
+        # Exclusão também avança (ETag da lista do admin muda)
+        cliente = self.cliente("admin")
+        etag = cliente.get("/api/solicitacoes/")["ETag"]
+        solicitacao.delete()
+        self.assertEqual(SequenciaAlteracao.atual(), antes + 2)
+        resposta = cliente.get("/api/solicitacoes/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+
+        # Poda: as linhas antigas saem, a numeração não recomeça
+        with mock.patch.object(SequenciaAlteracao, "PODAR_A_CADA", 1):
+            numero = SequenciaAlteracao.proxima()
+        ids = SequenciaAlteracao.objects.values_list("id", flat=True)
+        self.assertEqual(list(ids), [numero])
+        SequenciaAlteracao.objects.all().delete()
+        self.assertEqual(SequenciaAlteracao.proxima(), numero + 1)
+
+    async def test_eventos(self):
+        # Aba reconectando (Last-Event-ID): recebe o que perdeu, só da jurisdição
+        desde = await sync_to_async(SequenciaAlteracao.atual)()
+        visivel = await sync_to_async(self.solicitacao_visivel)("gerente", "APROVADO")
+        fora = await sync_to_async(
+            Solicitacao.objects.exclude(
+                unidade__in=self.usuarios["gerente"].jurisdicoes.values("unidade")
+            )
+            .exclude(usuario=self.usuarios["gerente"])
+            .first
+        )()
+        for solicitacao in (fora, visivel):
+            solicitacao.objetivo = "Atualizado"
+            await sync_to_async(solicitacao.save)(update_fields=["objetivo"])
+
+        resposta = await AsyncClient().get(
+            "/api/solicitacoes/eventos/",
+            {"token": self.tokens["gerente"]},
+            headers={"Last-Event-ID": str(desde)},
+        )
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta["Content-Type"], "text/event-stream")
+
+        fluxo = aiter(resposta.streaming_content)
+        self.assertEqual(await anext(fluxo), b"retry: 5000\n\n")
+        evento = (await anext(fluxo)).decode()
+        self.assertIn(f"id: {visivel.seq_alteracao}\n", evento)
+        self.assertEqual(json.loads(evento.split("data: ", 1)[1])["id"], visivel.pk)
+        # Fim da resposta (como o servidor faz): a assinatura sai do hub
+        resposta.close()
+        if hub._tarefa is not None:
+            await hub._tarefa
+
+        # Fora do ASGI (WSGI) e sem token a conexão é recusada
+        resposta = await sync_to_async(self.client.get)(
+            "/api/solicitacoes/eventos/", {"token": self.tokens["gerente"]}
+        )
+        self.assertEqual(resposta.status_code, 501)
+        resposta = await AsyncClient().get("/api/solicitacoes/eventos/")
+        self.assertEqual(resposta.status_code, 401)
+
+
+# ====================================================================
+# AUTENTICAÇÃO E PAPÉIS
+# ====================================================================
+
+
+class AutenticacaoTests(HierarquiaTestCase):
+    def test_login(self):
+        for papel, usuario in self.usuarios.items():
+            with self.subTest(papel=papel):
+                resposta = APIClient().post(
+                    "/api/login/", {"username": usuario.username, "password": SENHA}
+                )
+                self.assertEqual(resposta.status_code, 200)
+                self.assertEqual(
+                    resposta.json()["usuario"]["role"], PAPEIS_FRONTEND[papel]
+                )
+
+    def test_cache_token_invalidado(self):
+        chave = self.tokens["servidor"]
+        resposta = self.cliente("servidor").post(
+            "/api/alterar-senha/",
+            {
+                "old_password": SENHA,
+                "new_password": "nova",
+                "confirm_password": "nova",
+            },
+        )
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotIn(chave, tokens_em_cache)
+
+        servidor = User.objects.get(pk=self.usuarios["servidor"].pk)
+        servidor.is_active = False
+        servidor.save()
+        resposta = self.cliente("servidor").get("/api/meus-dados/")
+        self.assertEqual(resposta.status_code, 401)
+
+    def test_papel_invalidado(self):
+        servidor = self.usuarios["servidor"]
+        self.assertEqual(papeis_do_usuario(servidor), 0)
+
+        # Virou responsável por um setor: passa a ser gerente sem estar no grupo
+        setor = Setor.objects.exclude(responsavel=servidor).first()
+        setor.responsavel = servidor
+        setor.save()
+        self.assertEqual(papeis_do_usuario(servidor), GERENTE)
+
+        setor.delete()
+        self.assertEqual(papeis_do_usuario(servidor), 0)
+
+        servidor.groups.add(Group.objects.get(name="Coordenadores"))
+        self.assertEqual(papeis_do_usuario(servidor), COORDENADOR)
+
+    def test_reset_senha(self):
+        servidor = self.usuarios["servidor"]
+        servidor.email = "servidor@saude.example"
+        servidor.save()
+        resposta = APIClient().post(
+            "/api/recuperar-senha/solicitar/", {"matricula": servidor.username}
+        )
+        self.assertEqual(resposta.status_code, 200)
+
+        # A fila guarda só o id: o código é gerado na execução da tarefa
+        tarefa = Tarefa.objects.get(nome="dispensas.enviar_codigo_reset")
+        self.assertEqual(tarefa.argumentos, {"usuario_id": servidor.pk})
+        enviar_codigo_reset(**tarefa.argumentos)
+        self.assertEqual(mail.outbox[-1].to, [servidor.email])
+        codigo = mail.outbox[-1].body.rsplit(": ", 1)[1]
+
+        resposta = APIClient().post(
+            "/api/recuperar-senha/confirmar/",
+            {"uid": resposta.json()["uid"], "token": codigo, "new_password": "nova"},
+        )
+        self.assertEqual(resposta.status_code, 200)
+        servidor.refresh_from_db()
+        self.assertTrue(servidor.check_password("nova"))
+
+
+# ====================================================================
+# TRANSIÇÕES DE STATUS
+# ====================================================================
+
+
+class TransicaoTests(HierarquiaTestCase):
+    def test_aprovar(self):
+        status_por_papel = {
+            "admin": "PENDENTE_ADMIN",
+            "coordenador": "PENDENTE_COORD",
+            "gerente": "PENDENTE_GERENTE",
+            "servidor": "PENDENTE_GERENTE",
+        }
+        for papel, status in status_por_papel.items():
+            with self.subTest(papel=papel):
+                solicitacao = self.solicitacao_visivel(papel, status)
+                resposta = self.cliente(papel).post(
+                    f"/api/solicitacoes/{solicitacao.pk}/aprovar/"
+                )
+                self.assertEqual(
+                    resposta.status_code, 403 if papel == "servidor" else 200
+                )
+                if papel != "servidor":
+                    solicitacao.refresh_from_db()
+                    self.assertNotEqual(solicitacao.status, status)
+                    self.assertIsNotNone(
+                        getattr(solicitacao, DATA_APROVACAO_POR_PAPEL[papel])
+                    )
+
+    def test_transicao_concorrente(self):
+        # Dois gerentes leram a mesma solicitação; só o primeiro UPDATE vale
+        gerente = self.usuarios["gerente"]
+        solicitacao = self.solicitacao_visivel("gerente", "PENDENTE_GERENTE")
+        copia = Solicitacao.objects.get(pk=solicitacao.pk)
+        contadores_antes = dict(
+            ContadorStatus.objects.filter(unidade=solicitacao.unidade).values_list(
+                "status", "total"
+            )
+        )
+
+        primeira = transicao_aprovar(solicitacao, gerente, GERENTE)
+        self.assertTrue(aplicar_transicao(solicitacao, primeira))
+        segunda = transicao_aprovar(copia, gerente, GERENTE)
+        self.assertFalse(aplicar_transicao(copia, segunda))
+
+        contadores = dict(
+            ContadorStatus.objects.filter(unidade=solicitacao.unidade).values_list(
+                "status", "total"
+            )
+        )
+        self.assertEqual(
+            contadores["PENDENTE_GERENTE"], contadores_antes["PENDENTE_GERENTE"] - 1
+        )
+        self.assertEqual(
+            contadores["PENDENTE_COORD"], contadores_antes["PENDENTE_COORD"] + 1
+        )
+
+    def test_bulk_transition(self):
+        gerente = self.usuarios["gerente"]
+        pendentes = list(
+            Solicitacao.objects.filter(
+                status="PENDENTE_GERENTE",
+                unidade__in=gerente.jurisdicoes.values("unidade"),
+            ).values_list("id", flat=True)
+        )
+        ja_aprovada = self.solicitacao_visivel("gerente", "APROVADO").pk
+        fora = (
+            Solicitacao.objects.exclude(
+                unidade__in=gerente.jurisdicoes.values("unidade")
+            )
+            .exclude(usuario=gerente)
+            .values_list("id", flat=True)
+            .first()
+        )
+
+        resposta = self.cliente("gerente").post(
+            "/api/solicitacoes/bulk-transition/",
+            {"ids": pendentes + [ja_aprovada, fora], "acao": "aprovar"},
+            format="json",
+        )
+        self.assertEqual(resposta.status_code, 200)
+        dados = resposta.json()
+        codigos = {r["id"]: r["codigo"] for r in dados["resultados"]}
+        self.assertEqual(dados["sucesso"], len(pendentes))
+        self.assertEqual(codigos[ja_aprovada], 403)
+        self.assertEqual(codigos[fora], 404)
+        self.assertFalse(
+            Solicitacao.objects.filter(pk__in=pendentes)
+            .exclude(status="PENDENTE_COORD")
+            .exists()
+        )
+
+        resposta = self.cliente("gerente").post(
+            "/api/solicitacoes/bulk-transition/",
+            {"ids": pendentes, "acao": "apagar"},
+            format="json",
+        )
+        self.assertEqual(resposta.status_code, 400)
+
+
+# ====================================================================
+# PDF DA DISPENSA E CACHE EM DISCO
+# ====================================================================
+
+
+class PdfTests(HierarquiaTestCase):
+    def test_pdf(self):
+        solicitacao = self.solicitacao_visivel("servidor", "APROVADO")
+        url = f"/api/solicitacoes/{solicitacao.pk}/pdf/"
+        resposta = self.cliente("servidor").get(url)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta["Content-Type"], "application/pdf")
+        primeiro = b"".join(resposta.streaming_content)
+
+        # Segundo download: arquivo estático do cache, sem renderizar
+        with self.assertNumQueries(1):
+            resposta = self.cliente("servidor").get(url)
+        self.assertEqual(b"".join(resposta.streaming_content), primeiro)
+
+        # Sem login, ou fora do que o usuário enxerga, o PDF não sai
+        self.assertEqual(APIClient().get(url).status_code, 401)
+        alheia = Solicitacao.objects.exclude(usuario=self.usuarios["servidor"]).first()
+        resposta = self.cliente("servidor").get(f"/api/solicitacoes/{alheia.pk}/pdf/")
+        self.assertEqual(resposta.status_code, 404)
+
+    def test_pdf_podado_antes_de_abrir(self):
+        solicitacao = self.solicitacao_visivel("servidor", "APROVADO")
+        original = pdf_da_solicitacao
+
+        def podado_na_primeira(*args):
+            # O cache poda o arquivo logo depois de devolver o caminho
+            caminho = original(*args)
+            if podado_na_primeira.vezes == 0:
+                os.remove(caminho)
+            podado_na_primeira.vezes += 1
+            return caminho
+
+        podado_na_primeira.vezes = 0
+        with mock.patch(
+            "dispensas.views.pdf_da_solicitacao", side_effect=podado_na_primeira
+        ):
+            resposta = self.cliente("servidor").get(
+                f"/api/solicitacoes/{solicitacao.pk}/pdf/"
+            )
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(b"".join(resposta.streaming_content).startswith(b"%PDF"))
+        self.assertEqual(podado_na_primeira.vezes, 2)
+
+    def test_pre_renderizacao_aprovado(self):
+        solicitacao = self.solicitacao_visivel("admin", "PENDENTE_ADMIN")
+        resposta = self.cliente("admin").post(
+            f"/api/solicitacoes/{solicitacao.pk}/aprovar/"
+        )
+        self.assertEqual(resposta.status_code, 200)
+        # A aprovação final grava a tarefa na mesma transação
+        tarefa = Tarefa.objects.get(
+            nome="dispensas.pre_renderizar_pdf", argumentos={"pk": solicitacao.pk}
+        )
+        self.assertEqual(tarefa.status, Tarefa.PENDENTE)
+
+        # O que o worker faz depois (a fila também tem as pré-renderizações
+        # dos pedidos criados já aprovados na hierarquia de teste)
+        reservada = next(t for t in fila.reservar(100) if t.pk == tarefa.pk)
+        fila.executar(reservada.nome, reservada.argumentos)
+        self.assertTrue(fila.concluir(reservada))
+        solicitacao.refresh_from_db()
+        self.assertIsNotNone(
+            pdfs_em_cache.obter(solicitacao.pk, solicitacao.seq_alteracao)
+        )
+
+        # O primeiro download já sai do cache
+        with self.assertNumQueries(1):
+            resposta = self.cliente("admin").get(
+                f"/api/solicitacoes/{solicitacao.pk}/pdf/"
+            )
+        self.assertEqual(resposta.status_code, 200)
+        b"".join(resposta.streaming_content)
+
+        # Transição que não finaliza não agenda nada
+        pendente = self.solicitacao_visivel("gerente", "PENDENTE_GERENTE")
+        self.cliente("gerente").post(f"/api/solicitacoes/{pendente.pk}/aprovar/")
+        self.assertFalse(Tarefa.objects.filter(argumentos={"pk": pendente.pk}).exists())
+
+    def test_pdf_timbre(self):
+        solicitacao = Solicitacao.objects.select_related(
+            "usuario", "usuario__profile"
+        ).get(pk=self.solicitacao_visivel("admin", "APROVADO").pk)
+        uma_pagina = renderizar_pdf(solicitacao)
+        self.assertIn(b"/FormXob.timbre_dispensa", uma_pagina)
+        # Brasão em JPEG (DCTDecode), lido da memória e não de arquivo em /tmp
+        self.assertIn(b"/DCTDecode", uma_pagina)
+
+        # Várias páginas no mesmo canvas: timbre e brasão entram uma vez só
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+        for _ in range(10):
+            desenhar_solicitacao(c, solicitacao)
+            c.showPage()
+        c.save()
+        self.assertLess(len(buffer.getvalue()), 3 * len(uma_pagina))
+
+    def test_pdf_cache_invalidado(self):
+        solicitacao = self.solicitacao_visivel("admin", "PENDENTE_ADMIN")
+        url = f"/api/solicitacoes/{solicitacao.pk}/pdf/"
+        cliente = self.cliente("admin")
+
+        b"".join(cliente.get(url).streaming_content)
+        antigo = pdfs_em_cache.caminho(solicitacao.pk, solicitacao.seq_alteracao)
+        self.assertTrue(os.path.exists(antigo))
+
+        # Aprovar muda a versão: o próximo download renderiza de novo com a
+        # assinatura e a versão antiga sai do disco
+        cliente.post(f"/api/solicitacoes/{solicitacao.pk}/aprovar/")
+        solicitacao.refresh_from_db()
+        pdf = b"".join(cliente.get(url).streaming_content)
+        self.assertFalse(os.path.exists(antigo))
+        atual = pdfs_em_cache.caminho(solicitacao.pk, solicitacao.seq_alteracao)
+        with open(atual, "rb") as arquivo:
+            self.assertEqual(arquivo.read(), pdf)
+
+        # Nome do dono alterado também sai no PDF
+        solicitacao.usuario.first_name = "Outro Nome"
+        solicitacao.usuario.save()
+        self.assertFalse(os.path.exists(atual))
+
+        b"".join(cliente.get(url).streaming_content)
+        solicitacao.delete()
+        self.assertFalse(os.path.exists(atual))
+
+        # Erro no meio da renderização não deixa arquivo (nem temporário)
+        with self.assertRaises(ValueError):
+            with pdfs_em_cache.escrever(solicitacao.pk, 1) as arquivo:
+                arquivo.write(b"%PDF-")
+                raise ValueError
+        self.assertEqual(os.listdir(pdfs_em_cache.pasta), [])
+
+        # Limite em bytes: só sobra o usado mais recentemente
+        maximo = pdfs_em_cache.maximo_bytes
+        pdfs_em_cache.maximo_bytes = 1
+        try:
+            os.utime(pdfs_em_cache.guardar(1, 1, b"a"), (0, 0))
+            pdfs_em_cache.guardar(2, 1, b"b")
+            self.assertIsNone(pdfs_em_cache.obter(1, 1))
+            self.assertIsNotNone(pdfs_em_cache.obter(2, 1))
+        finally:
+            pdfs_em_cache.maximo_bytes = maximo
+
+    def test_pdf_cache_sem_varredura(self):
+        pdfs_em_cache._pasta_contada = None  # Força a contagem inicial
+        pdfs_em_cache.guardar(1, 1, b"a")
+
+        # Abaixo do limite, gravar uma versão nova não varre a pasta inteira:
+        # só a da chave, para tirar a versão anterior
+        with mock.patch.object(
+            pdfs_em_cache, "_podar", wraps=pdfs_em_cache._podar
+        ) as podar:
+            for pk in range(2, 12):
+                pdfs_em_cache.guardar(pk, 1, b"x")
+                pdfs_em_cache.guardar(pk, 2, b"y")
+        self.assertEqual(podar.call_count, 0)
+        self.assertEqual(
+            os.listdir(pdfs_em_cache.pasta_da_chave(2)), [pdfs_em_cache.nome(2)]
+        )
+
+        # Invalidar lista só as pastas das chaves
+        with mock.patch("os.scandir", wraps=os.scandir) as scandir:
+            pdfs_em_cache.remover([2, 3])
+        self.assertEqual(
+            [chamada.args[0] for chamada in scandir.call_args_list],
+            [pdfs_em_cache.pasta_da_chave(2), pdfs_em_cache.pasta_da_chave(3)],
+        )
+        self.assertFalse(os.path.exists(pdfs_em_cache.pasta_da_chave(2)))
+        self.assertIsNotNone(pdfs_em_cache.obter(4, 2))
+
+    def test_pdf_cache_fora_de_media_root(self):
+        # /media/ é servido sem login: nem o padrão do cache pode cair lá
+        with self.settings():
+            del settings.PDF_CACHE_DIR
+            pasta = pdfs_em_cache.pasta
+        self.assertEqual(pasta, os.path.join(settings.BASE_DIR, "cache", "pdf"))
+        with self.settings():
+            del settings.PREVIA_CACHE_DIR
+            pasta = previas_em_cache.pasta
+        self.assertEqual(pasta, os.path.join(settings.BASE_DIR, "cache", "previas"))
+
+
+# ====================================================================
+# EXPORTAÇÃO EM LOTE (ZIP) E RELATÓRIO CONSOLIDADO
+# ====================================================================
+
+
+class ExportacaoTests(HierarquiaTestCase):
+    def test_export_zip(self):
+        gerente = self.usuarios["gerente"]
+        setor = Setor.objects.filter(responsavel=gerente).first()
+        amostra = Solicitacao.objects.filter(
+            unidade=setor.nome, status="APROVADO"
+        ).first()
+        de, ate = amostra.data_inicio, amostra.data_inicio + timedelta(days=90)
+        esperadas = set(
+            Solicitacao.objects.filter(
+                unidade=setor.nome,
+                status="APROVADO",
+                data_inicio__range=(de, ate),
+            ).values_list("id", flat=True)
+        )
+        self.assertGreater(len(esperadas), 1)
+        # Uma delas já está no cache de PDFs: entra no ZIP sem renderizar
+        pre_renderizar(amostra.pk)
+
+        url = (
+            f"/api/solicitacoes/export-zip/?setor={setor.pk}"
+            f"&data_inicio_de={de.isoformat()}&data_inicio_ate={ate.isoformat()}"
+        )
+        # Contagem + ids + um lote de 1 por documento: cada lote é lido por
+        # inteiro, nenhuma consulta fica aberta durante o streaming
+        with self.assertNumQueries(2 + len(esperadas)), mock.patch(
+            "dispensas.exportacao.LOTE_LEITURA", 1
+        ):
+            resposta = self.cliente("gerente").get(url)
+            self.assertEqual(resposta.status_code, 200)
+            self.assertEqual(resposta["Content-Type"], "application/zip")
+            conteudo = b"".join(resposta.streaming_content)
+
+        with zipfile.ZipFile(io.BytesIO(conteudo)) as zip_:
+            self.assertIsNone(zip_.testzip())
+            nomes = set(zip_.namelist())
+            self.assertEqual(nomes, {f"dispensa_{pk}.pdf" for pk in esperadas})
+            self.assertTrue(zip_.read(f"dispensa_{amostra.pk}.pdf").startswith(b"%PDF"))
+
+        resposta = self.cliente("gerente").get(
+            "/api/solicitacoes/export-zip/?departamento=abc"
+        )
+        self.assertEqual(resposta.status_code, 400)
+
+    async def test_export_zip_asgi(self):
+        # Sob ASGI o ZIP sai por um iterador assíncrono, pedaço a pedaço, sem
+        # o StreamingHttpResponse juntar tudo (sync_to_async(list)) antes
+        setor = await sync_to_async(
+            Setor.objects.filter(responsavel=self.usuarios["gerente"]).first
+        )()
+        esperadas = await sync_to_async(set)(
+            Solicitacao.objects.filter(
+                unidade=setor.nome, status="APROVADO"
+            ).values_list("id", flat=True)
+        )
+        self.assertGreater(len(esperadas), 1)
+
+        resposta = await AsyncClient().get(
+            f"/api/solicitacoes/export-zip/?setor={setor.pk}",
+            headers={"Authorization": f"Token {self.tokens['gerente']}"},
+        )
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.is_async)
+        pedacos = [pedaco async for pedaco in resposta.streaming_content]
+        self.assertGreater(len(pedacos), 1)
+
+        with zipfile.ZipFile(io.BytesIO(b"".join(pedacos))) as zip_:
+            self.assertIsNone(zip_.testzip())
+            self.assertEqual(
+                set(zip_.namelist()), {f"dispensa_{pk}.pdf" for pk in esperadas}
+            )
+
+    def test_relatorio_consolidado(self):
+        coordenador = self.usuarios["coordenador"]
+        departamento = Departamento.objects.filter(responsavel=coordenador).first()
+        de, ate = date(2025, 1, 1), date(2025, 12, 31)
+        esperadas = Solicitacao.objects.filter(
+            unidade__in=departamento.setores.values("nome"),
+            data_inicio__range=(de, ate),
+        ).count()
+        self.assertGreater(esperadas, 1)
+
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.cliente("coordenador").get(
+                f"/api/solicitacoes/relatorio/?departamento={departamento.pk}"
+                f"&data_inicio_de={de.isoformat()}&data_inicio_ate={ate.isoformat()}"
+            )
+            self.assertEqual(resposta.status_code, 200)
+            conteudo = b"".join(resposta.streaming_content)
+        # contagem, nome do departamento, retrato (resumo + índice), um lote de
+        # páginas; sem transação segurando a leitura durante a renderização
+        consultas = [consulta["sql"] for consulta in contexto.captured_queries]
+        self.assertEqual(len(consultas), 4, consultas)
+        self.assertFalse([sql for sql in consultas if "SAVEPOINT" in sql])
+
+        leitor = PdfReader(io.BytesIO(conteudo))
+        paginas_indice = -(-esperadas // 40)
+        self.assertEqual(len(leitor.pages), 1 + paginas_indice + esperadas)
+        self.assertEqual(len(leitor.outline), esperadas)
+        # A entrada do índice aponta para a página do pedido
+        self.assertEqual(
+            leitor.get_destination_page_number(leitor.outline[0]),
+            1 + paginas_indice,
+        )
+        # Resumo e pedidos carimbam o mesmo cabeçalho definido em pdf.py
+        for nome in (b"cabecalho_sms", b"timbre_dispensa"):
+            objetos = re.findall(rb"/FormXob\.%s (\d+) 0 R" % nome, conteudo)
+            self.assertTrue(objetos, nome)
+            self.assertEqual(len(set(objetos)), 1, nome)
+
+        # Acima de PDF_SPOOL_MAXIMO o PDF vai para arquivo em disco
+        with self.settings(PDF_SPOOL_MAXIMO=len(conteudo) // 2):
+            grande = resposta_pdf(lambda arquivo: arquivo.write(conteudo), "r.pdf")
+        self.assertTrue(grande.file_to_stream._rolled)
+        self.assertEqual(int(grande["Content-Length"]), len(conteudo))
+        self.assertEqual(b"".join(grande.streaming_content), conteudo)
+        grande.close()
+
+
+# ====================================================================
+# ANEXOS: DEDUPLICAÇÃO, MIGRAÇÃO, OTIMIZAÇÃO E PRÉ-VISUALIZAÇÃO
+# ====================================================================
+
+
+class AnexoTests(HierarquiaTestCase):
+    def test_anexo_deduplicado(self):
+        conteudo = b"PK convite do congresso" * 1000
+        digest = hashlib.sha256(conteudo).hexdigest()
+
+        # Mesmo arquivo enviado duas vezes (nomes diferentes): um só no disco
+        nomes = [
+            self.enviar_anexo(nome_arquivo, conteudo).anexo.name
+            for nome_arquivo in ("convite.DOCX", "convite (1).docx")
+        ]
+        nome = f"anexos/{digest[:2]}/{digest[2:4]}/{digest}.docx"
+        self.assertEqual(nomes, [nome, nome])
+        pasta = os.path.join(MEDIA_TESTE, "anexos")
+        self.assertEqual(
+            [
+                os.path.join(raiz, a)
+                for raiz, _, arquivos in os.walk(pasta)
+                for a in arquivos
+            ],
+            [os.path.join(MEDIA_TESTE, nome)],
+        )
+        self.assertEqual(ArquivoAnexo.objects.get(nome=nome).referencias, 2)
+
+        remocoes = Tarefa.objects.filter(nome="dispensas.remover_anexo_orfao")
+        pedidos = Solicitacao.objects.filter(anexo=nome)
+        pedidos.first().delete()
+        self.assertEqual(ArquivoAnexo.objects.get(nome=nome).referencias, 1)
+        self.assertFalse(remocoes.exists())
+
+        # Última referência: remoção vai para a fila, respeitando a carência
+        pedidos.first().delete()
+        self.assertEqual(remocoes.count(), 1)
+        remover_anexo_orfao(nome)
+        self.assertTrue(os.path.exists(os.path.join(MEDIA_TESTE, nome)))
+        self.assertEqual(remocoes.count(), 2)
+
+        with override_settings(ANEXOS_CARENCIA_REMOCAO=0):
+            remover_anexo_orfao(nome)
+        self.assertFalse(os.path.exists(os.path.join(MEDIA_TESTE, nome)))
+        self.assertFalse(ArquivoAnexo.objects.filter(nome=nome).exists())
+
+    def test_migrar_anexos(self):
+        # Layout antigo: pasta única, mesmo arquivo duas vezes com sufixo
+        pasta = os.path.join(MEDIA_TESTE, "anexos")
+        os.makedirs(pasta, exist_ok=True)
+        conteudo = b"\x89PNG brasao" * 500
+        for nome_arquivo in ("brasao.png", "brasao_goBryTr.png"):
+            with open(os.path.join(pasta, nome_arquivo), "wb") as arquivo:
+                arquivo.write(conteudo)
+        pedidos = list(
+            Solicitacao.objects.filter(usuario=self.usuarios["servidor"])[:3]
+        )
+        for pedido, antigo in zip(
+            pedidos, ["brasao.png", "brasao_goBryTr.png", "sumiu.pdf"]
+        ):
+            # update(): grava o nome antigo como estava, sem passar pelos signals
+            Solicitacao.objects.filter(pk=pedido.pk).update(anexo=f"anexos/{antigo}")
+
+        saida = io.StringIO()
+        call_command("migrar_anexos", "--lote", "2", stdout=saida, stderr=io.StringIO())
+        self.assertIn("2 anexos migrados; 1 arquivos não encontrados", saida.getvalue())
+
+        digest = hashlib.sha256(conteudo).hexdigest()
+        novo = f"anexos/{digest[:2]}/{digest[2:4]}/{digest}.png"
+        self.assertEqual(Solicitacao.objects.filter(anexo=novo).count(), 2)
+        self.assertEqual(ArquivoAnexo.objects.get(nome=novo).referencias, 2)
+        self.assertTrue(os.path.exists(os.path.join(MEDIA_TESTE, novo)))
+
+        # Os antigos saem pela fila de remoção de órfãos
+        with override_settings(ANEXOS_CARENCIA_REMOCAO=0):
+            for tarefa in Tarefa.objects.filter(nome="dispensas.remover_anexo_orfao"):
+                remover_anexo_orfao(**tarefa.argumentos)
+        self.assertEqual(sorted(os.listdir(pasta)), [digest[:2]])
+
+        # Rodar de novo não refaz nada
+        saida = io.StringIO()
+        call_command("migrar_anexos", stdout=saida, stderr=io.StringIO())
+        self.assertIn("0 anexos migrados", saida.getvalue())
+
+    def test_anexo_otimizado(self):
+        # Foto de celular: grande e com pouca compressão
+        foto = Image.linear_gradient("L").resize((3000, 2000)).convert("RGB")
+        envio = io.BytesIO()
+        foto.save(envio, "JPEG", quality=98)
+        solicitacao = self.enviar_anexo("foto.jpeg", envio.getvalue())
+        self.assertTrue(solicitacao.anexo.name.endswith(".jpg"))
+        self.assertLess(solicitacao.anexo.size, len(envio.getvalue()))
+        with Image.open(solicitacao.anexo.path) as salva:
+            self.assertEqual(salva.size, (2000, 1333))
+        self.assertFalse(solicitacao.anexo_original)
+
+        # PDF sem compressão: fluxos comprimidos, mesmas páginas
+        envio = io.BytesIO()
+        c = canvas.Canvas(envio, pageCompression=0)
+        for pagina in range(3):
+            for linha in range(40):
+                c.drawString(50, 800 - linha * 18, f"Programação do evento {linha}")
+            c.showPage()
+        c.save()
+        with override_settings(ANEXOS_MANTER_ORIGINAL=True):
+            solicitacao = self.enviar_anexo("programacao.pdf", envio.getvalue())
+        self.assertLess(solicitacao.anexo.size, len(envio.getvalue()))
+        self.assertEqual(len(PdfReader(solicitacao.anexo.path).pages), 3)
+        with solicitacao.anexo_original.open() as original:
+            self.assertEqual(original.read(), envio.getvalue())
+        self.assertEqual(ArquivoAnexo.objects.filter(referencias=1).count(), 3)
+
+        # Formato não tratado (ou ilegível) segue como veio
+        solicitacao = self.enviar_anexo("lista.txt", b"nome;matricula\n" * 100)
+        self.assertTrue(solicitacao.anexo.name.endswith(".txt"))
+        self.assertEqual(solicitacao.anexo.size, 1500)
+
+    def test_anexo_preview(self):
+        # Imagem com transparência: miniatura achatada e reduzida
+        envio = io.BytesIO()
+        Image.new("RGBA", (1200, 900), (0, 90, 160, 128)).save(envio, "PNG")
+        solicitacao = self.enviar_anexo("cartaz.png", envio.getvalue())
+        self.assertTrue(
+            Tarefa.objects.filter(
+                nome="dispensas.gerar_previa",
+                argumentos={"nome": solicitacao.anexo.name},
+            ).exists()
+        )
+        url = f"/api/solicitacoes/{solicitacao.pk}/anexo-preview/"
+        versao = os.path.basename(solicitacao.anexo.name)
+
+        for papel in ("servidor", "admin"):
+            with self.subTest(papel=papel):
+                resposta = self.cliente(papel).get(url, {"v": versao})
+                self.assertEqual(resposta.status_code, 200)
+                self.assertEqual(resposta["Content-Type"], "image/webp")
+                self.assertIn("immutable", resposta["Cache-Control"])
+                with Image.open(
+                    io.BytesIO(b"".join(resposta.streaming_content))
+                ) as img:
+                    self.assertEqual(img.size, (480, 360))
+
+        # Revalidação pela ETag, sem ler o arquivo; sem ?v não é imutável
+        resposta = self.cliente("servidor").get(
+            url, HTTP_IF_NONE_MATCH=resposta["ETag"]
+        )
+        self.assertEqual(resposta.status_code, 304)
+        self.assertIn("no-cache", resposta["Cache-Control"])
+
+        # PDF: primeira página renderizada (A4 em pé)
+        envio = io.BytesIO()
+        c = canvas.Canvas(envio, pagesize=A4)
+        c.drawString(100, 700, "Convocação")
+        c.showPage()
+        c.save()
+        solicitacao = self.enviar_anexo("convocacao.pdf", envio.getvalue())
+        resposta = self.cliente("servidor").get(
+            f"/api/solicitacoes/{solicitacao.pk}/anexo-preview/"
+        )
+        self.assertEqual(resposta.status_code, 200)
+        with Image.open(io.BytesIO(b"".join(resposta.streaming_content))) as img:
+            self.assertEqual(img.size[1], 480)
+            self.assertLess(img.size[0], 480)
+
+        # Tipo sem miniatura, pedido sem anexo e pedido fora da jurisdição
+        solicitacao = self.enviar_anexo("ata.docx", b"PK ata" * 100)
+        resposta = self.cliente("servidor").get(
+            f"/api/solicitacoes/{solicitacao.pk}/anexo-preview/"
+        )
+        self.assertEqual(resposta.status_code, 404)
+        self.assertIn("erro", resposta.json())
+        sem_anexo = Solicitacao.objects.filter(
+            usuario=self.usuarios["servidor"], anexo=""
+        ).first()
+        resposta = self.cliente("servidor").get(
+            f"/api/solicitacoes/{sem_anexo.pk}/anexo-preview/"
+        )
+        self.assertEqual(resposta.json(), {"erro": "Solicitação sem anexo."})
+        alheia = Solicitacao.objects.exclude(usuario=self.usuarios["servidor"]).first()
+        resposta = self.cliente("servidor").get(
+            f"/api/solicitacoes/{alheia.pk}/anexo-preview/"
+        )
+        self.assertEqual(resposta.status_code, 404)
+
+
+# ====================================================================
+# ORÇAMENTO DE QUERIES E LATÊNCIA POR ENDPOINT
+# Cada rota de core/urls.py tem, para cada papel, um número máximo de
+# queries SQL. Uma regressão N+1 (ex: 1 query por linha) estoura o
+# orçamento na hora: a suíte padrão confere isso na hierarquia pequena.
+#
+# Opcional (semeia 100 mil pedidos e mede também o tempo de relógio): rode
+# com DISPENSAS_PERF=1. O volume pode ser reduzido com DISPENSAS_PERF_ESCALA=0.1
+# ====================================================================
+
+SUITE_DESEMPENHO = bool(os.environ.get("DISPENSAS_PERF"))
+ESCALA = float(os.environ.get("DISPENSAS_PERF_ESCALA", "1"))
+
+N_DEPARTAMENTOS = 15
+N_SETORES = 150
+N_USUARIOS = max(int(5_000 * ESCALA), 200)
+N_SOLICITACOES = max(int(100_000 * ESCALA), 1_000)
+
+# Teto de tempo (segundos) por requisição. Folgado para não oscilar em CI,
+# mas pega varreduras completas da tabela.
+LATENCIA_MAXIMA = 0.5
+LATENCIA_MAXIMA_PDF = 1.5
+
+# Máximo de queries por (endpoint, papel), com os caches de tokens e papéis quentes
+ORCAMENTO_QUERIES = {
+    "lista": {"admin": 2, "coordenador": 2, "gerente": 2, "servidor": 2},
+    "lista_304": {"admin": 1, "coordenador": 1, "gerente": 1, "servidor": 1},
+    "detalhe": {"admin": 2, "coordenador": 2, "gerente": 2, "servidor": 2},
+    # admin: aprovação final + INSERT da tarefa de pré-renderização do PDF
+    "aprovar": {"admin": 11, "coordenador": 10, "gerente": 10, "servidor": 1},
+    "reprovar": {"admin": 10, "coordenador": 10, "gerente": 10, "servidor": 10},
+    "login": {"admin": 3, "coordenador": 3, "gerente": 3, "servidor": 3},
+    "meus_dados": {"admin": 1, "coordenador": 1, "gerente": 1, "servidor": 1},
+    "setores": {"admin": 1, "coordenador": 1, "gerente": 1, "servidor": 1},
+    "pdf": {"admin": 2, "coordenador": 2, "gerente": 2, "servidor": 2},
+    "pdf_cache": {"admin": 1, "coordenador": 1, "gerente": 1, "servidor": 1},
+    "previa": {"admin": 1, "coordenador": 1, "gerente": 1, "servidor": 1},
+    "stats": {"admin": 1, "coordenador": 2, "gerente": 2, "servidor": 1},
+    "busca": {"admin": 1, "coordenador": 1, "gerente": 1, "servidor": 1},
+    "changes": {"admin": 2, "coordenador": 2, "gerente": 2, "servidor": 2},
+    # 20 pedidos x (SAVEPOINT, sequência, UPDATE, RELEASE) + leitura e efeitos
+    "bulk": {"gerente": 110},
+}
+
+
+class OrcamentoQueriesMixin:
+    """
+    Bateria por endpoint e papel. As classes de teste fornecem os usuários
+    por papel (self.usuarios) e os tokens; MEDIR_LATENCIA liga o teto de tempo.
+    """
+
+    MEDIR_LATENCIA = False
+
+    def medir(self, endpoint, papel, requisicao, latencia_maxima=LATENCIA_MAXIMA):
+        """Executa a requisição e confere queries (e tempo) contra o orçamento"""
+        with CaptureQueriesContext(connection) as contexto:
+            inicio = time.perf_counter()
+            resposta = requisicao()
+            duracao = time.perf_counter() - inicio
+
+        orcamento = ORCAMENTO_QUERIES[endpoint][papel]
+        self.assertLessEqual(
+            len(contexto.captured_queries),
+            orcamento,
+            f"{endpoint}/{papel}: {len(contexto.captured_queries)} queries "
+            f"(máximo {orcamento})\n"
+            + "\n".join(q["sql"] for q in contexto.captured_queries),
+        )
+        if self.MEDIR_LATENCIA:
+            self.assertLess(
+                duracao,
+                latencia_maxima,
+                f"{endpoint}/{papel}: {duracao:.3f}s (máximo {latencia_maxima}s)",
+            )
+        return resposta
+
+    def test_lista(self):
+        for papel in self.usuarios:
+            with self.subTest(papel=papel):
+                resposta = self.medir(
+                    "lista",
+                    papel,
+                    lambda: self.cliente(papel).get("/api/solicitacoes/"),
+                )
+                self.assertEqual(resposta.status_code, 200)
+                self.assertLessEqual(len(resposta.json()["results"]), 50)
+
+    def test_lista_nao_modificada(self):
+        for papel in self.usuarios:
+            with self.subTest(papel=papel):
+                cliente = self.cliente(papel)
+                etag = cliente.get("/api/solicitacoes/")["ETag"]
+                resposta = self.medir(
+                    "lista_304",
+                    papel,
+                    lambda: cliente.get("/api/solicitacoes/", HTTP_IF_NONE_MATCH=etag),
+                )
+                self.assertEqual(resposta.status_code, 304)
+
+    def test_detalhe(self):
+        for papel in self.usuarios:
+            with self.subTest(papel=papel):
+                solicitacao = self.solicitacao_visivel(papel, "APROVADO")
+                resposta = self.medir(
+                    "detalhe",
+                    papel,
+                    lambda: self.cliente(papel).get(
+                        f"/api/solicitacoes/{solicitacao.pk}/"
+                    ),
+                )
+                self.assertEqual(resposta.status_code, 200)
+
+    def test_stats(self):
+        for papel in self.usuarios:
+            with self.subTest(papel=papel):
+                resposta = self.medir(
+                    "stats",
+                    papel,
+                    lambda: self.cliente(papel).get("/api/solicitacoes/stats/"),
+                )
+                self.assertEqual(resposta.status_code, 200)
+
+    def test_busca(self):
+        for papel in self.usuarios:
+            with self.subTest(papel=papel):
+                resposta = self.medir(
+                    "busca",
+                    papel,
+                    lambda: self.cliente(papel).get(
+                        "/api/solicitacoes/busca/", {"q": "capacitacao"}
+                    ),
+                )
+                self.assertEqual(resposta.status_code, 200)
+                self.assertTrue(resposta.json()["results"])
+
+    def test_changes(self):
+        for papel in self.usuarios:
+            with self.subTest(papel=papel):
+                cliente = self.cliente(papel)
+                token = cliente.get("/api/solicitacoes/changes/").json()["token"]
+
+                solicitacao = self.solicitacao_visivel(papel, "APROVADO")
+                solicitacao.objetivo = "Atualizado"
+                solicitacao.save(update_fields=["objetivo"])
+
+                resposta = self.medir(
+                    "changes",
+                    papel,
+                    lambda: cliente.get("/api/solicitacoes/changes/", {"since": token}),
+                )
+                self.assertEqual(resposta.status_code, 200)
+
+    def test_aprovar(self):
+        status_por_papel = {
+            "admin": "PENDENTE_ADMIN",
+            "coordenador": "PENDENTE_COORD",
+            "gerente": "PENDENTE_GERENTE",
+            "servidor": "PENDENTE_GERENTE",
+        }
+        for papel, status in status_por_papel.items():
+            with self.subTest(papel=papel):
+                solicitacao = self.solicitacao_visivel(papel, status)
+                resposta = self.medir(
+                    "aprovar",
+                    papel,
+                    lambda: self.cliente(papel).post(
+                        f"/api/solicitacoes/{solicitacao.pk}/aprovar/"
+                    ),
+                )
+                self.assertEqual(
+                    resposta.status_code, 403 if papel == "servidor" else 200
+                )
+
+    def test_bulk_transition(self):
+        gerente = self.usuarios["gerente"]
+        pendentes = list(
+            Solicitacao.objects.filter(
+                status="PENDENTE_GERENTE",
+                unidade__in=gerente.jurisdicoes.values("unidade"),
+            ).values_list("id", flat=True)[:20]
+        )
+        self.assertTrue(pendentes)
+        resposta = self.medir(
+            "bulk",
+            "gerente",
+            lambda: self.cliente("gerente").post(
+                "/api/solicitacoes/bulk-transition/",
+                {"ids": pendentes, "acao": "aprovar"},
+                format="json",
+            ),
+        )
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()["sucesso"], len(pendentes))
+
+    def test_reprovar(self):
+        # Da jurisdição menor para a maior: na hierarquia pequena quem vê mais
+        # ainda encontra um pendente depois de os outros cancelarem os seus
+        for papel in ("servidor", "gerente", "coordenador", "admin"):
+            with self.subTest(papel=papel):
+                solicitacao = self.solicitacao_visivel(papel, "PENDENTE_GERENTE")
+                resposta = self.medir(
+                    "reprovar",
+                    papel,
+                    lambda: self.cliente(papel).post(
+                        f"/api/solicitacoes/{solicitacao.pk}/reprovar/"
+                    ),
+                )
+                self.assertEqual(resposta.status_code, 200)
+
+    def test_login(self):
+        for papel, usuario in self.usuarios.items():
+            with self.subTest(papel=papel):
+                resposta = self.medir(
+                    "login",
+                    papel,
+                    lambda: APIClient().post(
+                        "/api/login/", {"username": usuario.username, "password": SENHA}
+                    ),
+                )
+                self.assertEqual(resposta.status_code, 200)
+
+    def test_meus_dados(self):
+        for papel in self.usuarios:
+            with self.subTest(papel=papel):
+                resposta = self.medir(
+                    "meus_dados",
+                    papel,
+                    lambda: self.cliente(papel).get("/api/meus-dados/"),
+                )
+                self.assertEqual(resposta.status_code, 200)
+
+    def test_setores(self):
+        for papel in self.usuarios:
+            with self.subTest(papel=papel):
+                resposta = self.medir(
+                    "setores", papel, lambda: self.cliente(papel).get("/api/setores/")
+                )
+                self.assertEqual(resposta.status_code, 200)
+                self.assertEqual(len(resposta.json()), Setor.objects.count())
+
+    def test_pdf(self):
+        for papel in self.usuarios:
+            with self.subTest(papel=papel):
+                solicitacao = self.solicitacao_visivel(papel, "APROVADO")
+                resposta = self.medir(
+                    "pdf",
+                    papel,
+                    lambda: self.cliente(papel).get(
+                        f"/api/solicitacoes/{solicitacao.pk}/pdf/"
+                    ),
+                    latencia_maxima=LATENCIA_MAXIMA_PDF,
+                )
+                self.assertEqual(resposta.status_code, 200)
+                b"".join(resposta.streaming_content)
+
+                # Segundo download: arquivo estático do cache, sem renderizar
+                resposta = self.medir(
+                    "pdf_cache",
+                    papel,
+                    lambda: self.cliente(papel).get(
+                        f"/api/solicitacoes/{solicitacao.pk}/pdf/"
+                    ),
+                )
+                self.assertEqual(resposta.status_code, 200)
+                b"".join(resposta.streaming_content)
+
+    def test_previa(self):
+        envio = io.BytesIO()
+        Image.new("RGB", (1200, 900), (0, 90, 160)).save(envio, "PNG")
+        solicitacao = self.enviar_anexo("cartaz.png", envio.getvalue())
+        url = f"/api/solicitacoes/{solicitacao.pk}/anexo-preview/"
+        # Primeira visualização gera a miniatura; as medidas são do cache
+        b"".join(self.cliente("servidor").get(url).streaming_content)
+
+        for papel in ("servidor", "admin"):
+            with self.subTest(papel=papel):
+                resposta = self.medir(
+                    "previa", papel, lambda: self.cliente(papel).get(url)
+                )
+                self.assertEqual(resposta.status_code, 200)
+                b"".join(resposta.streaming_content)
+
+
+class OrcamentoQueriesTests(OrcamentoQueriesMixin, HierarquiaTestCase):
+    """Orçamento de queries na hierarquia pequena (suíte padrão)"""
+
+
+def semear_hierarquia():
+    """
+    Cria departamentos, setores, usuários e solicitações em massa
+    (bulk_create) e reconstrói as tabelas derivadas que os signals mantêm.
+    """
+    aleatorio = random.Random(42)
+    senha_hash = make_password(SENHA)
+
+    grupo_gerentes, _ = Group.objects.get_or_create(name="Gerentes")
+    grupo_coord, _ = Group.objects.get_or_create(name="Coordenadores")
+
+    User.objects.bulk_create(
+        [
+            User(
+                username=str(10_000 + i),
+                first_name=f"Servidor {i}",
+                password=senha_hash,
+            )
+            for i in range(N_USUARIOS)
+        ],
+        batch_size=1_000,
+    )
+    usuarios = list(User.objects.order_by("id"))
+    UserProfile.objects.bulk_create(
+        [UserProfile(user=u, cargo="Servidor", unidade="Rede") for u in usuarios],
+        batch_size=1_000,
+    )
+
+    # Os primeiros usuários viram coordenadores e gerentes
+    coordenadores = usuarios[:N_DEPARTAMENTOS]
+    gerentes = usuarios[N_DEPARTAMENTOS : N_DEPARTAMENTOS + N_SETORES]
+    servidores = usuarios[N_DEPARTAMENTOS + N_SETORES :]
+    grupo_coord.user_set.add(*coordenadores)
+    grupo_gerentes.user_set.add(*gerentes)
+
+    departamentos = Departamento.objects.bulk_create(
+        [
+            Departamento(nome=f"Departamento {i}", responsavel=coordenadores[i])
+            for i in range(N_DEPARTAMENTOS)
+        ]
+    )
+    setores = Setor.objects.bulk_create(
+        [
+            Setor(
+                nome=f"Setor {i}",
+                departamento=departamentos[i % N_DEPARTAMENTOS],
+                responsavel=gerentes[i],
+            )
+            for i in range(N_SETORES)
+        ]
+    )
+    recalcular_jurisdicao([u.id for u in coordenadores + gerentes])
+
+    inicio = date(2024, 1, 1)
+    lote = []
+    for i in range(N_SOLICITACOES):
+        dono = servidores[aleatorio.randrange(len(servidores))]
+        data_inicio = inicio + timedelta(days=aleatorio.randrange(900))
+        lote.append(
+            Solicitacao(
+                usuario=dono,
+                matricula=dono.username,
+                unidade=setores[aleatorio.randrange(N_SETORES)].nome,
+                cargo="Servidor",
+                nome_evento=f"Evento {i}",
+                objetivo="Capacitação profissional " * 4,
+                data_inicio=data_inicio,
+                data_fim=data_inicio + timedelta(days=2),
+                cidade="São José do Rio Preto",
+                estado="SP",
+                status=aleatorio.choice(STATUS_SORTEIO),
+            )
+        )
+        if len(lote) == 5_000:
+            Solicitacao.objects.bulk_create(lote)
+            lote = []
+    # Garante ao menos um pedido de cada status do servidor de teste, lançado
+    # no setor do gerente/coordenador de teste
+    servidor = servidores[0]
+    for status in STATUS_SORTEIO:
+        lote.append(
+            Solicitacao(
+                usuario=servidor,
+                matricula=servidor.username,
+                unidade=setores[0].nome,
+                cargo="Servidor",
+                nome_evento=f"Evento do servidor ({status})",
+                objetivo="Capacitação profissional",
+                data_inicio=inicio,
+                data_fim=inicio + timedelta(days=1),
+                cidade="São José do Rio Preto",
+                estado="SP",
+                status=status,
+            )
+        )
+    Solicitacao.objects.bulk_create(lote)
+
+    totais = Solicitacao.objects.values("unidade", "status").annotate(total=Count("id"))
+    ContadorStatus.objects.bulk_create(
+        [
+            ContadorStatus(unidade=t["unidade"], status=t["status"], total=t["total"])
+            for t in totais
+        ]
+    )
+
+    # Carimbos de versão já existentes, como num banco em uso
+    VersaoLista.objects.bulk_create(
+        [VersaoLista(escopo="UNIDADE", chave=setor.nome) for setor in setores]
+        + [VersaoLista(escopo="USUARIO", chave=str(u.pk)) for u in servidores],
+        batch_size=1_000,
+    )
+
+    admin = User.objects.create_superuser(
+        username="1", password=SENHA, first_name="Secretario"
+    )
+    UserProfile.objects.create(user=admin, cargo="Secretário", unidade="SMS")
+
+    return {
+        "admin": admin,
+        "coordenador": coordenadores[0],
+        "gerente": gerentes[0],
+        "servidor": servidor,
+    }
+
+
+@unittest.skipUnless(SUITE_DESEMPENHO, "suíte de desempenho: DISPENSAS_PERF=1")
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    **PASTAS_TESTE,
+)
+class OrcamentoDesempenhoTests(OrcamentoQueriesMixin, ClientesPorPapelMixin, TestCase):
+    """Mesma bateria sobre a hierarquia semeada, com teto de tempo"""
+
+    MEDIR_LATENCIA = True
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuarios = semear_hierarquia()
+        # MD5 só para o teste: o login não deve medir o custo do PBKDF2
+        senha_md5 = make_password(SENHA, hasher="md5")
+        User.objects.filter(pk__in=[u.pk for u in cls.usuarios.values()]).update(
+            password=senha_md5
+        )
+        cls.criar_tokens()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_TESTE, ignore_errors=True)
+        shutil.rmtree(CACHE_TESTE, ignore_errors=True)
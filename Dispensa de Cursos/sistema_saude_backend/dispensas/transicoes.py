@@ -0,0 +1,153 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .eventos import hub
+from .models import SequenciaAlteracao, Solicitacao, VersaoLista
+from .papeis import COORDENADOR, GERENTE
+from .pdf import agendar_pre_renderizacao
+from .signals import ajustar_contador
+
+# ====================================================================
+# MÁQUINA DE ESTADOS DA SOLICITAÇÃO (APROVAR / REPROVAR)
+# Cada transição é um UPDATE condicional (WHERE id=? AND status=?) que grava
+# só as colunas alteradas. Se outra pessoa mudou o status no meio do caminho,
+# o UPDATE não acha a linha e a transição é recusada (409 na API).
+# ====================================================================
+
+
+class Transicao:
+    """Mudança de status pretendida + colunas extras a gravar junto"""
+
+    def __init__(self, novo_status, campos, mensagem):
+        self.novo_status = novo_status
+        self.campos = campos
+        self.mensagem = mensagem
+
+
+def _nome_assinatura(usuario):
+    # Sem first_name, usa a matrícula para a assinatura não ficar em branco
+    return usuario.first_name or usuario.username
+
+
+def transicao_aprovar(solicitacao, usuario, papeis):
+    """Próximo passo da aprovação para este usuário, ou None se não pode aprovar"""
+    agora = timezone.now()
+    nome = _nome_assinatura(usuario)
+
+    # Gerente: PENDENTE_GERENTE -> PENDENTE_COORD
+    if papeis & GERENTE and solicitacao.status == "PENDENTE_GERENTE":
+        return Transicao(
+            "PENDENTE_COORD",
+            {"assinatura_gerente": nome, "data_aprovacao_gerente": agora},
+            "Aprovado p/ Coordenação",
+        )
+
+    # Coordenador: PENDENTE_COORD -> PENDENTE_ADMIN
+    if papeis & COORDENADOR and solicitacao.status == "PENDENTE_COORD":
+        return Transicao(
+            "PENDENTE_ADMIN",
+            {"assinatura_coordenador": nome, "data_aprovacao_coordenador": agora},
+            "Aprovado p/ Admin",
+        )
+
+    # Admin: finaliza em qualquer fase. Só assina se ainda não tiver assinado
+    # (para não sobrescrever se for só ajuste)
+    if usuario.is_superuser:
+        return Transicao(
+            "APROVADO",
+            {
+                "assinatura_admin": solicitacao.assinatura_admin or nome,
+                "data_aprovacao_admin": agora,
+            },
+            "Processo Finalizado",
+        )
+
+    return None
+
+
+def transicao_reprovar(solicitacao, usuario):
+    """Indeferimento/cancelamento, permitido em qualquer etapa"""
+    return Transicao(
+        "INDEFERIDO",
+        {"motivo_cancelamento": f"Reprovado por {_nome_assinatura(usuario)}"},
+        "Solicitação Indeferida/Cancelada.",
+    )
+
+
+class EfeitosTransicao:
+    """
+    Efeitos colaterais de uma ou mais transições (contadores de status,
+    carimbos de versão e PDFs a pré-renderizar), acumulados para serem
+    gravados de uma vez só.
+    """
+
+    def __init__(self):
+        self.contadores = {}
+        self.alteracoes = []
+        self.aprovadas = []
+
+    def registrar(self, solicitacao, status_anterior, novo_status):
+        if novo_status != status_anterior:
+            for chave, delta in (
+                ((solicitacao.unidade, status_anterior), -1),
+                ((solicitacao.unidade, novo_status), 1),
+            ):
+                self.contadores[chave] = self.contadores.get(chave, 0) + delta
+        self.alteracoes.append((solicitacao.unidade, solicitacao.usuario_id))
+        if novo_status == "APROVADO" and status_anterior != "APROVADO":
+            self.aprovadas.append(solicitacao.pk)
+
+    def gravar(self):
+        for (unidade, status), delta in self.contadores.items():
+            if delta:
+                ajustar_contador(unidade, status, delta)
+        if self.alteracoes:
+            # Um UPDATE por escopo em vez de registrar_alteracao() por pedido
+            agora = timezone.now()
+            VersaoLista.incrementar_varios(
+                "UNIDADE", {unidade for unidade, _ in self.alteracoes}, agora
+            )
+            VersaoLista.incrementar_varios(
+                "USUARIO", {usuario_id for _, usuario_id in self.alteracoes}, agora
+            )
+            transaction.on_commit(hub.notificar)
+        agendar_pre_renderizacao(self.aprovadas)
+
+
+def aplicar_transicao(solicitacao, transicao, efeitos=None):
+    """
+    Grava a transição se o status no banco ainda for o que foi lido.
+    Retorna False quando outra requisição chegou antes (corrida perdida).
+    Como .update() não dispara signals, contadores, carimbos de versão e o hub
+    SSE são atualizados aqui, ou acumulados em `efeitos` (transições em lote)
+    para quem chamou gravar depois.
+    """
+    status_anterior = solicitacao.status
+    with transaction.atomic():
+        sequencia = SequenciaAlteracao.proxima()
+        alteradas = Solicitacao.objects.filter(
+            pk=solicitacao.pk, status=status_anterior
+        ).update(
+            status=transicao.novo_status,
+            seq_alteracao=sequencia,
+            **transicao.campos,
+        )
+        if not alteradas:
+            # Desfaz o incremento da sequência: nada mudou
+            transaction.set_rollback(True)
+            return False
+
+        if efeitos is None:
+            efeitos_locais = EfeitosTransicao()
+            efeitos_locais.registrar(
+                solicitacao, status_anterior, transicao.novo_status
+            )
+            efeitos_locais.gravar()
+        else:
+            efeitos.registrar(solicitacao, status_anterior, transicao.novo_status)
+
+    solicitacao.status = transicao.novo_status
+    solicitacao.seq_alteracao = sequencia
+    for campo, valor in transicao.campos.items():
+        setattr(solicitacao, campo, valor)
+    return True
@@ -1,15 +1,22 @@
 import os
-import io
+import hashlib
+import posixpath
 import traceback
 from django.conf import settings
-from django.http import FileResponse, HttpResponse
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import CharField, OuterRef, Q, Count, Subquery, Sum, Value
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.utils import timezone
 from django.core.mail import send_mail # Para o futuro
 import random
 
@@ -20,16 +27,39 @@ from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.filters import OrderingFilter
+from rest_framework.exceptions import AuthenticationFailed
 
-# ReportLab (Gerador de PDF)
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.lib.utils import ImageReader
 
 # Imports Locais
-from .models import Solicitacao, UserProfile, Setor, Departamento
-from .serializers import SolicitacaoSerializer
+from .models import (
+    Solicitacao,
+    UserProfile,
+    Setor,
+    Departamento,
+    JurisdicaoUnidade,
+    ContadorStatus,
+    SequenciaAlteracao,
+    VersaoLista,
+)
+from .serializers import SolicitacaoSerializer, SolicitacaoListaSerializer
+from .pagination import SolicitacaoCursorPagination
+from .filters import SolicitacaoFiltro
+from .busca import buscar_solicitacoes
+from .exportacao import gerar_zip, pedacos_async, solicitacoes_em_lotes
+from .pdf import pdf_da_solicitacao, resposta_pdf
+from .previa import TIPO as TIPO_PREVIA, chave_previa, previa_do_anexo
+from .relatorio import gerar_relatorio
+from .eventos import FluxoEventos
+from .authentication import CachedTokenAuthentication
+from .papeis import GESTOR, papeis_do_usuario, papel_frontend
+from .transicoes import (
+    EfeitosTransicao,
+    aplicar_transicao,
+    transicao_aprovar,
+    transicao_reprovar,
+)
+from tarefas.fila import enfileirar
 
 
 # ====================================================================
@@ -39,6 +69,19 @@ from .serializers import SolicitacaoSerializer
 class SolicitacaoViewSet(viewsets.ModelViewSet):
     serializer_class = SolicitacaoSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SolicitacaoCursorPagination
+    filter_backends = [SolicitacaoFiltro, OrderingFilter]
+    ordering_fields = ["id", "data_inicio", "data_solicitacao"]
+    ordering = ["-id"]
+
+    # Máximo de linhas por chamada do /changes/ (o cliente repete enquanto "mais")
+    LIMITE_CHANGES = 500
+
+    # Máximo de ids por chamada do /bulk-transition/
+    LIMITE_LOTE = 500
+
+    # Máximo de PDFs por chamada do /export-zip/
+    LIMITE_EXPORTACAO = 10_000
 
     def get_queryset(self):
         """
@@ -54,129 +97,242 @@ class SolicitacaoViewSet(viewsets.ModelViewSet):
         if user.is_superuser:
             return Solicitacao.objects.all().order_by("-id")
 
-        # Filtro base: O usuário sempre vê seus próprios pedidos
-        filtro_final = Q(usuario=user)
+        # 2. SERVIDOR: Vê só os próprios pedidos
+        if not papeis_do_usuario(user) & GESTOR:
+            return Solicitacao.objects.filter(usuario=user).order_by("-id")
 
-        # 2. GERENTE: Vê seus pedidos + pedidos dos setores que ele gerencia
-        try:
-            # Verifica se é gerente (pelo Grupo ou se é responsável por algum setor)
-            if (
-                user.groups.filter(name="Gerentes").exists()
-                or Setor.objects.filter(responsavel=user).exists()
-            ):
-                setores_gerenciados = Setor.objects.filter(
-                    responsavel=user
-                ).values_list("nome", flat=True)
-                # Adiciona ao filtro: Unidade do pedido está na lista de setores dele
-                filtro_final = filtro_final | Q(unidade__in=setores_gerenciados)
-        except Exception as e:
-            print(f"Erro filtro Gerente: {e}")
+        # 3. GERENTE / COORDENADOR: Vê seus pedidos + pedidos das unidades sob sua
+        # jurisdição. As unidades vêm do índice JurisdicaoUnidade (mantido pelos
+        # signals), então a hierarquia não é recalculada a cada requisição.
+        unidades_visiveis = JurisdicaoUnidade.objects.filter(usuario=user).values(
+            "unidade"
+        )
+        return Solicitacao.objects.filter(
+            Q(usuario=user) | Q(unidade__in=unidades_visiveis)
+        ).order_by("-id")
 
-        # 3. COORDENADOR: Vê seus pedidos + pedidos de todos os setores dos seus departamentos
-        try:
-            if (
-                user.groups.filter(name="Coordenadores").exists()
-                or Departamento.objects.filter(responsavel=user).exists()
-            ):
-                deptos_coordenados = Departamento.objects.filter(responsavel=user)
-                # Pega todos os setores vinculados a esses departamentos
-                setores_sob_jurisdicao = Setor.objects.filter(
-                    departamento__in=deptos_coordenados
-                ).values_list("nome", flat=True)
-                filtro_final = filtro_final | Q(unidade__in=setores_sob_jurisdicao)
-        except Exception as e:
-            print(f"Erro filtro Coordenador: {e}")
+    def get_serializer_class(self):
+        # Listagens usam a projeção enxuta; detalhe/criação usam o completo
+        if self.action in ("list", "busca", "changes"):
+            return SolicitacaoListaSerializer
+        return SolicitacaoSerializer
+
+    def list(self, request, *args, **kwargs):
+        """
+        Lista paginada lendo só as colunas da projeção enxuta (1 query, com JOIN).
+        Responde 304 Not Modified (ETag / Last-Modified) sem tocar nas linhas
+        quando nada mudou na jurisdição do usuário desde a última consulta.
+        """
+        etag, ultima_alteracao = self._carimbo_lista(request)
+        nao_modificado = get_conditional_response(
+            request, etag=etag, last_modified=ultima_alteracao
+        )
+        if nao_modificado is not None:
+            return self._com_cabecalhos_cache(nao_modificado, etag, ultima_alteracao)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.select_related("usuario").only(
+            *SolicitacaoListaSerializer.CAMPOS_BANCO
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        resposta = self.get_paginated_response(serializer.data)
+        return self._com_cabecalhos_cache(resposta, etag, ultima_alteracao)
+
+    def _carimbo_lista(self, request):
+        """
+        ETag da lista = hash dos carimbos visíveis ao usuário (sequência
+        global de alterações p/ admin; suas unidades + seus próprios pedidos
+        p/ os demais), do usuário, dos seus papéis e da query string
+        (filtros/cursor). Toda unidade da jurisdição entra no hash, com ou sem
+        carimbo: ganhar ou perder uma unidade muda o ETag. Uma única query.
+        """
+        user = request.user
+        papeis = papeis_do_usuario(user)
+        if user.is_superuser:
+            numero, data = SequenciaAlteracao.ultima()
+            linhas = [("TODAS", "", numero, data)] if data else []
+        else:
+            versoes = VersaoLista.objects.filter(
+                escopo="USUARIO", chave=str(user.pk)
+            ).values_list("escopo", "chave", "versao", "atualizado_em")
+            if papeis & GESTOR:
+                carimbo = VersaoLista.objects.filter(
+                    escopo="UNIDADE", chave=OuterRef("unidade")
+                )
+                versoes = versoes.union(
+                    JurisdicaoUnidade.objects.filter(usuario=user).values_list(
+                        Value("UNIDADE", output_field=CharField()),
+                        "unidade",
+                        Subquery(carimbo.values("versao")[:1]),
+                        Subquery(carimbo.values("atualizado_em")[:1]),
+                    ),
+                    all=True,
+                )
+            linhas = sorted(versoes)
+
+        assinatura = hashlib.sha256()
+        assinatura.update(f"{user.pk}|{user.is_superuser}|{papeis}|{request.get_full_path()}".encode())
+        for escopo, chave, versao, _ in linhas:
+            assinatura.update(f"|{escopo}:{chave}:{versao}".encode())
 
-        # Aplica o filtro acumulado e ordena pelo mais recente
-        return Solicitacao.objects.filter(filtro_final).distinct().order_by("-id")
+        ultima_alteracao = max(
+            (linha[3] for linha in linhas if linha[3] is not None), default=None
+        )
+        if ultima_alteracao is not None:
+            ultima_alteracao = int(ultima_alteracao.timestamp())
+        return f'"{assinatura.hexdigest()[:32]}"', ultima_alteracao
+
+    def _com_cabecalhos_cache(self, resposta, etag, ultima_alteracao):
+        resposta["ETag"] = etag
+        if ultima_alteracao is not None:
+            resposta["Last-Modified"] = http_date(ultima_alteracao)
+        # O navegador guarda, mas sempre revalida (If-None-Match) antes de usar
+        patch_cache_control(resposta, private=True, no_cache=True)
+        patch_vary_headers(resposta, ["Authorization"])
+        return resposta
 
     def perform_create(self, serializer):
         """Ao criar, define o dono da solicitação como o usuário logado"""
         serializer.save(usuario=self.request.user)
 
-    # --- AÇÕES DE APROVAÇÃO (Máquina de Estados) ---
-
-    @action(detail=True, methods=["post"])
-    def aprovar(self, request, pk=None):
+    @action(detail=False, methods=["get"])
+    def busca(self, request):
+        """
+        Busca textual ranqueada (índice FTS5) dentro da jurisdição do usuário.
+        GET /api/solicitacoes/busca/?q=congresso saude&limite=20
+        Aceita também os filtros da lista (status, unidade, datas...).
+        """
+        texto = request.query_params.get("q", "")
         try:
-            solicitacao = self.get_object()
-            user = request.user
-            status_atual = solicitacao.status
-
-            # Lógica do Gerente
-            if (
-                user.groups.filter(name="Gerentes").exists()
-                and status_atual == "PENDENTE_GERENTE"
-            ):
-                solicitacao.status = "PENDENTE_COORD"
-                solicitacao.assinatura_gerente = user.first_name  # <--- FALTAVA ISSO
-                solicitacao.save()
-                return Response({"status": "Aprovado p/ Coordenação"})
-
-            # Lógica do Coordenador
-            if (
-                user.groups.filter(name="Coordenadores").exists()
-                and status_atual == "PENDENTE_COORD"
-            ):
-                solicitacao.status = "PENDENTE_ADMIN"
-                solicitacao.assinatura_coordenador = (
-                    user.first_name
-                )  # <--- O ERRO ESTAVA AQUI (FALTAVA ESSA LINHA)
-                solicitacao.save()
-                return Response({"status": "Aprovado p/ Admin"})
-
-            # Lógica do Admin
-            if user.is_superuser:
-                solicitacao.status = "APROVADO"
-                # Só assina se ainda não tiver assinado (para não sobrescrever se for só ajuste)
-                if not solicitacao.assinatura_admin:
-                    solicitacao.assinatura_admin = user.first_name
-                solicitacao.save()
-                return Response({"status": "Processo Finalizado"})
+            limite = min(int(request.query_params.get("limite", 50)), 200)
+        except ValueError:
+            limite = 50
 
+        queryset = SolicitacaoFiltro().filter_queryset(
+            request, self.get_queryset(), self
+        )
+        queryset = queryset.select_related("usuario").only(
+            *SolicitacaoListaSerializer.CAMPOS_BANCO
+        )
+        resultados = buscar_solicitacoes(queryset, texto)
+        if resultados is None:
             return Response(
-                {"erro": "Ação não permitida ou status incorreto."}, status=403
+                {"erro": "Informe um termo de busca (?q=)."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        serializer = self.get_serializer(resultados[:limite], many=True)
+        return Response({"results": serializer.data})
+
+    @action(detail=False, methods=["get"])
+    def changes(self, request):
+        """
+        Sincronização incremental do dashboard.
+        GET /api/solicitacoes/changes/?since=<token>
+        Devolve só as solicitações (visíveis ao usuário) criadas ou alteradas
+        depois do token, em ordem de alteração, e o token para a próxima chamada.
+        Sem ?since= devolve apenas o token atual (ponto de partida do cliente).
+        """
+        since = request.query_params.get("since")
+        if since is None:
+            return Response(
+                {"token": SequenciaAlteracao.atual(), "results": [], "mais": False}
             )
-        except Exception as e:
-            return Response({"erro": str(e)}, status=500)
+        try:
+            since = int(since)
+        except ValueError:
+            return Response(
+                {"erro": "Token inválido (?since=)."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Lê a sequência ANTES da consulta: o que for gravado depois disso
+        # aparece na próxima chamada, nunca se perde
+        atual = SequenciaAlteracao.atual()
+        linhas = list(
+            self.get_queryset()
+            .filter(seq_alteracao__gt=since)
+            .select_related("usuario")
+            .only("seq_alteracao", *SolicitacaoListaSerializer.CAMPOS_BANCO)
+            .order_by("seq_alteracao")[: self.LIMITE_CHANGES + 1]
+        )
+        mais = len(linhas) > self.LIMITE_CHANGES
+        linhas = linhas[: self.LIMITE_CHANGES]
+
+        if mais:
+            token = linhas[-1].seq_alteracao
+        else:
+            token = max(atual, since)
+
+        serializer = self.get_serializer(linhas, many=True)
+        return Response({"token": token, "results": serializer.data, "mais": mais})
+
+    @action(detail=False, methods=["get"])
+    def stats(self, request):
+        """
+        Contagem por status para os cards do dashboard, lida da tabela
+        ContadorStatus (mantida pelos signals) em vez de varrer as solicitações.
+        """
+        user = request.user
+
+        if user.is_superuser:
+            linhas = ContadorStatus.objects.values("status").annotate(total=Sum("total"))
+        elif not papeis_do_usuario(user) & GESTOR:
+            linhas = (
+                Solicitacao.objects.filter(usuario=user)
+                .values("status")
+                .annotate(total=Count("id"))
+            )
+        else:
+            unidades_visiveis = JurisdicaoUnidade.objects.filter(usuario=user).values(
+                "unidade"
+            )
+            linhas = list(
+                ContadorStatus.objects.filter(unidade__in=unidades_visiveis)
+                .values("status")
+                .annotate(total=Sum("total"))
+            )
+            # Pedidos do próprio usuário lançados fora da sua jurisdição
+            linhas += list(
+                Solicitacao.objects.filter(usuario=user)
+                .exclude(unidade__in=unidades_visiveis)
+                .values("status")
+                .annotate(total=Count("id"))
+            )
+
+        por_status = {}
+        for linha in linhas:
+            if linha["total"]:
+                por_status[linha["status"]] = (
+                    por_status.get(linha["status"], 0) + linha["total"]
+                )
+
+        return Response(
+            {
+                "por_status": por_status,
+                "pendentes": sum(
+                    total for st, total in por_status.items() if st.startswith("PENDENTE_")
+                ),
+                "aprovados": por_status.get("APROVADO", 0),
+                "indeferidos": por_status.get("INDEFERIDO", 0)
+                + por_status.get("CANCELADO", 0),
+            }
+        )
+
+    # --- AÇÕES DE APROVAÇÃO (Máquina de Estados) ---
+
+    @action(detail=True, methods=["post"])
+    def aprovar(self, request, pk=None):
         try:
             solicitacao = self.get_object()
             user = request.user
-            status_atual = solicitacao.status
-
-            # GARANTIA DE NOME: Se não tiver first_name, usa o username (matrícula)
-            # Isso evita que a assinatura fique em branco no banco de dados
-            nome_assinatura = user.first_name if user.first_name else user.username
-
-            # Lógica do Gerente (Aprova PENDENTE_GERENTE -> PENDENTE_COORD)
-            is_gerente = user.groups.filter(name="Gerentes").exists()
-            if is_gerente and status_atual == "PENDENTE_GERENTE":
-                solicitacao.status = "PENDENTE_COORD"
-                solicitacao.assinatura_gerente = nome_assinatura
-                solicitacao.save()
-                return Response({"status": "Aprovado! Enviado para Coordenação."})
-
-            # Lógica do Coordenador (Aprova PENDENTE_COORD -> PENDENTE_ADMIN)
-            is_coord = user.groups.filter(name="Coordenadores").exists()
-            if is_coord and status_atual == "PENDENTE_COORD":
-                solicitacao.status = "PENDENTE_ADMIN"
-                solicitacao.assinatura_coordenador = nome_assinatura
-                solicitacao.save()
+            transicao = transicao_aprovar(solicitacao, user, papeis_do_usuario(user))
+            if transicao is None:
                 return Response(
-                    {"status": "Aprovado! Enviado para Secretaria de Saúde."}
+                    {"erro": "Ação não permitida ou status incorreto."}, status=403
                 )
-
-            # Lógica do Admin (Aprova PENDENTE_ADMIN -> APROVADO)
-            if user.is_superuser:
-                # Admin pode aprovar em qualquer fase se necessário
-                solicitacao.status = "APROVADO"
-                solicitacao.assinatura_admin = nome_assinatura
-                solicitacao.save()
-                return Response({"status": "Solicitação Finalizada e Aprovada."})
-
-            return Response(
-                {"erro": "Você não tem permissão para aprovar nesta fase."}, status=403
-            )
+            return self._executar_transicao(solicitacao, transicao)
         except Exception as e:
             return Response({"erro": str(e)}, status=500)
 
@@ -184,15 +340,253 @@ class SolicitacaoViewSet(viewsets.ModelViewSet):
     def reprovar(self, request, pk=None):
         """Cancela a solicitação em qualquer etapa"""
         solicitacao = self.get_object()
+        transicao = transicao_reprovar(solicitacao, request.user)
+        return self._executar_transicao(solicitacao, transicao)
+
+    @action(detail=True, methods=["get"])
+    def pdf(self, request, pk=None):
+        """
+        PDF oficial da solicitação (só as visíveis ao usuário).
+        GET /api/solicitacoes/<id>/pdf/
+        Renderiza só na primeira vez de cada versão; depois é arquivo estático
+        servido do cache em disco (dispensas/pdf.py).
+        """
+        visiveis = self.get_queryset()
+        try:
+            caminho = pdf_da_solicitacao(pk, visiveis)
+            try:
+                arquivo = open(caminho, "rb")
+            except FileNotFoundError:
+                # Podado do cache entre a consulta e a abertura: renderiza de novo
+                arquivo = open(pdf_da_solicitacao(pk, visiveis), "rb")
+        except Solicitacao.DoesNotExist:
+            return Response({"erro": "Solicitação não encontrada."}, status=404)
+        except Exception as e:
+            return Response({"erro": str(e)}, status=500)
+        return FileResponse(arquivo, as_attachment=True, filename=f"dispensa_{pk}.pdf")
+
+    @action(detail=True, methods=["get"], url_path="anexo-preview")
+    def anexo_preview(self, request, pk=None):
+        """
+        Miniatura do anexo: a imagem reduzida ou a 1ª página do PDF.
+        GET /api/solicitacoes/<id>/anexo-preview/?v=<nome do arquivo do anexo>
+        O anexo é endereçado pelo conteúdo, então com ?v igual ao arquivo atual
+        a resposta é imutável e o navegador guarda por um ano.
+        """
+        linhas = list(
+            self.get_queryset().filter(pk=pk).values_list("anexo", flat=True)[:1]
+        )
+        if not linhas:
+            return Response({"erro": "Solicitação não encontrada."}, status=404)
+        nome = linhas[0]
+        if not nome:
+            return Response({"erro": "Solicitação sem anexo."}, status=404)
+
+        chave, versao = chave_previa(nome)
+        etag = f'"{chave}-{versao}"'
+        imutavel = request.query_params.get("v") == posixpath.basename(nome)
+        nao_modificado = get_conditional_response(request, etag=etag)
+        if nao_modificado is not None:
+            return self._cabecalhos_previa(nao_modificado, etag, imutavel)
+
+        caminho = previa_do_anexo(nome)
+        if caminho is None:
+            return Response(
+                {"erro": "Pré-visualização indisponível para este anexo."},
+                status=404,
+            )
+        resposta = FileResponse(open(caminho, "rb"), content_type=TIPO_PREVIA)
+        return self._cabecalhos_previa(resposta, etag, imutavel)
+
+    def _cabecalhos_previa(self, resposta, etag, imutavel):
+        resposta["ETag"] = etag
+        if imutavel:
+            patch_cache_control(
+                resposta, private=True, max_age=365 * 24 * 3600, immutable=True
+            )
+        else:
+            patch_cache_control(resposta, private=True, no_cache=True)
+        patch_vary_headers(resposta, ["Authorization"])
+        return resposta
+
+    @action(detail=False, methods=["post"], url_path="bulk-transition")
+    def bulk_transition(self, request):
+        """
+        Aprova ou reprova várias solicitações numa requisição só.
+        POST /api/solicitacoes/bulk-transition/  {"ids": [1, 2, 3], "acao": "aprovar"}
+        Mesmas regras de aprovar/reprovar, numa única transação e com os papéis
+        do usuário avaliados uma vez. Devolve o resultado de cada id.
+        """
+        acao = request.data.get("acao")
+        ids = request.data.get("ids")
+        if acao not in ("aprovar", "reprovar"):
+            return Response(
+                {"erro": 'Ação inválida. Use "aprovar" ou "reprovar".'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            ids = list(dict.fromkeys(int(pk) for pk in ids))
+        except (TypeError, ValueError):
+            return Response(
+                {"erro": "Informe uma lista de ids."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not ids or len(ids) > self.LIMITE_LOTE:
+            return Response(
+                {"erro": f"Informe entre 1 e {self.LIMITE_LOTE} ids."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
         user = request.user
+        papeis = papeis_do_usuario(user)
+        # Mesmo filtro de visibilidade do get_object(): o que não aparece é 404
+        visiveis = self.get_queryset().in_bulk(ids)
+
+        resultados = []
+        efeitos = EfeitosTransicao()
+        with transaction.atomic():
+            for pk in ids:
+                solicitacao = visiveis.get(pk)
+                if solicitacao is None:
+                    resultados.append(
+                        {"id": pk, "codigo": 404, "erro": "Solicitação não encontrada."}
+                    )
+                    continue
+
+                if acao == "aprovar":
+                    transicao = transicao_aprovar(solicitacao, user, papeis)
+                else:
+                    transicao = transicao_reprovar(solicitacao, user)
+
+                if transicao is None:
+                    resultados.append(
+                        {
+                            "id": pk,
+                            "codigo": 403,
+                            "erro": "Ação não permitida ou status incorreto.",
+                        }
+                    )
+                elif not aplicar_transicao(solicitacao, transicao, efeitos):
+                    resultados.append(
+                        {
+                            "id": pk,
+                            "codigo": 409,
+                            "erro": "A solicitação foi alterada por outra pessoa.",
+                        }
+                    )
+                else:
+                    resultados.append(
+                        {"id": pk, "codigo": 200, "status": transicao.mensagem}
+                    )
+            efeitos.gravar()
+
+        sucesso = sum(1 for r in resultados if r["codigo"] == 200)
+        return Response(
+            {
+                "resultados": resultados,
+                "sucesso": sucesso,
+                "falhas": len(resultados) - sucesso,
+            }
+        )
 
-        # Garante nome de quem cancelou
-        nome_cancelou = user.first_name if user.first_name else user.username
+    @action(detail=False, methods=["get"], url_path="export-zip")
+    def export_zip(self, request):
+        """
+        ZIP com os PDFs oficiais das solicitações filtradas, em streaming.
+        GET /api/solicitacoes/export-zip/?data_inicio_de=2026-01-01&data_inicio_ate=2026-01-31&departamento=3
+        Aceita os filtros da lista (período, setor, departamento, unidade...).
+        Sem ?status / ?status_grupo, exporta só as APROVADAS.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        params = request.query_params
+        if not params.get("status") and not params.get("status_grupo"):
+            queryset = queryset.filter(status="APROVADO")
 
-        solicitacao.status = "INDEFERIDO"
-        solicitacao.motivo_cancelamento = f"Reprovado por {nome_cancelou}"
-        solicitacao.save()
-        return Response({"status": "Solicitação Indeferida/Cancelada."})
+        total = queryset.count()
+        if total > self.LIMITE_EXPORTACAO:
+            return Response(
+                {
+                    "erro": f"{total} solicitações no filtro. Exporte no máximo "
+                    f"{self.LIMITE_EXPORTACAO} por vez (reduza o período)."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # Só os ids agora; as solicitações (já com dono e perfil, os processos
+        # que desenham não acessam o banco) são lidas em lotes enquanto o ZIP
+        # é enviado, sem cursor aberto entre um pedaço e outro
+        pks = list(queryset.order_by("id").values_list("pk", flat=True))
+        pedacos = gerar_zip(solicitacoes_em_lotes(pks))
+        if isinstance(request._request, ASGIRequest):
+            # Sob ASGI um iterador síncrono seria lido inteiro antes do envio
+            pedacos = pedacos_async(pedacos)
+        resposta = StreamingHttpResponse(pedacos, content_type="application/zip")
+        nome = f"dispensas_{timezone.localdate():%Y%m%d}.zip"
+        resposta["Content-Disposition"] = f'attachment; filename="{nome}"'
+        resposta["X-Total-Documentos"] = str(total)
+        resposta["X-Accel-Buffering"] = "no"
+        return resposta
+
+    @action(detail=False, methods=["get"])
+    def relatorio(self, request):
+        """
+        PDF único com as solicitações filtradas: quadro-resumo por unidade,
+        índice e um requerimento por página.
+        GET /api/solicitacoes/relatorio/?departamento=3&data_inicio_de=2026-01-01&data_inicio_ate=2026-01-31
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        if queryset.count() > self.LIMITE_EXPORTACAO:
+            return Response(
+                {
+                    "erro": f"Mais de {self.LIMITE_EXPORTACAO} solicitações no "
+                    "filtro. Reduza o período."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        descricao = self._descricao_filtro(request)
+        return resposta_pdf(
+            lambda arquivo: gerar_relatorio(arquivo, queryset, descricao),
+            f"relatorio_dispensas_{timezone.localdate():%Y%m%d}.pdf",
+        )
+
+    def _descricao_filtro(self, request):
+        """Texto do filtro para a capa do relatório"""
+        params = request.query_params
+        partes = []
+        if params.get("departamento"):
+            nome = (
+                Departamento.objects.filter(pk=params["departamento"])
+                .values_list("nome", flat=True)
+                .first()
+            )
+            partes.append(nome or "Departamento")
+        if params.get("setor"):
+            nome = (
+                Setor.objects.filter(pk=params["setor"])
+                .values_list("nome", flat=True)
+                .first()
+            )
+            partes.append(nome or "Setor")
+        if params.get("unidade"):
+            partes.append(params["unidade"])
+        de, ate = params.get("data_inicio_de"), params.get("data_inicio_ate")
+        if de or ate:
+            partes.append(f"de {de or '...'} a {ate or '...'}")
+        return " - ".join(partes) or "Todas as solicitações"
+
+    def _executar_transicao(self, solicitacao, transicao):
+        # UPDATE condicional: se o status mudou desde a leitura, outra pessoa
+        # chegou antes (ex: dois gerentes clicando ao mesmo tempo)
+        if not aplicar_transicao(solicitacao, transicao):
+            return Response(
+                {
+                    "erro": "A solicitação foi alterada por outra pessoa. "
+                    "Recarregue a página e tente novamente."
+                },
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response({"status": transicao.mensagem})
 
 
 # ====================================================================
@@ -214,13 +608,7 @@ class CustomLoginView(APIView):
             token, _ = Token.objects.get_or_create(user=user)
 
             # Define o papel (Role) para o Frontend desenhar os botões certos
-            role = "user"
-            if user.is_superuser:
-                role = "admin"
-            elif user.groups.filter(name="Coordenadores").exists():
-                role = "coordinator"
-            elif user.groups.filter(name="Gerentes").exists():
-                role = "manager"
+            role = papel_frontend(papeis_do_usuario(user))
 
             # Recupera dados do Perfil Estendido (Cargo/Unidade)
             cargo_real = "Servidor"
@@ -407,173 +795,8 @@ class SetorListView(APIView):
 # ====================================================================
 # 4. GERADOR DE PDF BLINDADO (COM BRASÃO E ASSINATURAS)
 # ====================================================================
-
-
-def gerar_pdf_solicitacao(request, pk):
-    try:
-        solicitacao = Solicitacao.objects.get(pk=pk)
-
-        buffer = io.BytesIO()
-        c = canvas.Canvas(buffer, pagesize=A4)
-        width, height = A4
-
-        # --- CABEÇALHO ---
-        # (Código da imagem do brasão permanece o mesmo...)
-
-        c.setFont("Helvetica-Bold", 12)
-        c.drawCentredString(
-            width / 2, height - 2 * cm, "PREFEITURA DE SÃO JOSÉ DO RIO PRETO"
-        )
-        c.setFont("Helvetica", 10)
-        c.drawCentredString(
-            width / 2, height - 2.5 * cm, "Secretaria Municipal de Saúde - SMS"
-        )
-        c.line(2 * cm, height - 2.8 * cm, 19 * cm, height - 2.8 * cm)
-
-        c.setFont("Helvetica-Bold", 14)
-        c.drawCentredString(width / 2, height - 4 * cm, "REQUERIMENTO DE DISPENSA")
-
-        # Protocolo (Correção do Erro 4)
-        c.setFont("Helvetica", 10)
-        c.drawRightString(
-            19 * cm, height - 4.5 * cm, f"Protocolo SIGM: {solicitacao.id}"
-        )
-
-        # --- DADOS DO SERVIDOR ---
-        y = height - 6 * cm
-
-        # Recupera dados com segurança (Correção do Erro 1 e 2)
-        nome_user = (
-            solicitacao.usuario.first_name
-            if solicitacao.usuario.first_name
-            else solicitacao.usuario.username
-        )
-
-        try:
-            profile = solicitacao.usuario.profile
-            cargo_txt = profile.cargo if profile.cargo else "---"
-            unidade_txt = profile.unidade if profile.unidade else "---"
-        except:
-            cargo_txt = "---"
-            unidade_txt = "---"
-
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(2 * cm, y, "1. DADOS DO SERVIDOR")
-        y -= 0.8 * cm
-        c.setFont("Helvetica", 10)
-        c.drawString(2 * cm, y, f"Nome: {nome_user}")
-        c.drawString(12 * cm, y, f"Matrícula: {solicitacao.matricula}")
-        y -= 0.6 * cm
-        c.drawString(2 * cm, y, f"Cargo: {cargo_txt}")  # Agora mostra "---" se vazio
-        c.drawString(12 * cm, y, f"Unidade: {unidade_txt}")
-
-        # --- DADOS DO EVENTO ---
-        y -= 1.5 * cm
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(2 * cm, y, "2. DADOS DO AFASTAMENTO")
-        y -= 0.8 * cm
-
-        # Formata Datas (Correção do Erro 2)
-        try:
-            d1 = solicitacao.data_inicio.strftime("%d/%m/%Y")
-            d2 = solicitacao.data_fim.strftime("%d/%m/%Y")
-            periodo = f"{d1} a {d2}"
-        except:
-            periodo = "Datas não definidas"
-
-        # Local (Correção do Erro 3)
-        cidade = getattr(solicitacao, "cidade", "---")
-        estado = getattr(solicitacao, "estado", "SP")
-        local_txt = f"{cidade}/{estado}" if cidade else "---"
-
-        c.setFont("Helvetica", 10)
-        c.drawString(2 * cm, y, f"Evento: {solicitacao.nome_evento}")
-        y -= 0.6 * cm
-        c.drawString(2 * cm, y, f"Período: {periodo}")
-        y -= 0.6 * cm
-        c.drawString(2 * cm, y, f"Local: {local_txt}")
-        y -= 0.6 * cm
-        c.drawString(2 * cm, y, "Objetivo:")
-
-        # Quebra de linha para texto longo
-        text_obj = c.beginText(4 * cm, y)
-        text_obj.setFont("Helvetica", 10)
-        text_obj.textLines((solicitacao.objetivo or "---")[:300])
-        c.drawText(text_obj)
-
-        # --- 4 ÁREAS DE ASSINATURA (CORREÇÃO FINAL) ---
-        # Ajustamos a posição Y para garantir que caiba na página
-        y_sig = 9 * cm
-
-        # Função auxiliar para desenhar box
-        def draw_box(x, y, titulo, nome_assinatura, cargo_assinatura):
-            c.rect(x, y, 8 * cm, 3 * cm)
-            c.setFont("Helvetica-Bold", 7)
-            c.drawString(x + 0.2 * cm, y + 2.6 * cm, titulo)
-
-            c.setFont("Helvetica", 8)
-            if nome_assinatura:
-                c.drawCentredString(x + 4 * cm, y + 1.5 * cm, nome_assinatura)
-                c.setFont("Helvetica-Oblique", 7)
-                c.drawCentredString(x + 4 * cm, y + 1.1 * cm, "Assinado Digitalmente")
-                if cargo_assinatura:
-                    c.drawCentredString(x + 4 * cm, y + 0.7 * cm, cargo_assinatura)
-            else:
-                c.drawCentredString(
-                    x + 4 * cm, y + 1.5 * cm, "__________________________"
-                )
-                c.drawCentredString(x + 4 * cm, y + 1.0 * cm, "Assinatura Manual")
-
-        # 1. SERVIDOR
-        draw_box(2 * cm, y_sig, "SERVIDOR SOLICITANTE", nome_user, cargo_txt)
-
-        # 2. GERENTE (Usa o nome salvo ou deixa linha para assinar)
-        nome_gerente = (
-            solicitacao.assinatura_gerente if solicitacao.assinatura_gerente else ""
-        )
-        if not nome_gerente and solicitacao.status in [
-            "PENDENTE_COORD",
-            "PENDENTE_ADMIN",
-            "APROVADO",
-        ]:
-            nome_gerente = "(Aprovado no Sistema)"  # Fallback se não tiver nome gravado
-        draw_box(11 * cm, y_sig, "CHEFIA IMEDIATA", nome_gerente, "Gerente")
-
-        y_sig -= 3.5 * cm  # Desce para a próxima linha
-
-        # 3. COORDENADOR
-        nome_coord = (
-            solicitacao.assinatura_coordenador
-            if solicitacao.assinatura_coordenador
-            else ""
-        )
-        if not nome_coord and solicitacao.status in ["PENDENTE_ADMIN", "APROVADO"]:
-            nome_coord = "(Autorizado no Sistema)"
-        draw_box(2 * cm, y_sig, "COORDENAÇÃO / DIRETORIA", nome_coord, "Coordenador")
-
-        # 4. SECRETARIA (ADMIN) - O CAMPO QUE FALTAVA
-        nome_admin = (
-            solicitacao.assinatura_admin if solicitacao.assinatura_admin else ""
-        )
-        if not nome_admin and solicitacao.status == "APROVADO":
-            nome_admin = "Secretaria Municipal de Saúde"
-        draw_box(11 * cm, y_sig, "SECRETARIA DE SAÚDE", nome_admin, "Autorização Final")
-
-        # Rodapé
-        c.setFont("Helvetica", 8)
-        c.drawCentredString(
-            width / 2,
-            2 * cm,
-            "Documento gerado eletronicamente pelo Sistema Dispensa Digital.",
-        )
-
-        c.showPage()
-        c.save()
-        buffer.seek(0)
-        return FileResponse(buffer, as_attachment=True, filename=f"dispensa_{pk}.pdf")
-
-    except Exception as e:
-        return HttpResponse(f'{{"erro": "{str(e)}"}}', status=500)
+# GET /api/solicitacoes/<id>/pdf/ é a action `pdf` do SolicitacaoViewSet:
+# exige login e só entrega solicitações do queryset visível ao usuário.
    
    
 
@@ -604,19 +827,14 @@ class SolicitarResetSenhaView(APIView):
         else:
             masked = "email***@naocadastrado.com"
 
-        # 2. Gera um código simples de 6 dígitos (Simulação de Token)
-        # Em produção, usaríamos tokens JWT ou o default_token_generator complexo.
-        # Aqui vamos usar o cache ou salvar no user temporariamente. 
-        # Para simplificar seu teste AGORA, vamos usar o token nativo do Django.
-        token = default_token_generator.make_token(user)
-        
-        # --- SIMULAÇÃO DE ENVIO DE E-MAIL ---
-        print("\n" + "="*40)
-        print(f"📧 SIMULAÇÃO DE EMAIL PARA: {user.first_name}")
-        print(f"🔐 CÓDIGO DE RECUPERAÇÃO: {token}") 
-        print("Copie este código acima para testar no site.")
-        print("="*40 + "\n")
-        
+        # 2. Envio vai para a fila (worker: manage.py processar_tarefas): SMTP
+        # lento ou fora do ar não segura a resposta e é tentado de novo.
+        # Só o id do usuário é gravado na tarefa; o código (token nativo do
+        # Django) é gerado na execução e não fica no banco nem no log.
+        # Em dev (EmailBackend de console) o e-mail aparece no terminal do worker.
+        if email:
+            enfileirar("dispensas.enviar_codigo_reset", {'usuario_id': user.pk})
+
         # Retorna o e-mail mascarado para o front mostrar
         return Response({
             'mensagem': 'Código enviado!',
@@ -873,3 +1091,54 @@ class ConfirmarResetSenhaView(APIView):
     #         status=500,
     #         content_type="application/json",
     #     )
+
+
+# ====================================================================
+# 6. EVENTOS EM TEMPO REAL (SSE)
+# ====================================================================
+
+
+def _usuario_do_token(chave):
+    try:
+        usuario, _ = CachedTokenAuthentication().authenticate_credentials(chave)
+    except AuthenticationFailed:
+        return None
+    return usuario
+
+
+async def stream_eventos(request):
+    """
+    Server-Sent Events com as solicitações criadas/aprovadas/reprovadas na
+    jurisdição do usuário. GET /api/solicitacoes/eventos/?token=<token>
+    (o EventSource do navegador não manda cabeçalhos, então o token vai na URL).
+    Precisa ser servido pelo ASGI (core/asgi.py): no WSGI cada aba prenderia
+    um worker inteiro.
+    """
+    if request.method != "GET":
+        return JsonResponse({"erro": "Método não permitido."}, status=405)
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"erro": "Eventos disponíveis apenas no servidor ASGI."}, status=501
+        )
+
+    chave = request.GET.get("token")
+    if not chave:
+        cabecalho = request.headers.get("Authorization", "")
+        if cabecalho.startswith("Token "):
+            chave = cabecalho[len("Token ") :]
+    usuario = await sync_to_async(_usuario_do_token)(chave) if chave else None
+    if usuario is None:
+        return JsonResponse({"erro": "Token inválido ou ausente."}, status=401)
+
+    # Reconexão automática do EventSource: retoma do último evento recebido
+    try:
+        desde = int(request.headers.get("Last-Event-ID", ""))
+    except ValueError:
+        desde = None
+
+    resposta = StreamingHttpResponse(
+        FluxoEventos(usuario, desde), content_type="text/event-stream"
+    )
+    resposta["Cache-Control"] = "no-cache"
+    resposta["X-Accel-Buffering"] = "no"  # nginx: não segurar o stream em buffer
+    return resposta
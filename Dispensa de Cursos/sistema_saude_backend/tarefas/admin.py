@@ -0,0 +1,21 @@
+from django.contrib import admin
+
+from .models import Tarefa
+
+
+class TarefaAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "nome",
+        "status",
+        "prioridade",
+        "tentativas",
+        "executar_apos",
+        "criada_em",
+    )
+    list_filter = ("status", "nome")
+    search_fields = ("nome", "erro")
+    readonly_fields = ("criada_em", "concluida_em")
+
+
+admin.site.register(Tarefa, TarefaAdmin)
@@ -0,0 +1,195 @@
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Tarefa
+
+# ====================================================================
+# FILA DE TAREFAS LOCAL (SEM BROKER)
+# Registro das funções (@tarefa), enfileiramento e as operações do worker.
+# A reserva é um UPDATE condicional (WHERE id=? AND tentativas=?), como nas
+# transições de dispensas/transicoes.py: dois workers nunca pegam a mesma
+# tarefa, e `tentativas` serve de versão da reserva para concluir/falhar.
+# ====================================================================
+
+ESPERA_BASE = getattr(settings, "TAREFAS_ESPERA_BASE", 10)
+ESPERA_MAXIMA = getattr(settings, "TAREFAS_ESPERA_MAXIMA", 3600)
+MANTER_CONCLUIDAS = timedelta(days=getattr(settings, "TAREFAS_MANTER_DIAS", 7))
+MANTER_FALHAS = timedelta(days=getattr(settings, "TAREFAS_MANTER_FALHAS_DIAS", 30))
+
+
+class Definicao:
+    """Função registrada + padrões de enfileiramento e execução"""
+
+    def __init__(self, funcao, prioridade, max_tentativas, timeout):
+        self.funcao = funcao
+        self.prioridade = prioridade
+        self.max_tentativas = max_tentativas
+        self.timeout = timeout
+
+
+REGISTRO = {}
+
+
+def tarefa(nome, prioridade=0, max_tentativas=5, timeout=300):
+    """
+    Registra a função como tarefa. `timeout` (s) é o prazo da reserva: se o
+    worker não concluir até lá, outra execução pode pegar a tarefa.
+    Os argumentos da função precisam ser serializáveis em JSON.
+    """
+
+    def registrar(funcao):
+        REGISTRO[nome] = Definicao(funcao, prioridade, max_tentativas, timeout)
+        return funcao
+
+    return registrar
+
+
+def _nova(nome, argumentos, prioridade, atraso, agora):
+    if nome not in REGISTRO:
+        raise ValueError(f"Tarefa não registrada: {nome}")
+    definicao = REGISTRO[nome]
+    return Tarefa(
+        nome=nome,
+        argumentos=argumentos or {},
+        prioridade=definicao.prioridade if prioridade is None else prioridade,
+        max_tentativas=definicao.max_tentativas,
+        executar_apos=agora + timedelta(seconds=atraso),
+    )
+
+
+def enfileirar(nome, argumentos=None, prioridade=None, atraso=0):
+    """Grava a tarefa (na transação atual, se houver) e devolve a linha"""
+    tarefa_ = _nova(nome, argumentos, prioridade, atraso, timezone.now())
+    tarefa_.save()
+    return tarefa_
+
+
+def enfileirar_lote(nome, lista_argumentos, prioridade=None):
+    """Várias tarefas do mesmo tipo com um INSERT só"""
+    agora = timezone.now()
+    return Tarefa.objects.bulk_create(
+        [
+            _nova(nome, argumentos, prioridade, 0, agora)
+            for argumentos in lista_argumentos
+        ]
+    )
+
+
+def _disponiveis(agora):
+    return Q(status=Tarefa.PENDENTE, executar_apos__lte=agora) | Q(
+        status=Tarefa.EXECUTANDO, reservada_ate__lt=agora
+    )
+
+
+def reservar(limite):
+    """
+    Reserva até `limite` tarefas prontas para rodar (maior prioridade
+    primeiro) e devolve as reservadas. Pega também as de reserva vencida
+    (worker que morreu no meio), contando como nova tentativa.
+    """
+    agora = timezone.now()
+    candidatas = list(
+        Tarefa.objects.filter(_disponiveis(agora)).order_by(
+            "-prioridade", "executar_apos", "id"
+        )[: limite * 2]
+    )
+
+    reservadas = []
+    for candidata in candidatas:
+        if len(reservadas) == limite:
+            break
+        mesma_versao = Tarefa.objects.filter(
+            _disponiveis(agora), pk=candidata.pk, tentativas=candidata.tentativas
+        )
+
+        if candidata.tentativas >= candidata.max_tentativas:
+            # Reserva vencida na última tentativa: desiste em vez de repetir
+            mesma_versao.update(
+                status=Tarefa.FALHOU,
+                reservada_ate=None,
+                concluida_em=agora,
+                erro=candidata.erro or "Prazo de execução esgotado.",
+            )
+            continue
+
+        definicao = REGISTRO.get(candidata.nome)
+        timeout = definicao.timeout if definicao else 300
+        if mesma_versao.update(
+            status=Tarefa.EXECUTANDO,
+            tentativas=F("tentativas") + 1,
+            reservada_ate=agora + timedelta(seconds=timeout),
+        ):
+            candidata.status = Tarefa.EXECUTANDO
+            candidata.tentativas += 1
+            reservadas.append(candidata)
+    return reservadas
+
+
+def _da_reserva(tarefa_):
+    # Só a execução dona da reserva atual pode encerrar a tarefa
+    return Tarefa.objects.filter(
+        pk=tarefa_.pk, status=Tarefa.EXECUTANDO, tentativas=tarefa_.tentativas
+    )
+
+
+def concluir(tarefa_):
+    return bool(
+        _da_reserva(tarefa_).update(
+            status=Tarefa.CONCLUIDA,
+            reservada_ate=None,
+            concluida_em=timezone.now(),
+            erro="",
+        )
+    )
+
+
+def espera_ate_nova_tentativa(tentativas):
+    """Backoff exponencial com jitter: 10s, 20s, 40s... (até ESPERA_MAXIMA)"""
+    espera = min(ESPERA_BASE * 2 ** (tentativas - 1), ESPERA_MAXIMA)
+    return espera * random.uniform(0.5, 1.0)
+
+
+def falhar(tarefa_, erro):
+    """Reagenda com backoff, ou marca FALHOU se acabaram as tentativas"""
+    texto = "".join(traceback.format_exception(erro))[-4000:]
+    if tarefa_.tentativas >= tarefa_.max_tentativas:
+        campos = {"status": Tarefa.FALHOU, "concluida_em": timezone.now()}
+    else:
+        espera = espera_ate_nova_tentativa(tarefa_.tentativas)
+        campos = {
+            "status": Tarefa.PENDENTE,
+            "executar_apos": timezone.now() + timedelta(seconds=espera),
+        }
+    return bool(_da_reserva(tarefa_).update(reservada_ate=None, erro=texto, **campos))
+
+
+def limpar_concluidas():
+    """
+    Apaga o histórico: concluídas há mais de TAREFAS_MANTER_DIAS e falhas há
+    mais de TAREFAS_MANTER_FALHAS_DIAS (os argumentos não ficam para sempre).
+    Falhas de antes de concluida_em valer para elas contam pela criação.
+    """
+    agora = timezone.now()
+    limite_falhas = agora - MANTER_FALHAS
+    return Tarefa.objects.filter(
+        Q(status=Tarefa.CONCLUIDA, concluida_em__lt=agora - MANTER_CONCLUIDAS)
+        | Q(status=Tarefa.FALHOU, concluida_em__lt=limite_falhas)
+        | Q(status=Tarefa.FALHOU, concluida_em=None, criada_em__lt=limite_falhas)
+    ).delete()[0]
+
+
+def executar(nome, argumentos):
+    """
+    Roda a função registrada. Chamada na thread/processo do pool do worker;
+    fecha as conexões de banco que a tarefa abriu nessa thread.
+    """
+    try:
+        REGISTRO[nome].funcao(**argumentos)
+    finally:
+        connections.close_all()
@@ -0,0 +1,108 @@
+import multiprocessing
+import signal
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+import django
+from django.core.management.base import BaseCommand
+
+from tarefas import fila
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker da fila de tarefas: reserva tarefas prontas (maior prioridade "
+        "primeiro), executa num pool de threads ou processos e reagenda as que "
+        "falharem com backoff exponencial."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads", type=int, default=2, help="Tamanho do pool de threads"
+        )
+        parser.add_argument(
+            "--processos",
+            type=int,
+            default=0,
+            help="Usa um pool de N processos em vez de threads (tarefas de CPU)",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=1.0,
+            help="Segundos entre consultas quando a fila está vazia",
+        )
+        parser.add_argument(
+            "--uma-vez",
+            action="store_true",
+            help="Sai quando não houver mais tarefas prontas (cron, testes)",
+        )
+
+    def handle(self, *args, **opcoes):
+        if opcoes["processos"]:
+            vagas = opcoes["processos"]
+            executor = ProcessPoolExecutor(
+                max_workers=vagas,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+        else:
+            vagas = opcoes["threads"]
+            executor = ThreadPoolExecutor(
+                max_workers=vagas, thread_name_prefix="tarefa"
+            )
+
+        self.parar = False
+        if not opcoes["uma_vez"]:
+            # SIGTERM/Ctrl+C: termina o que está rodando e sai
+            signal.signal(signal.SIGTERM, self._pedir_parada)
+            signal.signal(signal.SIGINT, self._pedir_parada)
+
+        em_execucao = {}
+        proxima_limpeza = 0
+        with executor:
+            while not (self.parar and not em_execucao):
+                if time.monotonic() >= proxima_limpeza:
+                    fila.limpar_concluidas()
+                    proxima_limpeza = time.monotonic() + 3600
+
+                livres = vagas - len(em_execucao)
+                if livres and not self.parar:
+                    for tarefa in fila.reservar(livres):
+                        futuro = executor.submit(
+                            fila.executar, tarefa.nome, tarefa.argumentos
+                        )
+                        em_execucao[futuro] = tarefa
+
+                if not em_execucao:
+                    if opcoes["uma_vez"]:
+                        break
+                    time.sleep(opcoes["intervalo"])
+                    continue
+
+                prontos, _ = wait(
+                    em_execucao,
+                    timeout=opcoes["intervalo"],
+                    return_when=FIRST_COMPLETED,
+                )
+                for futuro in prontos:
+                    self._encerrar(em_execucao.pop(futuro), futuro)
+
+    def _encerrar(self, tarefa, futuro):
+        try:
+            futuro.result()
+        except Exception as erro:
+            fila.falhar(tarefa, erro)
+            self.stderr.write(
+                f"{tarefa} falhou (tentativa {tarefa.tentativas}): {erro!r}"
+            )
+        else:
+            fila.concluir(tarefa)
+
+    def _pedir_parada(self, numero, quadro):
+        self.parar = True
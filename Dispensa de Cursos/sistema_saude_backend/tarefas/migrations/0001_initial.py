@@ -0,0 +1,62 @@
+# Generated by Django 4.2.27 on 2026-10-18 09:15
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="Tarefa",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("nome", models.CharField(max_length=100)),
+                ("argumentos", models.JSONField(blank=True, default=dict)),
+                ("prioridade", models.SmallIntegerField(default=0)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDENTE", "Pendente"),
+                            ("EXECUTANDO", "Executando"),
+                            ("CONCLUIDA", "Concluída"),
+                            ("FALHOU", "Falhou"),
+                        ],
+                        default="PENDENTE",
+                        max_length=20,
+                    ),
+                ),
+                ("tentativas", models.PositiveSmallIntegerField(default=0)),
+                ("max_tentativas", models.PositiveSmallIntegerField(default=5)),
+                (
+                    "executar_apos",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("reservada_ate", models.DateTimeField(blank=True, null=True)),
+                ("erro", models.TextField(blank=True)),
+                ("criada_em", models.DateTimeField(auto_now_add=True)),
+                ("concluida_em", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "-prioridade", "executar_apos"],
+                        name="tarefa_fila_idx",
+                    )
+                ],
+            },
+        ),
+    ]
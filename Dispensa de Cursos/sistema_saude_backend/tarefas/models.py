@@ -0,0 +1,50 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Tarefa(models.Model):
+    """
+    Trabalho em segundo plano na fila local (SQLite). Gravada na mesma
+    transação de quem enfileirou: só existe para o worker depois do commit.
+    Executada por `python manage.py processar_tarefas`.
+    """
+
+    PENDENTE = "PENDENTE"
+    EXECUTANDO = "EXECUTANDO"
+    CONCLUIDA = "CONCLUIDA"
+    FALHOU = "FALHOU"
+    STATUS_CHOICES = [
+        (PENDENTE, "Pendente"),
+        (EXECUTANDO, "Executando"),
+        (CONCLUIDA, "Concluída"),
+        (FALHOU, "Falhou"),
+    ]
+
+    nome = models.CharField(max_length=100)
+    argumentos = models.JSONField(default=dict, blank=True)
+    # Maior primeiro
+    prioridade = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDENTE)
+
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    max_tentativas = models.PositiveSmallIntegerField(default=5)
+    # Não roda antes disso (atraso pedido ou espera entre tentativas)
+    executar_apos = models.DateTimeField(default=timezone.now)
+    # Prazo da reserva: se o worker morrer, a tarefa volta para a fila depois dele
+    reservada_ate = models.DateTimeField(null=True, blank=True)
+    erro = models.TextField(blank=True)
+
+    criada_em = models.DateTimeField(auto_now_add=True)
+    concluida_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Busca do worker: status + ordem de execução
+            models.Index(
+                fields=["status", "-prioridade", "executar_apos"],
+                name="tarefa_fila_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.nome} #{self.pk} ({self.status})"
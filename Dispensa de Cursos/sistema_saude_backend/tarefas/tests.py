@@ -0,0 +1,128 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from . import fila
+from .models import Tarefa
+
+EXECUTADAS = []
+
+
+@fila.tarefa("teste.anotar", max_tentativas=2, timeout=60)
+def anotar(valor):
+    if valor == "erro":
+        raise RuntimeError("falha simulada")
+    EXECUTADAS.append(valor)
+
+
+@fila.tarefa("teste.urgente", prioridade=10)
+def urgente(valor):
+    EXECUTADAS.append(valor)
+
+
+class FilaTarefasTest(TestCase):
+    def setUp(self):
+        EXECUTADAS.clear()
+
+    def test_enfileirar_desconhecida(self):
+        with self.assertRaises(ValueError):
+            fila.enfileirar("teste.nao_existe")
+
+    def test_reserva_por_prioridade(self):
+        fila.enfileirar_lote("teste.anotar", [{"valor": "a"}, {"valor": "b"}])
+        fila.enfileirar("teste.urgente", {"valor": "c"})
+        fila.enfileirar("teste.anotar", {"valor": "depois"}, atraso=60)
+
+        reservadas = fila.reservar(10)
+        self.assertEqual([t.argumentos["valor"] for t in reservadas], ["c", "a", "b"])
+        self.assertTrue(all(t.tentativas == 1 for t in reservadas))
+        # Já reservadas (e a atrasada ainda não venceu): nada mais a pegar
+        self.assertEqual(fila.reservar(10), [])
+
+    def test_falha_com_backoff_e_desistencia(self):
+        fila.enfileirar("teste.anotar", {"valor": "erro"})
+
+        (tarefa,) = fila.reservar(1)
+        self.assertTrue(fila.falhar(tarefa, RuntimeError("falha simulada")))
+        tarefa.refresh_from_db()
+        self.assertEqual(tarefa.status, Tarefa.PENDENTE)
+        self.assertGreater(tarefa.executar_apos, timezone.now())
+        self.assertIn("falha simulada", tarefa.erro)
+        self.assertEqual(fila.reservar(1), [])
+
+        # Espera vencida: segunda (e última) tentativa
+        Tarefa.objects.update(executar_apos=timezone.now())
+        (tarefa,) = fila.reservar(1)
+        self.assertEqual(tarefa.tentativas, 2)
+        fila.falhar(tarefa, RuntimeError("falha simulada"))
+        tarefa.refresh_from_db()
+        self.assertEqual(tarefa.status, Tarefa.FALHOU)
+
+    def test_reserva_vencida_volta_para_a_fila(self):
+        fila.enfileirar("teste.anotar", {"valor": "a"})
+        (primeira,) = fila.reservar(1)
+
+        # Worker morreu: o prazo da reserva passa e outro pega a tarefa
+        Tarefa.objects.update(reservada_ate=timezone.now() - timedelta(seconds=1))
+        (segunda,) = fila.reservar(1)
+        self.assertEqual(segunda.tentativas, 2)
+
+        # O dono antigo não encerra mais a tarefa
+        self.assertFalse(fila.concluir(primeira))
+        self.assertTrue(fila.concluir(segunda))
+
+        # Reserva vencida na última tentativa: marcada como FALHOU
+        fila.enfileirar("teste.anotar", {"valor": "b"})
+        Tarefa.objects.filter(status=Tarefa.PENDENTE).update(
+            status=Tarefa.EXECUTANDO,
+            tentativas=2,
+            reservada_ate=timezone.now() - timedelta(seconds=1),
+        )
+        self.assertEqual(fila.reservar(1), [])
+        self.assertEqual(Tarefa.objects.filter(status=Tarefa.FALHOU).count(), 1)
+
+    def test_limpar_concluidas(self):
+        fila.enfileirar_lote("teste.anotar", [{"valor": "a"}, {"valor": "b"}])
+        for tarefa in fila.reservar(2):
+            fila.concluir(tarefa)
+        Tarefa.objects.filter(argumentos={"valor": "a"}).update(
+            concluida_em=timezone.now() - fila.MANTER_CONCLUIDAS - timedelta(days=1)
+        )
+        self.assertEqual(fila.limpar_concluidas(), 1)
+        self.assertEqual(Tarefa.objects.count(), 1)
+
+    def test_limpar_falhas(self):
+        fila.enfileirar_lote("teste.anotar", [{"valor": "a"}, {"valor": "b"}])
+        Tarefa.objects.update(max_tentativas=1)
+        for tarefa in fila.reservar(2):
+            fila.falhar(tarefa, RuntimeError("falha simulada"))
+        self.assertEqual(Tarefa.objects.filter(status=Tarefa.FALHOU).count(), 2)
+        # Falhas também saem do histórico (com os argumentos), só que mais tarde
+        Tarefa.objects.filter(argumentos={"valor": "a"}).update(
+            concluida_em=timezone.now() - fila.MANTER_FALHAS - timedelta(days=1)
+        )
+        Tarefa.objects.filter(argumentos={"valor": "b"}).update(
+            concluida_em=timezone.now() - fila.MANTER_CONCLUIDAS - timedelta(days=1)
+        )
+        self.assertEqual(fila.limpar_concluidas(), 1)
+        self.assertEqual(Tarefa.objects.get().argumentos, {"valor": "b"})
+
+    def test_worker(self):
+        fila.enfileirar("teste.anotar", {"valor": "a"})
+        fila.enfileirar("teste.anotar", {"valor": "erro"})
+        fila.enfileirar("teste.urgente", {"valor": "b"})
+
+        # As funções de teste não usam o banco (a thread do pool não enxerga
+        # a transação do teste); reserva e encerramento rodam nesta thread
+        call_command(
+            "processar_tarefas", "--uma-vez", "--threads", "1", stderr=StringIO()
+        )
+
+        self.assertEqual(sorted(EXECUTADAS), ["a", "b"])
+        self.assertEqual(
+            dict(Tarefa.objects.values_list("argumentos__valor", "status")),
+            {"a": Tarefa.CONCLUIDA, "b": Tarefa.CONCLUIDA, "erro": Tarefa.PENDENTE},
+        )